@@ -3,6 +3,7 @@ from step0_scene_extra import run_step0
 from step1_frame_check import run_step1
 from step2_roles import run_step2
 from step3_prompt_check import run_step3
+from utils.trace_utils import show_trace_panel
 
 def main():
     # Page configuration
@@ -42,6 +43,9 @@ def main():
     elif step == "Step3 - Prompt Verification":
         run_step3()
 
+    # Timings / counters of the last Step 0 or Step 2 run in this session
+    show_trace_panel(st.session_state.get("last_trace"))
+
     # Footer styling
     st.markdown(
         """
@@ -0,0 +1,238 @@
+"""
+离线基准测试：合成视频 + 合成人脸特征，不需要模型和网络。
+
+    python -m benchmarks.run                      # 运行并与 baseline 比较，有退化时返回码为 1
+    python -m benchmarks.run --update             # 运行并写入 baseline
+    python -m benchmarks.run --scales 1000,10000,100000 --skip-video
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+from utils.trace_utils import rss_bytes
+from benchmarks.synthetic import (
+    make_video, random_scene_lengths, cut_accuracy, clustered_embeddings, cluster_purity, FPS
+)
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+# (名称, 镜头数, GOP)
+VIDEO_CASES = [("gop12", 20, 12), ("gop250", 20, 250)]
+DEFAULT_SCALES = [1000, 10000]
+FACES_PER_IDENTITY = 200
+SIM_THRESHOLD = 0.55
+TOLERANCE = 0.2          # 吞吐下降 / 内存上升超过 20% 视为退化
+ACCURACY_DROP = 0.02     # 准确率类指标下降超过该绝对值视为退化
+ACCURACY_KEYS = ("precision", "recall", "purity")
+
+
+# ------------------ 计时 + 峰值内存 ------------------
+class Measure:
+    """with Measure() as m: ... 之后 m.seconds / m.peak_rss_mb 为该段的耗时和采样到的峰值 RSS"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+        self.peak_rss_mb = self.peak / 2 ** 20
+
+
+def _record(m, amount, unit, **extra):
+    return {
+        "seconds": round(m.seconds, 4),
+        "throughput": round(amount / max(m.seconds, 1e-9), 3),
+        "unit": unit,
+        "peak_rss_mb": round(m.peak_rss_mb, 1),
+        **{k: round(float(v), 4) for k, v in extra.items()},
+    }
+
+
+# ------------------ 各阶段 ------------------
+def bench_video(work_dir):
+    from step0_scene_extra import detect_scenes_advanced, extract_frames, cut_video_segments
+    from utils.stream_utils import iter_scene_batches, iter_extract
+    from utils.sprite_utils import contact_sheet
+    from utils.hash_utils import dedup_paths
+
+    results = {}
+    for name, num_scenes, gop in VIDEO_CASES:
+        path = os.path.join(work_dir, f"{name}.mp4")
+        lengths = random_scene_lengths(num_scenes, seed=num_scenes + gop)
+        truth = make_video(path, lengths, gop=gop, seed=gop)
+        total_frames = sum(lengths)
+
+        # 全片 ContentDetector / 压缩域预筛 + 窗口检测 / 只用包统计的 draft
+        for key, kwargs in (
+            ("detect_scenes", {"mode": "basic"}),
+            ("detect_scenes_prefilter", {"mode": "basic", "prefilter": True}),
+            ("detect_scenes_draft", {"mode": "draft"}),
+        ):
+            if key != "detect_scenes" and not shutil.which("ffprobe"):
+                continue
+            with Measure() as m:
+                detected_scenes = detect_scenes_advanced(path, threshold=27.0, **kwargs)
+            detected = [int(start.get_frames()) for start, _ in detected_scenes[1:]]
+            precision, recall = cut_accuracy(detected, truth)
+            results[f"{key}/{name}"] = _record(
+                m, total_frames, "frames/s", precision=precision, recall=recall
+            )
+            if key == "detect_scenes":
+                scenes = detected_scenes
+
+        frames_dir = os.path.join(work_dir, f"{name}_frames")
+        with Measure() as m:
+            scene_frames = extract_frames(path, scenes, frames_dir)
+        written = sum(len(v) for v in scene_frames.values())
+        results[f"extract_frames/{name}"] = _record(m, written, "frames/s")
+
+        # 场景内近重复帧合并（Step 0 默认开启），走 HammingIndex 查询
+        frame_paths = [p for paths in scene_frames.values() for p in paths]
+        frame_keys = [sid for sid, paths in scene_frames.items() for _ in paths]
+        with Measure() as m:
+            representatives, _ = dedup_paths(frame_paths, group_keys=frame_keys)
+        results[f"dedup_frames/{name}"] = _record(m, written, "frames/s", kept=len(representatives))
+
+        # 图库联系表：首次构建（缩小解码 + 拼图），重跑时命中缓存只读坐标表
+        sheet_path = os.path.join(frames_dir, "sheets", "sheet_0.jpg")
+        with Measure() as m:
+            contact_sheet(list(scene_frames.values()), sheet_path)
+        results[f"contact_sheet/{name}"] = _record(m, written, "frames/s")
+
+        # 流式模式：检测 + 抽帧按窗口推进，峰值内存应与视频长度无关
+        with Measure() as m:
+            batches = iter_scene_batches(path, threshold=27.0, window_sec=2)
+            written = sum(len(rows) for _, rows in iter_extract(path, batches, f"{frames_dir}_stream"))
+        results[f"stream_extract/{name}"] = _record(m, total_frames, "frames/s")
+
+        if shutil.which("ffmpeg"):
+            with Measure() as m:
+                cut_video_segments(path, scenes, os.path.join(work_dir, f"{name}_cuts"))
+            results[f"cut_video/{name}"] = _record(m, total_frames / FPS, "video s/s")
+        else:
+            print("ffmpeg not found, skipping cut_video_segments")
+    return results
+
+
+def bench_grouping(scales):
+    """Step 2 的两阶段聚类（first_pass + second_pass），特征直接写入 EmbeddingMatrix，不跑模型"""
+    from step2_roles import first_pass_clustering, second_pass_assign
+    from utils.embedding_utils import EmbeddingMatrix
+    from utils.exemplar_utils import order_role_images
+
+    results = {}
+    for n in scales:
+        feats, labels, qualities = clustered_embeddings(n, max(10, n // FACES_PER_IDENTITY), seed=n)
+        names = [f"img_{i:06d}.jpg" for i in range(n)]
+        embeddings = EmbeddingMatrix(capacity=n)
+        for name, f, q in zip(names, feats, qualities):
+            embeddings.add_image(name, f[None], [q])
+
+        with Measure() as m:
+            centroids = first_pass_clustering(names, "", SIM_THRESHOLD, embeddings, state={})
+            groups = second_pass_assign(names, "", centroids, embeddings, SIM_THRESHOLD)
+        purity = cluster_purity(groups, dict(zip(names, labels)))
+        results[f"group_roles/{n}"] = _record(m, n, "faces/s", purity=purity, roles=len(centroids))
+
+        with Measure() as m:
+            order_role_images(groups, embeddings)
+        results[f"exemplars/{n}"] = _record(m, n, "faces/s")
+    return results
+
+
+# ------------------ 回归检查 ------------------
+def compare(results, baseline, tolerance=TOLERANCE):
+    """返回退化描述列表；baseline 中没有的条目不比较"""
+    problems = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if cur["throughput"] < base["throughput"] * (1 - tolerance):
+            problems.append(f"{key}: throughput {cur['throughput']} < baseline {base['throughput']} {cur['unit']}")
+        if cur["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            problems.append(f"{key}: peak RSS {cur['peak_rss_mb']} MB > baseline {base['peak_rss_mb']} MB")
+        for k in ACCURACY_KEYS:
+            if k in base and cur.get(k, 0.0) < base[k] - ACCURACY_DROP:
+                problems.append(f"{key}: {k} {cur.get(k)} < baseline {base[k]}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks (synthetic data, no model)")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                        help="comma-separated embedding counts, e.g. 1000,10000,100000")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--skip-video", action="store_true")
+    parser.add_argument("--skip-grouping", action="store_true")
+    parser.add_argument("--output", help="also write this run's results to a JSON file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    work_dir = tempfile.mkdtemp(prefix="rg_bench_")
+    try:
+        if not args.skip_video:
+            results.update(bench_video(work_dir))
+        if not args.skip_grouping:
+            results.update(bench_grouping([int(s) for s in args.scales.split(",") if s]))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for key, r in results.items():
+        extra = " ".join(f"{k}={r[k]}" for k in (*ACCURACY_KEYS, "roles", "kept") if k in r)
+        print(f"{key:<28} {r['throughput']:>12} {r['unit']:<10} {r['peak_rss_mb']:>8} MB  {extra}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+
+    if args.update:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=1)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --update first")
+        return 1
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    for key in results:
+        if key not in baseline:
+            print(f"no baseline for {key}, not compared")
+    problems = compare(results, baseline, args.tolerance)
+    for p in problems:
+        print(f"REGRESSION {p}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import cv2
+
+FPS = 25
+FRAME_SIZE = (640, 360)
+EMB_DIM = 512
+
+
+# ------------------ 合成视频 ------------------
+def _scene_style(rng):
+    """每个镜头一种底色 + 若干静止色块，镜头之间 HSV 差异足够大"""
+    hue = int(rng.integers(0, 180))
+    base = np.zeros((FRAME_SIZE[1], FRAME_SIZE[0], 3), np.uint8)
+    base[:] = (hue, int(rng.integers(80, 255)), int(rng.integers(80, 255)))
+    base = cv2.cvtColor(base, cv2.COLOR_HSV2BGR)
+    for _ in range(6):
+        x, y = int(rng.integers(0, FRAME_SIZE[0] - 80)), int(rng.integers(0, FRAME_SIZE[1] - 80))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(base, (x, y), (x + int(rng.integers(30, 160)), y + int(rng.integers(30, 120))), color, -1)
+    return base
+
+
+def make_video(path, scene_lengths, gop=12, seed=0, fourcc="mp4v"):
+    """
+    写一个由若干硬切镜头组成的视频，返回真实切点（每个镜头的起始帧，不含 0）。
+    镜头内只有一个缓慢移动的小方块，不应触发切点。
+    gop 通过 OPENCV_FFMPEG_WRITER_OPTIONS 传给编码器（OpenCV FFmpeg 后端支持时生效）。
+    """
+    rng = np.random.default_rng(seed)
+    os.environ["OPENCV_FFMPEG_WRITER_OPTIONS"] = f"g;{gop}"
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), FPS, FRAME_SIZE)
+    if not writer.isOpened():
+        raise RuntimeError(f"cannot open VideoWriter for {path}")
+
+    cuts, frame_idx = [], 0
+    try:
+        for length in scene_lengths:
+            if frame_idx:
+                cuts.append(frame_idx)
+            base = _scene_style(rng)
+            for t in range(length):
+                frame = base.copy()
+                x = 20 + (t * 3) % (FRAME_SIZE[0] - 60)
+                cv2.rectangle(frame, (x, 20), (x + 24, 44), (255, 255, 255), -1)
+                writer.write(frame)
+                frame_idx += 1
+    finally:
+        writer.release()
+        os.environ.pop("OPENCV_FFMPEG_WRITER_OPTIONS", None)
+    return cuts
+
+
+def random_scene_lengths(num_scenes, min_len=FPS, max_len=FPS * 6, seed=0):
+    rng = np.random.default_rng(seed)
+    return [int(x) for x in rng.integers(min_len, max_len, num_scenes)]
+
+
+def cut_accuracy(detected, truth, tolerance=2):
+    """切点 precision / recall：检测切点与真实切点相差不超过 tolerance 帧视为命中（一对一匹配）"""
+    truth = sorted(truth)
+    used = set()
+    hits = 0
+    for d in sorted(detected):
+        for i, t in enumerate(truth):
+            if i not in used and abs(d - t) <= tolerance:
+                used.add(i)
+                hits += 1
+                break
+    precision = hits / len(detected) if detected else 1.0
+    recall = hits / len(truth) if truth else 1.0
+    return precision, recall
+
+
+# ------------------ 合成人脸特征 ------------------
+def clustered_embeddings(num_faces, num_identities, noise=0.8, dim=EMB_DIM, seed=0):
+    """
+    在单位球面上随机取 num_identities 个身份中心，每张脸 = 中心 + 各向同性噪声后归一化。
+    noise=0.8 时同身份余弦相似度约 0.78，不同身份约 0。
+    返回 (特征 (N, dim) float32, 身份标签 (N,), 人脸质量 (N,))。
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_identities, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    labels = rng.integers(0, num_identities, num_faces)
+    noise_vec = rng.standard_normal((num_faces, dim)).astype(np.float32) / np.sqrt(dim)
+    feats = centers[labels] + noise * noise_vec
+    feats /= np.linalg.norm(feats, axis=1, keepdims=True)
+    qualities = rng.uniform(0.4, 1.0, num_faces).astype(np.float32)
+    return feats, labels, qualities
+
+
+def cluster_purity(groups, labels_by_name):
+    """每个簇中占多数的身份所占比例，按图片数加权；"other" 计为未命中"""
+    total = sum(len(v) for v in groups.values())
+    if not total:
+        return 0.0
+    hit = 0
+    for role, names in groups.items():
+        if role == "other" or not names:
+            continue
+        _, counts = np.unique([labels_by_name[n] for n in names], return_counts=True)
+        hit += counts.max()
+    return hit / total
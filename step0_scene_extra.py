@@ -1,34 +1,77 @@
 import os
-import random
+import math
+import json
+import uuid
+import pickle
+import hashlib
 import shutil
 import cv2
 import streamlit as st
 import numpy as np
 from collections import defaultdict
-from scenedetect import VideoManager, SceneManager
+from scenedetect import VideoManager, SceneManager, FrameTimecode
 from scenedetect.detectors import ContentDetector
 from sklearn.cluster import KMeans
+from utils.materialize_utils import materialize
+from utils.hash_utils import dedup_paths
+from utils.proxy_utils import generate_proxies, PROXY_DIR
+from utils.trace_utils import span, count, trace_run
+from utils.pipeline_utils import FacePipeline
+from utils.cache_utils import ArtifactCache, video_fingerprint, cache_root, DEFAULT_BUDGET_GB
+from utils.manifest_utils import RunManifest
+from utils.packet_utils import draft_scenes, detect_scenes_windowed
+from utils.media_utils import media_url
+from utils.sprite_utils import contact_sheet, image_data_uri, sprite_css, sprite_tile_fluid
+from utils.stream_utils import (
+    sample_frame_ids, iter_scene_batches, iter_extract, iter_cut_videos, STREAM_WINDOW_SEC
+)
+from step2_roles import (
+    first_pass_clustering, second_pass_assign, group_from_embeddings, DET_THRESHOLD as ROLE_DET_THRESHOLD
+)
+
+ROLE_SIM_THRESHOLD = 0.55   # 与 Step 2 默认阈值一致，Step 2 增量模式才能复用结果
+FRAMES_MANIFEST = "frames.json"
+FACES_FILE = "embeddings.pkl"
+
+# 抽帧缓存超出磁盘预算时会被淘汰，因此不提供 symlink/manifest
+SAVE_MODES = ["copy", "hardlink", "reflink"]
 
 # ======================================================
 # 高级镜头检测函数（带聚类合并）
 # ======================================================
-def detect_scenes_advanced(video_path, threshold=27.0, mode="smart"):
+def detect_scenes_advanced(video_path, threshold=27.0, mode="smart", prefilter=False):
     """
     mode:
+        - "draft" : 只用 ffprobe 包统计（关键帧位置 + 帧大小跳变），不解码像素，整集几秒出粗分镜
         - "basic" : 仅用 scenedetect (最快)
         - "smart" : 聚类相似镜头合并（推荐）
         - "ai"    : 保留扩展接口（未来可用 CLIP 特征）
+    prefilter=True 时先用包统计找候选切点，ContentDetector 只解码候选附近的窗口。
+    ffprobe 不可用时 draft / prefilter 退回全片 ContentDetector。
     """
-    video_manager = VideoManager([video_path])
-    scene_manager = SceneManager()
-    scene_manager.add_detector(ContentDetector(threshold=threshold))
-    video_manager.set_downscale_factor()
-    video_manager.start()
-    scene_manager.detect_scenes(frame_source=video_manager)
-    scenes = scene_manager.get_scene_list()
-    video_manager.release()
-
-    if mode == "basic" or len(scenes) <= 2:
+    scenes = None
+    if mode == "draft":
+        with span("draft_scenes"):
+            scenes = draft_scenes(video_path)
+        if scenes is not None:
+            return scenes
+    elif prefilter:
+        with span("prefilter_detector"):
+            scenes = detect_scenes_windowed(video_path, threshold)
+
+    if scenes is None:
+        video_manager = VideoManager([video_path])
+        scene_manager = SceneManager()
+        scene_manager.add_detector(ContentDetector(threshold=threshold))
+        video_manager.set_downscale_factor()
+        video_manager.start()
+        with span("content_detector"):
+            frames = scene_manager.detect_scenes(frame_source=video_manager)
+        count("frames_decoded", frames)
+        scenes = scene_manager.get_scene_list()
+        video_manager.release()
+
+    if mode in ("basic", "draft") or len(scenes) <= 2:
         return scenes
 
     # Step 2: 提取每个镜头中间帧特征
@@ -38,6 +81,8 @@ def detect_scenes_advanced(video_path, threshold=27.0, mode="smart"):
         mid = int((start.get_frames() + end.get_frames()) / 2)
         cap.set(cv2.CAP_PROP_POS_FRAMES, mid)
         ret, frame = cap.read()
+        count("seeks")
+        count("frames_decoded")
         if not ret:
             features.append(np.zeros(64))
             continue
@@ -65,57 +110,273 @@ def detect_scenes_advanced(video_path, threshold=27.0, mode="smart"):
 # ======================================================
 # 抽帧
 # ======================================================
-def extract_frames(video_path, scene_list, temp_dir):
+def extract_frames(video_path, scene_list, temp_dir, on_frame=None, manifest=None):
+    """
+    on_frame(图片路径, BGR 帧) 在每帧写盘后调用，用于把帧交给人脸分析流水线；
+    manifest 不为空时把每帧的镜头号、帧号、时间戳记入运行清单。
+    """
     if not os.path.exists(temp_dir):
         os.makedirs(temp_dir)
     cap = cv2.VideoCapture(video_path)
     scene_frames = {}
+    rows = []
     for i, (start, end) in enumerate(scene_list, 1):
-        start_frame = int(start.get_frames())
-        end_frame = int(end.get_frames())
-        if end_frame <= start_frame:
+        frame_ids = sample_frame_ids(int(start.get_frames()), int(end.get_frames()))
+        if not frame_ids:
             continue
-        safe_end_frame = max(start_frame, end_frame - 2)
-        middle_frames = []
-        if safe_end_frame - start_frame > 2:
-            middle_frames = random.sample(
-                range(start_frame + 1, safe_end_frame - 1),
-                k=min(2, safe_end_frame - start_frame - 1)
-            )
-        frame_ids = sorted(set([start_frame, safe_end_frame] + middle_frames))
         images = []
         for f in frame_ids:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, f)
-            ret, frame = cap.read()
+            with span("seek_decode"):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, f)
+                ret, frame = cap.read()
+            count("seeks")
+            count("frames_decoded")
             if ret:
                 img_path = os.path.join(temp_dir, f"scene_{i}_frame_{f}.jpg")
-                cv2.imwrite(img_path, frame)
+                with span("jpeg_write"):
+                    cv2.imwrite(img_path, frame)
+                count("bytes_written", os.path.getsize(img_path))
                 images.append(img_path)
+                rows.append((img_path, video_path, i, f, f / start.framerate))
+                if on_frame:
+                    on_frame(img_path, frame)
         scene_frames[i] = images
     cap.release()
+    if manifest is not None:
+        manifest.add_frames(rows)
     return scene_frames
 
 # ======================================================
 # 切割视频
 # ======================================================
-def cut_video_segments(video_path, scene_list, cuts_dir):
-    os.makedirs(cuts_dir, exist_ok=True)
-    for i, (start, end) in enumerate(scene_list, 1):
-        start_time = start.get_seconds()
-        end_time = end.get_seconds()
-        output_path = os.path.join(cuts_dir, f"cut({i}).mp4")
-        cmd = (
-            f'ffmpeg -y -i "{video_path}" '
-            f'-ss {start_time:.3f} -to {end_time:.3f} '
-            f'-c:v libx264 -crf 23 -preset veryfast -c:a copy "{output_path}"'
+def cut_video_segments(video_path, scene_list, cuts_dir, manifest=None):
+    rows = [(i, start.get_seconds(), end.get_seconds()) for i, (start, end) in enumerate(scene_list, 1)]
+    cut_paths = {i: p for i, p in iter_cut_videos(video_path, rows, cuts_dir) if p}
+    if manifest is not None:
+        manifest.set_cut_paths(video_path, cut_paths)
+    return cut_paths
+
+# ======================================================
+# 帧缓存：按视频指纹 + 检测参数复用抽帧结果
+# ======================================================
+def save_frames_manifest(frames_dir, params, scenes, scene_frames, frame_rows=()):
+    """frame_rows: [(路径, 镜头号, 帧号, 时间戳), ...]，缓存命中时据此重新登记运行清单"""
+    manifest = {
+        **params,
+        "fps": scenes[0][0].framerate if scenes else None,
+        "scenes": [[int(s.get_frames()), int(e.get_frames())] for s, e in scenes],
+        "scene_frames": {str(k): [os.path.basename(p) for p in v] for k, v in scene_frames.items()},
+        "frames": [[os.path.basename(p), *rest] for p, *rest in frame_rows],
+    }
+    with open(os.path.join(frames_dir, FRAMES_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+
+def load_frames_manifest(frames_dir, params):
+    """参数一致且帧文件都在时返回 (scenes, scene_frames, frame_rows)，否则返回 None"""
+    path = os.path.join(frames_dir, FRAMES_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"读取帧缓存清单失败: {e}")
+        return None
+    if any(manifest.get(k) != v for k, v in params.items()):
+        return None
+    fps = manifest["fps"]
+    scenes = [(FrameTimecode(s, fps=fps), FrameTimecode(e, fps=fps)) for s, e in manifest["scenes"]]
+    scene_frames = {
+        int(k): [os.path.join(frames_dir, name) for name in v] for k, v in manifest["scene_frames"].items()
+    }
+    if not all(os.path.exists(p) for imgs in scene_frames.values() for p in imgs):
+        return None
+    frame_rows = [(os.path.join(frames_dir, name), *rest) for name, *rest in manifest.get("frames", [])]
+    return scenes, scene_frames, frame_rows
+
+
+def show_cache_panel(cache):
+    with st.expander("Artifact cache", expanded=False):
+        report = cache.report()
+        st.caption(
+            f"{report['entries']} entries · {report['total_bytes'] / 2 ** 30:.2f} / "
+            f"{report['budget_bytes'] / 2 ** 30:.0f} GB"
         )
-        os.system(cmd)
+        if report["kinds"]:
+            st.table([
+                {
+                    "kind": kind,
+                    "entries": k["entries"],
+                    "size MB": round(k["size"] / 2 ** 20, 1),
+                    "hits": k.get("hits", 0),
+                    "misses": k.get("misses", 0),
+                    "hit rate": k.get("hit_rate"),
+                }
+                for kind, k in sorted(report["kinds"].items())
+            ])
+        if report["unevictable"]:
+            st.caption(f"Not evictable (external, no registered files): {', '.join(report['unevictable'])}")
+        if st.button("Evict now"):
+            evicted = cache.evict()
+            st.success(f"Evicted {len(evicted)} entries")
+
+# ======================================================
+# 图库联系表：每 SHEET_SCENES 个镜头的缩略图拼成一张缓存的雪碧图，
+# 页面每格用 CSS 从中取图，重跑时只传几张联系表而不是成百上千张原图
+# ======================================================
+SHEET_SCENES = 25
+SHEET_TILE_HEIGHT = 160
+SHEETS_DIR = "sheets"
+
+
+def render_scene_sheet(scenes, sheet_path, on_tile, captions=None, serve=False):
+    """
+    scenes: [(scene_id, [帧路径, ...]), ...]，一个镜头一行拼成联系表（已有且未过期时直接复用）。
+    每帧画一格缩略图，on_tile(scene_id, j, 帧路径) 在格子下方画勾选框；captions 为 {帧路径: 附加说明}。
+    默认以 data URI 内联联系表；serve=True 时改由本地媒体服务提供（只监听本机，见 media_utils）。
+    """
+    with span("contact_sheet"):
+        sheet = contact_sheet([images for _, images in scenes], sheet_path, SHEET_TILE_HEIGHT)
+    if sheet is None:
+        return
+    version = int(os.path.getmtime(sheet_path))
+    # 重建后 URL 和类名都变化，浏览器不会沿用旧图
+    src = f"{media_url(sheet_path)}?v={version}" if serve else image_data_uri(sheet_path)
+    css_class = "sheet_" + hashlib.sha1(f"{sheet_path}:{version}".encode("utf-8")).hexdigest()[:10]
+    st.markdown(f"<style>{sprite_css(css_class, src, sheet)}</style>", unsafe_allow_html=True)
+
+    columns = max(len(images) for _, images in scenes)
+    captions = captions or {}
+    for (scene_id, images), tiles in zip(scenes, sheet["rows"]):
+        st.markdown(f"### Scene {scene_id}")
+        cols = st.columns(columns)
+        for j, (img, tile) in enumerate(zip(images, tiles)):
+            with cols[j]:
+                caption = os.path.basename(img) + captions.get(img, "")
+                st.markdown(sprite_tile_fluid(css_class, tile, sheet["size"], caption), unsafe_allow_html=True)
+                st.caption(caption)
+                on_tile(scene_id, j, img)
+
+
+# ======================================================
+# 流式模式（长视频）：检测 / 抽帧 / 切割按时间轴窗口推进，结果逐批写入运行清单，
+# 页面只保存视频路径和用户改动过的勾选，图库按页从清单读取
+# ======================================================
+STREAM_PAGE_SCENES = 20
+STREAM_BATCH = 500   # 保存时每批读取的帧 / 镜头数
+
+
+def stream_extract(video_path, frames_dir, manifest, threshold, prefilter, collapse_dups, progress=None):
+    """检测 -> 抽帧 -> 去重逐窗口推进，每批写入清单后即丢弃，返回镜头数"""
+    num_scenes = 0
+    batches = iter_scene_batches(video_path, threshold, prefilter, STREAM_WINDOW_SEC)
+    for batch, rows in iter_extract(video_path, batches, frames_dir):
+        manifest.add_scene_rows(video_path, batch)
+        manifest.add_frames([(p, video_path, sid, f, ts) for p, sid, f, ts in rows])
+        if collapse_dups and rows:
+            with span("dedup"):
+                _, duplicates = dedup_paths([r[0] for r in rows], group_keys=[r[1] for r in rows])
+            manifest.set_duplicates(duplicates)
+        num_scenes += len(batch)
+        if progress:
+            progress(num_scenes, batch[-1][4])
+    return num_scenes
+
+
+def show_stream_gallery(info, serve_sheets=False):
+    """按页显示镜头；默认勾选每个镜头的第一帧，只有与默认不同的勾选存入 session_state"""
+    manifest = RunManifest(info["output_dir"])
+    num_scenes = manifest.scene_count(info["video_path"])
+    pages = max(1, math.ceil(num_scenes / STREAM_PAGE_SCENES))
+    page = st.number_input(f"Scene page (1-{pages}, {num_scenes} scenes)", 1, pages, 1)
+    first = (page - 1) * STREAM_PAGE_SCENES + 1
+    rows = manifest.frames_in_scenes(
+        info["video_path"], first, first + STREAM_PAGE_SCENES - 1, ("scene_id", "path", "duplicate_of")
+    )
+    manifest.close()
+
+    overrides = st.session_state.setdefault("stream_selection", {})
+    dup_count = defaultdict(int)
+    scenes = defaultdict(list)
+    for scene_id, path, dup in rows:
+        if dup:
+            dup_count[dup] += 1
+        else:
+            scenes[scene_id].append(path)
+    if not scenes:
+        return
+
+    def on_tile(scene_id, j, img):
+        default = j == 0
+        checked = st.checkbox(
+            f"Select {os.path.basename(img)}", key=f"stream_{img}", value=overrides.get(img, default)
+        )
+        if checked == default:
+            overrides.pop(img, None)
+        else:
+            overrides[img] = checked
+
+    # 一页一张联系表，和抽帧结果放在同一缓存目录下，随缓存一起淘汰
+    first_frame = next(iter(scenes.values()))[0]
+    sheet_path = os.path.join(os.path.dirname(first_frame), SHEETS_DIR, f"page_{page}.jpg")
+    captions = {img: f" (+{n} similar)" for img, n in dup_count.items()}
+    render_scene_sheet(list(scenes.items()), sheet_path, on_tile, captions, serve_sheets)
+
+
+def stream_save(info, save_mode, make_proxies, cache, owner):
+    """逐批从清单读取帧和镜头：落盘选中帧、切割视频、生成代理，返回 (选中帧数, 切割数)"""
+    video_path, base_dir = info["video_path"], info["output_dir"]
+    save_dir = os.path.join(base_dir, "selected")
+    cuts_dir = os.path.join(base_dir, "cuts")
+    os.makedirs(save_dir, exist_ok=True)
+    overrides = st.session_state.get("stream_selection", {})
+    manifest = RunManifest(base_dir)
+
+    saved, current, first, idx = 0, None, True, 0
+    for rows in manifest.iter_rows("frames", ("path", "scene_id", "duplicate_of"),
+                                   order_by=("scene_id", "frame_index"), batch_size=STREAM_BATCH,
+                                   video=video_path):
+        pairs = []
+        for path, scene_id, dup in rows:
+            if dup:
+                continue
+            if scene_id != current:
+                current, first, idx = scene_id, True, 0
+            default, first = first, False
+            if overrides.get(path, default):
+                idx += 1
+                name = f"cut({scene_id}).jpg" if idx == 1 else f"cut({scene_id}.{idx}).jpg"
+                pairs.append((path, os.path.join(save_dir, name)))
+        with span("materialize"):
+            materialize(pairs, strategy=save_mode)
+        manifest.set_selected(pairs)
+        saved += len(pairs)
+
+    num_cuts, proxy_files = 0, []
+    if make_proxies:
+        cache.get(info["video_fingerprint"], "proxies", path=os.path.join(cuts_dir, PROXY_DIR), owner=owner)
+    for rows in manifest.iter_rows("scenes", ("scene_id", "start_sec", "end_sec"), order_by=("scene_id",),
+                                   batch_size=STREAM_BATCH, video=video_path):
+        with span("cut_videos"):
+            cut_paths = {i: p for i, p in iter_cut_videos(video_path, rows, cuts_dir) if p}
+        manifest.set_cut_paths(video_path, cut_paths)
+        num_cuts += len(cut_paths)
+        if make_proxies:
+            with span("proxies"):
+                results = generate_proxies(list(cut_paths.values()))
+            proxy_files += [f for pair in results.values() for f in pair if f]
+    if make_proxies:
+        cache.commit(info["video_fingerprint"], "proxies", files=proxy_files)
+    manifest.close()
+    return saved, num_cuts
 
 # ======================================================
 # 清理旧数据
 # ======================================================
 def clean_previous_run(output_dir):
-    for sub in ["selected", "temp", "cuts"]:
+    # temp 为抽帧缓存（ArtifactCache，按磁盘预算淘汰），不随每次运行清空
+    for sub in ["selected", "cuts", "roles"]:
         path = os.path.join(output_dir, sub)
         if os.path.exists(path):
             shutil.rmtree(path)
@@ -131,51 +392,263 @@ def run_step0():
     video_path = st.text_input("Input Video Path", "1.mp4")
     output_dir = st.text_input("Output Directory", "output/frames")
     threshold = st.slider("Scene Detection Threshold", 20.0, 50.0, 35.0)
-    mode = st.radio("Detection Mode", ["basic", "smart"], index=1, horizontal=True)
+    mode = st.radio("Detection Mode", ["draft", "basic", "smart"], index=2, horizontal=True)
+    prefilter = st.checkbox(
+        "Compressed-domain prefilter (decode only around candidate cuts)", value=False,
+        disabled=(mode == "draft")
+    )
+    save_mode = st.radio("Save Mode", SAVE_MODES, index=0, horizontal=True)
+    collapse_dups = st.checkbox("Collapse near-duplicate frames within a scene", value=True)
+    make_proxies = st.checkbox("Generate low-res preview proxies after cutting (used by Step 3)", value=True)
+    serve_sheets = st.checkbox(
+        "Serve gallery contact sheets from the local media server", value=False,
+        help="Smaller reruns; the server listens on 127.0.0.1 unless MEDIA_BIND_HOST is set. "
+             "Off: contact sheets are inlined into the page"
+    )
+    streaming = st.checkbox(
+        "Streaming mode for long videos (bounded memory; scenes are paged from the run manifest)", value=False
+    )
+    if streaming:
+        st.caption(
+            "Streaming mode runs basic detection window by window (smart merging needs every scene at once); "
+            "face analysis is left to Step 2."
+        )
+    pipeline_faces = st.checkbox(
+        "Analyze faces while extracting frames (provisional roles, reused by Step 2)", value=False,
+        disabled=streaming
+    ) and not streaming
+    budget_gb = st.number_input(
+        "Cache disk budget (GB)", min_value=1.0, value=float(DEFAULT_BUDGET_GB), step=1.0
+    )
+    cache_dir = st.text_input(
+        "Cache Directory", "", placeholder=cache_root(output_dir),
+        help="Frames, face features and proxy bookkeeping; blank uses <output directory>/temp"
+    ).strip()
+    cache = ArtifactCache(cache_dir or cache_root(output_dir), budget_gb)
+    # 当前会话使用中的缓存条目以该 id pin 住，不会被淘汰
+    owner = st.session_state.setdefault("cache_owner", uuid.uuid4().hex[:8])
+    show_cache_panel(cache)
 
     if st.button("Start Scene Detection and Frame Extraction"):
         if not os.path.exists(video_path):
             st.error("Video file does not exist")
+        elif streaming:
+            clean_previous_run(output_dir)
+            cache.unpin_owner(owner)
+            manifest = RunManifest(output_dir)
+            manifest.reset_video(video_path)
+            with trace_run("step0_stream_extract", output_dir) as tracer:
+                fingerprint = video_fingerprint(video_path)
+                # 流式抽帧不做缓存复用（命中判断需要整份帧列表），只登记到缓存以便按预算淘汰
+                frames_dir, _ = cache.get(fingerprint, "stream_frames", check=lambda d: False, owner=owner)
+                status = st.empty()
+                num_scenes = stream_extract(
+                    video_path, frames_dir, manifest, threshold, prefilter or mode == "draft", collapse_dups,
+                    progress=lambda n, sec: status.info(f"{n} scenes processed ({sec / 60:.1f} min of video)")
+                )
+                cache.commit(fingerprint, "stream_frames")
+            manifest.close()
+            st.success(f"Detected {num_scenes} scenes!")
+            for key in ("scene_frames", "scenes", "face_embeddings", "frame_roles", "frame_duplicates"):
+                st.session_state.pop(key, None)
+            st.session_state.update({
+                "stream": {
+                    "video_path": video_path, "output_dir": output_dir, "video_fingerprint": fingerprint,
+                    "cache_root": cache.root,
+                },
+                "stream_selection": {},
+                "last_trace": tracer.result,
+            })
         else:
+            st.session_state.pop("stream", None)
             clean_previous_run(output_dir)
+            cache.unpin_owner(owner)
+            manifest = RunManifest(output_dir)
+            manifest.reset_video(video_path)
+
+            with trace_run("step0_extract", output_dir) as tracer:
+                fingerprint = video_fingerprint(video_path)
+                params = {"threshold": threshold, "mode": mode, "prefilter": prefilter and mode != "draft"}
+                loaded = None
+                temp_dir, hit = cache.get(
+                    fingerprint, "frames",
+                    check=lambda d: load_frames_manifest(d, params) is not None,
+                    owner=owner   # 取得时即 pin：commit 会按预算淘汰，未 pin 的新条目可能被立即删除
+                )
+                if hit:
+                    loaded = load_frames_manifest(temp_dir, params)
+                face_embeddings = None
+                if pipeline_faces:
+                    faces_dir, faces_hit = cache.get(fingerprint, "faces", check=lambda d: hit, owner=owner)
+                    faces_path = os.path.join(faces_dir, FACES_FILE)
+                    if faces_hit and os.path.exists(faces_path):
+                        with open(faces_path, "rb") as f:
+                            face_embeddings = pickle.load(f)
+
+                # 流水线模式：抽帧线程解码的同时，后台线程经有界队列做人脸检测 + 提特征
+                pipeline = None
+                if pipeline_faces and face_embeddings is None:
+                    pipeline = FacePipeline(det_threshold=ROLE_DET_THRESHOLD, manifest=manifest)
+
+                if loaded:
+                    scenes, scene_frames, frame_rows = loaded
+                    st.success(f"Reusing cached frames: {len(scenes)} scenes")
+                    manifest.add_frames([(p, video_path, *rest) for p, *rest in frame_rows])
+                    if pipeline:
+                        for p in (p for imgs in scene_frames.values() for p in imgs):
+                            pipeline.submit(p, cv2.imread(p))
+                else:
+                    st.info("Detecting scenes, please wait...")
+                    with span("detect_scenes"):
+                        scenes = detect_scenes_advanced(video_path, threshold, mode, prefilter)
+                    st.success(f"Detected {len(scenes)} scenes!")
+
+                    with span("extract_frames"):
+                        scene_frames = extract_frames(
+                            video_path, scenes, temp_dir, on_frame=pipeline.submit if pipeline else None,
+                            manifest=manifest
+                        )
+                    frame_rows = manifest.frames(("path", "scene_id", "frame_index", "timestamp"), video=video_path)
+                    save_frames_manifest(temp_dir, params, scenes, scene_frames, frame_rows)
+                    cache.commit(fingerprint, "frames")
+                manifest.add_scenes(video_path, scenes)
 
-            st.info("Detecting scenes, please wait...")
-            scenes = detect_scenes_advanced(video_path, threshold, mode)
-            st.success(f"Detected {len(scenes)} scenes!")
+                if pipeline:
+                    face_embeddings = pipeline.close()
+                    with open(faces_path, "wb") as f:
+                        pickle.dump(face_embeddings, f)
+                    cache.commit(fingerprint, "faces")
+
+                frame_roles = {}
+                if face_embeddings is not None:
+                    frames = [p for imgs in scene_frames.values() for p in imgs]
+                    if not pipeline:
+                        # 特征来自缓存：清单中只能登记行号和质量，没有人脸框
+                        manifest.add_faces(face_embeddings, frames, "step0")
+                    with span("provisional_grouping"):
+                        centroids = first_pass_clustering(
+                            frames, "", ROLE_SIM_THRESHOLD, face_embeddings, state={}
+                        )
+                        groups = second_pass_assign(frames, "", centroids, face_embeddings, ROLE_SIM_THRESHOLD)
+                    groups.pop("other", None)
+                    manifest.set_roles(groups, "step0_provisional")
+                    for role, imgs in groups.items():
+                        for p in imgs:
+                            frame_roles.setdefault(p, set()).add(role)
+                    st.info(f"Provisional roles: {len(centroids)} characters found in {len(frames)} frames")
+
+                # 同一镜头内的近重复帧只保留代表帧，{被合并帧: 代表帧}
+                duplicates = {}
+                if collapse_dups:
+                    with span("dedup"):
+                        all_frames = [(sid, p) for sid, imgs in scene_frames.items() for p in imgs]
+                        _, duplicates = dedup_paths(
+                            [p for _, p in all_frames], group_keys=[sid for sid, _ in all_frames]
+                        )
+                    scene_frames = {
+                        sid: [p for p in imgs if p not in duplicates] for sid, imgs in scene_frames.items()
+                    }
+            manifest.close()
 
-            temp_dir = os.path.join(output_dir, "temp")
-            scene_frames = extract_frames(video_path, scenes, temp_dir)
             st.session_state.update({
                 "scene_frames": scene_frames,
+                "frame_duplicates": duplicates,
                 "temp_dir": temp_dir,
                 "output_dir": output_dir,
                 "scenes": scenes,
-                "video_path": video_path
+                "video_path": video_path,
+                "video_fingerprint": fingerprint,
+                "cache_root": cache.root,
+                "face_embeddings": face_embeddings,
+                "frame_roles": {p: sorted(r) for p, r in frame_roles.items()},
+                "last_trace": tracer.result,
             })
 
-    if "scene_frames" in st.session_state:
+    if "stream" in st.session_state:
+        info = st.session_state["stream"]
+        show_stream_gallery(info, serve_sheets)
+        if st.button("Save Selection and Cut Video"):
+            with trace_run("step0_stream_save", info["output_dir"]) as tracer:
+                save_cache = ArtifactCache(info.get("cache_root", cache.root), budget_gb)
+                saved, num_cuts = stream_save(info, save_mode, make_proxies, save_cache, owner)
+            st.session_state["last_trace"] = tracer.result
+            st.success(f"✅ Saved Success!\n {saved} pictures, {num_cuts} cut videos in {info['output_dir']}")
+    elif "scene_frames" in st.session_state:
         selected_images = []
-        for scene_id, images in st.session_state["scene_frames"].items():
-            st.markdown(f"### Scene {scene_id}")
-            cols = st.columns(len(images))
-            for j, img in enumerate(images):
-                with cols[j]:
-                    st.image(img, caption=os.path.basename(img), use_container_width=True)
-                    if st.checkbox(f"Select {os.path.basename(img)}", key=f"scene_{scene_id}_{j}", value=(j == 0)):
-                        selected_images.append((scene_id, img))
+        dup_count = defaultdict(int)
+        for rep in st.session_state.get("frame_duplicates", {}).values():
+            dup_count[rep] += 1
+        captions = defaultdict(str)
+        for img, n in dup_count.items():
+            captions[img] += f" (+{n} similar)"
+        for img, roles in st.session_state.get("frame_roles", {}).items():
+            if roles:
+                captions[img] += " · roles " + ",".join(roles)
+
+        def on_tile(scene_id, j, img):
+            if st.checkbox(f"Select {os.path.basename(img)}", key=f"scene_{scene_id}_{j}", value=(j == 0)):
+                selected_images.append((scene_id, img))
+
+        scene_items = [(sid, imgs) for sid, imgs in st.session_state["scene_frames"].items() if imgs]
+        sheets_dir = os.path.join(st.session_state["temp_dir"], SHEETS_DIR)
+        for b in range(0, len(scene_items), SHEET_SCENES):
+            sheet_path = os.path.join(sheets_dir, f"sheet_{b // SHEET_SCENES}.jpg")
+            render_scene_sheet(scene_items[b:b + SHEET_SCENES], sheet_path, on_tile, captions, serve_sheets)
 
         if st.button("Save Selection and Cut Video"):
             base_dir = st.session_state["output_dir"]
+            # 与抽帧时使用同一个缓存目录（之后改了输出目录也不影响）
+            cache = ArtifactCache(st.session_state.get("cache_root", cache.root), budget_gb)
             save_dir = os.path.join(base_dir, "selected")
             cuts_dir = os.path.join(base_dir, "cuts")
             os.makedirs(save_dir, exist_ok=True)
 
             scene_counter = defaultdict(int)
+            pairs = []
             for scene_id, img_path in selected_images:
                 scene_counter[scene_id] += 1
                 idx = scene_counter[scene_id]
                 name = f"cut({scene_id}).jpg" if idx == 1 else f"cut({scene_id}.{idx}).jpg"
-                shutil.copy(img_path, os.path.join(save_dir, name))
+                pairs.append((img_path, os.path.join(save_dir, name)))
+            manifest = RunManifest(base_dir)
+            with trace_run("step0_save", base_dir) as tracer:
+                with span("materialize"):
+                    materialize(pairs, strategy=save_mode)
+                manifest.set_selected(pairs)
+
+                # 流水线已算好特征：选择结果只是过滤，直接按选中帧分组，Step 2 增量模式可复用
+                roles_dir = None
+                if st.session_state.get("face_embeddings") is not None:
+                    roles_dir = os.path.join(base_dir, "roles")
+                    with span("group_selected"):
+                        groups = group_from_embeddings(
+                            st.session_state["face_embeddings"],
+                            {src: os.path.basename(dst) for src, dst in pairs},
+                            save_dir, roles_dir, ROLE_SIM_THRESHOLD, link_mode=save_mode
+                        )
+                    manifest.set_roles(groups, "step0")
 
-            cut_video_segments(st.session_state["video_path"], st.session_state["scenes"], cuts_dir)
-            st.success(f"✅ Saved Success!\n Pictures: {save_dir}\nCut Videos: {cuts_dir}")
\ No newline at end of file
+                with span("cut_videos"):
+                    cut_paths = cut_video_segments(
+                        st.session_state["video_path"], st.session_state["scenes"], cuts_dir, manifest=manifest
+                    )
+                if make_proxies:
+                    progress = st.progress(0.0, text="Generating preview proxies...")
+                    fingerprint = st.session_state["video_fingerprint"]
+                    cache.get(fingerprint, "proxies", path=os.path.join(cuts_dir, PROXY_DIR), owner=owner)
+                    with span("proxies"):
+                        results = generate_proxies(
+                            list(cut_paths.values()),
+                            progress_callback=lambda done, total, _: progress.progress(
+                                done / total, text=f"Generating preview proxies {done}/{total}"
+                            )
+                        )
+                    cache.commit(fingerprint, "proxies", files=[f for pair in results.values() for f in pair if f])
+            manifest.close()
+            st.session_state["last_trace"] = tracer.result
+            st.success(f"✅ Saved Success!\n Pictures: {save_dir}\nCut Videos: {cuts_dir}")
+            if roles_dir:
+                st.info(
+                    f"Provisional roles: {roles_dir} - open Step 2 with input `{save_dir}`, "
+                    f"output `{roles_dir}` and Incremental checked to refine without re-running face analysis"
+                )
\ No newline at end of file
@@ -5,6 +5,9 @@ from pathlib import Path
 import pickle
 
 from utils import CacheManager
+from utils.materialize_utils import write_frames
+from utils.trace_utils import trace_run
+from utils.manifest_utils import find_manifest
 
 cache = CacheManager("step1_cache.pkl")  # 每个页面可以使用不同的文件名
 
@@ -45,7 +48,13 @@ def run_step1():
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
 
-    video_files = list(input_path.glob("*.mp4")) + list(input_path.glob("*.mov"))
+    # 输入是 Step 0 的 cuts 目录时按运行清单取镜头视频（按镜头号排序），否则列目录
+    manifest = find_manifest(input_dir)
+    video_files = [Path(p) for _, p in manifest.cut_videos(input_dir)] if manifest else []
+    if manifest:
+        manifest.close()
+    if not video_files:
+        video_files = list(input_path.glob("*.mp4")) + list(input_path.glob("*.mov"))
     if not video_files:
         st.info("Input directory does not contain any video files")
         return     
@@ -68,8 +77,11 @@ def run_step1():
         selected_frames[video_file] = checkboxes
  
     if st.button("Save Selected Frames"):
+        items = []
         for video_file, frame_list in selected_frames.items():
             base_name = video_file.stem
+            # 来源标识：视频修改时间 + 帧号，未变化的帧不再重新编码
+            video_mtime = video_file.stat().st_mtime_ns
             count = 0  # 用于顺序编号
             for i, (frame_idx, frame_img, checked) in enumerate(frame_list):
                 if checked:
@@ -78,6 +90,9 @@ def run_step1():
                         filename = f"{base_name}.jpg"
                     else:
                         filename = f"{base_name}.{count}.jpg"
-                    save_path = output_path / filename
-                    cv2.imwrite(str(save_path), cv2.cvtColor(frame_img, cv2.COLOR_RGB2BGR))
-        st.success("Selected frames saved!")
\ No newline at end of file
+                    key = f"{video_file}:{video_mtime}:{frame_idx}"
+                    items.append((filename, key, cv2.cvtColor(frame_img, cv2.COLOR_RGB2BGR)))
+        with trace_run("step1_save", str(output_path)) as tracer:
+            stats = write_frames(items, str(output_path))
+        st.session_state["last_trace"] = tracer.result
+        st.success(f"Selected frames saved! ({stats['written']} written, {stats['skipped']} unchanged)")
\ No newline at end of file
@@ -1,15 +1,31 @@
 import os
+import time
+import pickle
 import shutil
 import numpy as np
 import streamlit as st
 from collections import defaultdict
-from utils.face_utils import extract_feature, cosine_sim
+from utils.face_utils import extract_feature, analyze_faces, get_model, model_name, ADAPTIVE_DET_SIZES
 from utils.ui_utils import display_images
 from utils.file_utils import get_role_label
+from utils.parallel_utils import extract_features_parallel
+from utils.image_utils import iter_images, image_clarity
+from utils.track_utils import group_by_shot, extract_shot_features
+from utils.hash_utils import dedup_paths
+from utils.crop_utils import CropStore, embed_from_store
+from utils.embedding_utils import EmbeddingMatrix
+from utils.media_utils import natural_sort_key
+from utils.manifest_utils import find_manifest, list_images
+from utils.exemplar_utils import order_role_images, EXEMPLAR_K
+from utils.service_utils import embedding_server
+from utils.trace_utils import span, count, trace_run
+from utils.library_utils import CharacterLibrary
+from utils.materialize_utils import materialize, remove_materialized, read_manifest, MANIFEST_FILE, STRATEGIES
 import cv2
 
 DET_THRESHOLD = 0.65
 IMAGES_PER_ROW = 4
+REC_MODELS = ["buffalo_l", "buffalo_l-int8", "antelopev2", "antelopev2-int8"]
 
 from utils import CacheManager
 cache = CacheManager("step2_cache.pkl")
@@ -23,59 +39,111 @@ def normalize(v):
 
 
 def compute_clarity(img_path):
-    """返回 0~1 之间清晰度分数"""
-    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        return 0.3
+    """返回 0~1 之间清晰度分数（整图，仅在缺少人脸质量时兜底）"""
+    return image_clarity(cv2.imread(img_path, cv2.IMREAD_GRAYSCALE))
 
-    lap = cv2.Laplacian(img, cv2.CV_64F)
-    score = lap.var()
 
-    # normalize
-    score = min(score / 1500.0, 1.0)
-    return max(score, 0.05)
+def face_weights(img_name, img_path, embeddings, clarity_cache):
+    """每张脸的质量权重：优先用人脸裁剪质量，缺失时退回整图清晰度"""
+    qualities = embeddings.qualities(img_name)
+    if not np.isnan(qualities).any():
+        return qualities
+
+    if img_name not in clarity_cache:
+        clarity_cache[img_name] = compute_clarity(img_path)
+    return np.full(len(qualities), clarity_cache[img_name], dtype=np.float32)
 
 
 # -----------------------------
-# 第一阶段：快速聚类
+# 特征提取：串行 / 多进程
 # -----------------------------
-def first_pass_clustering(file_list, input_dir, sim_threshold):
-    role_centroids = {}
-    role_feature_list = defaultdict(list)
-    role_images = defaultdict(set)
-    next_role_id = 0
+def extract_all_features(file_list, input_dir, embeddings, workers=0, progress_callback=None,
+                         shot_mode=False, det_sizes=None, rec_model=model_name):
+    """
+    提取全部图片的人脸特征和质量，直接写入 embeddings（EmbeddingMatrix）。
+    每张图只解码一次，由预读线程池提前完成；workers>1 时使用进程池。
+    shot_mode=True 时按 cut(N.M) 命名分镜头，镜头内跟踪人脸，只对锚帧做完整推理。
+    det_sizes 不为空时使用自适应检测分辨率（见 face_utils.detect_boxes）。
+    rec_model 为模型包名，"-int8" 后缀表示使用量化的识别模型。
+    """
+    if workers > 1:
+        extract_features_parallel(
+            file_list, input_dir, embeddings, workers=workers,
+            det_threshold=DET_THRESHOLD, progress_callback=progress_callback,
+            shot_mode=shot_mode, det_sizes=det_sizes, model=rec_model
+        )
+        return embeddings
+
+    # 默认模型时传 None，以便走嵌入服务
+    face_model = get_model(rec_model) if rec_model != model_name else None
+    start = time.time()
+    if shot_mode:
+        done = 0
+        for shot in group_by_shot(file_list):
+            feats, quals, sizes, _ = extract_shot_features(
+                shot, input_dir, det_threshold=DET_THRESHOLD, face_model=face_model, det_sizes=det_sizes
+            )
+            for img_name in shot:
+                embeddings.add_image(
+                    img_name, feats.get(img_name, []), quals.get(img_name), sizes.get(img_name)
+                )
+            done += len(shot)
+            if progress_callback:
+                progress_callback(done, len(file_list), time.time() - start)
+        return embeddings
+
+    paths = {os.path.join(input_dir, name): name for name in file_list}
+    for i, (img_path, img) in enumerate(iter_images(paths), 1):
+        features, qualities, det_size = analyze_faces(
+            img_path, det_threshold=DET_THRESHOLD, face_model=face_model, img=img, det_sizes=det_sizes
+        )
+        embeddings.add_image(paths[img_path], features, qualities, det_size)
+        if progress_callback:
+            progress_callback(i, len(file_list), time.time() - start)
+    return embeddings
 
-    # 缓存特征，减少重复计算
-    feature_cache = {}
+
+# -----------------------------
+# 第一阶段：快速聚类
+# -----------------------------
+def first_pass_clustering(file_list, input_dir, sim_threshold, embeddings, state=None):
+    """
+    按顺序在线聚类，返回 {角色: centroid}。
+    state 不为空时在已有角色基础上继续聚类（增量模式），并写回 centroid 等状态。
+    centroid = normalize(Σ w² · f)，与对成员做 gamma 加权平均后归一化等价，只需维护加权和。
+    """
+    state = state if state is not None else {}
+    role_centroids = state.setdefault("centroids", {})
+    role_sums = state.setdefault("role_sums", {})
+    next_role_id = state.get("next_role_id", 0)
+    clarity_cache = {}
+
+    roles = list(role_centroids)
+    centroid_mat = np.array([role_centroids[r] for r in roles], dtype=np.float32).reshape(-1, embeddings.dim)
 
     for img_name in file_list:
         img_path = os.path.join(input_dir, img_name)
 
-        # 缓存机制：提高 3-10 倍速度
-        if img_name not in feature_cache:
-            features = extract_feature(img_path, det_threshold=DET_THRESHOLD)
-            feature_cache[img_name] = features
-        else:
-            features = feature_cache[img_name]
+        # 未预先提取的图片在这里补提
+        if img_name not in embeddings:
+            embeddings.add_image(img_name, extract_feature(img_path, det_threshold=DET_THRESHOLD))
 
-        if not features:
-            role_images["other"].add(img_name)
+        features = embeddings.features(img_name)
+        if len(features) == 0:
             continue
 
-        clarity = compute_clarity(img_path)
-
-        for feat in features:
-            feat = normalize(np.array(feat))
+        weights = face_weights(img_name, img_path, embeddings, clarity_cache)
 
-            matched_role = None
-            best_sim = -1
+        for feat, clarity in zip(features, weights):
+            feat = feat.astype(np.float32)
 
-            # 与已有角色比较
-            for role, centroid in role_centroids.items():
-                sim = cosine_sim(feat, centroid)
-                if sim > best_sim:
-                    best_sim = sim
-                    matched_role = role
+            # 与已有角色比较（矩阵一次算完）
+            matched_idx, best_sim = None, -1
+            if len(roles):
+                sims = centroid_mat @ feat
+                count("comparisons", len(roles))
+                matched_idx = int(np.argmax(sims))
+                best_sim = float(sims[matched_idx])
 
             # 自适应阈值（清晰度越低，阈值越低）
             adaptive_thr = sim_threshold * (0.8 + clarity * 0.2)
@@ -84,60 +152,52 @@ def first_pass_clustering(file_list, input_dir, sim_threshold):
                 new_role = get_role_label(next_role_id)
                 next_role_id += 1
 
-                role_feature_list[new_role].append((feat, clarity))
-                role_centroids[new_role] = feat
-                role_images[new_role].add(img_name)
+                role_sums[new_role] = feat * clarity ** 2
+                roles.append(new_role)
+                centroid_mat = np.vstack([centroid_mat, feat[None]])
                 continue
 
-            # 匹配
-            role_feature_list[matched_role].append((feat, clarity))
+            # 匹配：gamma 加权
+            matched_role = roles[matched_idx]
+            role_sums[matched_role] = role_sums[matched_role] + feat * clarity ** 2
+            centroid_mat[matched_idx] = normalize(role_sums[matched_role])
 
-            feats = np.array([f for f, w in role_feature_list[matched_role]])
-            weights = np.array([w**2 for f, w in role_feature_list[matched_role]])  # gamma 加权
-
-            weighted_centroid = np.average(feats, axis=0, weights=weights)
-            weighted_centroid = normalize(weighted_centroid)
-            role_centroids[matched_role] = weighted_centroid
-
-            role_images[matched_role].add(img_name)
-
-    return role_centroids, feature_cache
+    for role, centroid in zip(roles, centroid_mat):
+        role_centroids[role] = centroid
+    state["next_role_id"] = next_role_id
+    return role_centroids
 
 
 # -----------------------------
 # 第二阶段：refine 聚类（提升准确度）
 # -----------------------------
-def second_pass_assign(
-        file_list, input_dir, role_centroids, feature_cache, sim_threshold):
-
+def second_pass_assign(file_list, input_dir, role_centroids, embeddings, sim_threshold):
     final_groups = defaultdict(set)
+    clarity_cache = {}
+
+    roles = list(role_centroids)
+    centroid_mat = np.array([role_centroids[r] for r in roles], dtype=np.float32).reshape(-1, embeddings.dim)
 
     for img_name in file_list:
         img_path = os.path.join(input_dir, img_name)
 
-        features = feature_cache.get(img_name)
-        if not features:
+        features = embeddings.features(img_name)
+        if len(features) == 0 or not roles:
             final_groups["other"].add(img_name)
             continue
 
-        clarity = compute_clarity(img_path)
-
-        for feat in features:
-            feat = normalize(np.array(feat))
+        weights = face_weights(img_name, img_path, embeddings, clarity_cache)
 
-            matched_role = None
-            best_sim = -1
+        # (人脸数, 角色数) 相似度矩阵
+        sims = features.astype(np.float32) @ centroid_mat.T
+        count("comparisons", sims.size)
+        best = np.argmax(sims, axis=1)
+        best_sim = sims[np.arange(len(best)), best]
+        adaptive_thr = sim_threshold * (0.8 + weights * 0.2)
 
-            for role, centroid in role_centroids.items():
-                sim = cosine_sim(feat, centroid)
-                if sim > best_sim:
-                    best_sim = sim
-                    matched_role = role
-
-            adaptive_thr = sim_threshold * (0.8 + clarity * 0.2)
-
-            if best_sim >= adaptive_thr:
-                final_groups[matched_role].add(img_name)
+        for idx, ok in zip(best, best_sim >= adaptive_thr):
+            if ok:
+                final_groups[roles[idx]].add(img_name)
             else:
                 final_groups["other"].add(img_name)
 
@@ -145,38 +205,300 @@ def second_pass_assign(
 
 
 # -----------------------------
-# 主函数：两阶段聚类
+# 跨集数角色库匹配
 # -----------------------------
-def group_roles(input_dir, output_dir, sim_threshold=0.55):
-    os.makedirs(output_dir, exist_ok=True)
-
-    file_list = [
-        f for f in os.listdir(input_dir)
-        if f.lower().endswith((".jpg", ".jpeg", ".png"))
-    ]
+LIBRARY_THRESHOLD = 0.5
+LIBRARY_MIN_IMAGES = 3   # 少于该图片数的新角色不写入角色库
 
-    # ---- 第一阶段: 建立初步角色 centroid ----
-    centroids, feature_cache = first_pass_clustering(
-        file_list, input_dir, sim_threshold
-    )
 
-    # ---- 第二阶段: refine 聚类（准确度更高）----
-    final_groups = second_pass_assign(
-        file_list, input_dir, centroids, feature_cache, sim_threshold
-    )
+def role_member_features(final_groups, embeddings, role_centroids):
+    """收集每个角色的人脸特征（每张脸归到最近的 centroid），返回 {角色: (N, D) 数组}"""
+    roles = list(role_centroids)
+    role_feats = {}
+    if not roles:
+        return role_feats
+    centroid_mat = np.array([role_centroids[r] for r in roles], dtype=np.float32)
 
-    # 输出
     for role, images in final_groups.items():
-        role_dir = os.path.join(output_dir, f"role_{role}")
-        os.makedirs(role_dir, exist_ok=True)
+        if role not in role_centroids:
+            continue
+        role_idx = roles.index(role)
+        rows = np.array([r for img_name in images for r in embeddings.rows(img_name)], dtype=np.int64)
+        if not len(rows):
+            continue
+        feats = embeddings.matrix[rows].astype(np.float32)
+        role_feats[role] = feats[np.argmax(feats @ centroid_mat.T, axis=1) == role_idx]
+    return role_feats
+
+
+def apply_character_library(final_groups, role_centroids, embeddings,
+                            library_dir, tag, threshold=LIBRARY_THRESHOLD):
+    """
+    用角色库给角色命名，返回 {角色标签: 库中名称}：匹配上的角色使用库中名称并补充样本，
+    未匹配且图片数足够的角色以 "<tag>_<label>" 新建入库。
+    """
+    library = CharacterLibrary(library_dir)
+    role_feats = role_member_features(final_groups, embeddings, role_centroids)
+
+    roles = [r for r in final_groups if r in role_centroids]
+    matches = library.match([role_centroids[r] for r in roles], threshold) if roles else []
+
+    renamed = {}
+    for role, (name, sim) in zip(roles, matches):
+        if name is None:
+            if len(final_groups[role]) < LIBRARY_MIN_IMAGES:
+                continue
+            name = f"{tag}_{role}"
+        feats = role_feats.get(role)
+        library.add(name, feats if feats is not None and len(feats) else [role_centroids[role]])
+        renamed[role] = name
+    library.save()
+    return renamed
+
+
+# -----------------------------
+# 增量模式：持久化聚类状态
+# -----------------------------
+STATE_FILE = ".grouping_state.pkl"
+EMBEDDINGS_FILE = ".embeddings.f16"   # compact 模式下的 memmap 特征矩阵
+
+
+def file_signature(path):
+    st_ = os.stat(path)
+    return st_.st_mtime_ns, st_.st_size
+
+
+def new_grouping_state(sim_threshold, rec_model=model_name, output_dir=None, compact=False):
+    """compact=True 时特征矩阵为落在 output_dir 的 float16 memmap，否则为内存 float32"""
+    if compact and output_dir:
+        embeddings = EmbeddingMatrix(dtype=np.float16, path=os.path.join(output_dir, EMBEDDINGS_FILE))
+    else:
+        embeddings = EmbeddingMatrix()
+    return {
+        "sim_threshold": sim_threshold,
+        "det_threshold": DET_THRESHOLD,
+        "rec_model": rec_model,
+        "compact": bool(compact and output_dir),   # 特征矩阵的存放方式
+        "files": {},                          # 文件名 -> (mtime, size)
+        "embeddings": embeddings,             # 所有人脸特征 / 质量
+        "centroids": {},
+        "role_sums": {},                      # 角色 -> Σ w² · f
+        "next_role_id": 0,
+        "groups": defaultdict(set),           # 角色标签 -> 图片集合
+        "names": {},                          # 角色标签 -> 角色库名称
+    }
+
+
+def load_grouping_state(output_dir, sim_threshold, rec_model=model_name, compact=False):
+    """读取上次的聚类状态；阈值/识别模型/特征存放方式变化或文件损坏时返回 None（需全量重跑）"""
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+    except Exception as e:
+        print(f"加载聚类状态失败: {e}")
+        return None
+    if "embeddings" not in state:
+        return None  # 旧版本状态
+    if state.get("sim_threshold") != sim_threshold or state.get("det_threshold") != DET_THRESHOLD:
+        return None
+    if state.get("rec_model", model_name) != rec_model or state.get("compact", False) != compact:
+        return None
+    return state
+
+
+def save_grouping_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def output_groups(state):
+    """按角色库名称合并后的最终分组"""
+    groups = defaultdict(set)
+    for role, images in state["groups"].items():
+        if images:
+            groups[state["names"].get(role, role)] |= images
+    return groups
+
+
+def move_role_dir(input_dir, output_dir, old, new, link_mode="copy"):
+    """
+    角色改名时把 role_old 的文件并入 role_new：按 link_mode 重新放置（manifest 记录一起迁移），
+    找不到源文件的直接移动，最后删除 role_old。
+    """
+    old_dir = os.path.join(output_dir, f"role_{old}")
+    new_dir = os.path.join(output_dir, f"role_{new}")
+    if not os.path.exists(old_dir):
+        return
+    sources = read_manifest(old_dir)
+    for f in os.listdir(old_dir):
+        if f != MANIFEST_FILE and f not in sources:
+            path = os.path.join(old_dir, f)
+            src = os.path.realpath(path) if os.path.islink(path) else os.path.join(input_dir, f)
+            sources[f] = src if os.path.exists(src) else None
+
+    materialize([(src, os.path.join(new_dir, f)) for f, src in sources.items() if src], strategy=link_mode)
+    os.makedirs(new_dir, exist_ok=True)
+    for f, src in sources.items():
+        dst = os.path.join(new_dir, f)
+        if src is None and not os.path.exists(dst):
+            shutil.move(os.path.join(old_dir, f), dst)
+    remove_materialized([os.path.join(old_dir, f) for f in sources])
+    shutil.rmtree(old_dir)
+
 
-        for img_name in images:
-            src = os.path.join(input_dir, img_name)
-            dst = os.path.join(role_dir, img_name)
-            if not os.path.exists(dst):
-                shutil.copy(src, dst)
+# -----------------------------
+# 主函数：两阶段聚类
+# -----------------------------
+def group_roles(input_dir, output_dir, sim_threshold=0.55,
+                workers=0, progress_callback=None, library_dir=None,
+                incremental=False, link_mode="copy", shot_mode=False, dedup=False,
+                crop_store_dir=None, rec_model=model_name, adaptive_det=False,
+                compact_embeddings=False, exemplar_k=EXEMPLAR_K):
+    """
+    incremental=True 时读取 output_dir 中的聚类状态，只处理新增/修改的图片，
+    并按增量更新 role_* 目录；否则全量重新聚类。
+    link_mode 为 role_* 目录的落盘方式，见 materialize_utils.STRATEGIES。
+    dedup=True 时先用感知哈希合并近重复图片，被合并的图片沿用代表图的人脸结果。
+    rec_model 为识别所用的模型包，带 "-int8" 后缀时使用动态量化的 INT8 识别模型（更快，精度略降）。
+    crop_store_dir 不为空时只对新图片做检测并缓存对齐裁剪，特征由 rec_model 在裁剪上批量提取，
+    更换识别模型或检测阈值无需重新检测（此模式下 workers / shot_mode 不生效）。
+    adaptive_det=True 时先用 320 检测，没有可信人脸或只有小脸时再用 640。
+    compact_embeddings=True 时特征以 float16 memmap 存放在 output_dir，内存只随特征字节数增长。
+    返回 {角色: 图片列表}，列表顺序为 medoid + 多样的高质量代表图（共 exemplar_k 张）在前，
+    与角色中心最不相似的在最后。
+    """
+    os.makedirs(output_dir, exist_ok=True)
 
-    return {k: list(v) for k, v in final_groups.items()}
+    # Step 0 的项目目录下有运行清单时清单中的选中帧在前，手动放入的新图片也一并处理
+    manifest = find_manifest(input_dir)
+    file_list = list_images(input_dir, manifest)
+    signatures = {f: file_signature(os.path.join(input_dir, f)) for f in file_list}
+
+    state = load_grouping_state(output_dir, sim_threshold, rec_model, compact_embeddings) if incremental else None
+    if state is None:
+        state = new_grouping_state(sim_threshold, rec_model, output_dir, compact_embeddings)
+    embeddings = state["embeddings"]
+
+    # ---- 找出变化: 新增/修改的需要重新处理，修改/删除的需要撤销旧分配 ----
+    todo = [f for f in file_list if state["files"].get(f) != signatures[f]]
+    stale = [f for f in state["files"] if f not in signatures or f in todo]
+
+    # 已并入 centroid 的旧特征不回滚，只撤销图片分配
+    old_groups = output_groups(state)
+    for f in stale:
+        embeddings.remove_image(f)
+        for images in state["groups"].values():
+            images.discard(f)
+    remove_materialized([
+        os.path.join(output_dir, f"role_{role}", f)
+        for role, images in old_groups.items() for f in stale if f in images
+    ])
+    embeddings.compact()
+
+    # ---- 近重复合并: 只对代表图做人脸推理 ----
+    dup_of = {}
+    if dedup and todo:
+        with span("dedup"):
+            _, dups = dedup_paths([os.path.join(input_dir, f) for f in todo])
+        dup_of = {os.path.basename(d): os.path.basename(r) for d, r in dups.items()}
+
+    # ---- 特征提取（裁剪缓存 / workers>1 时多进程），结果直接写入特征矩阵 ----
+    to_extract = [f for f in todo if f not in dup_of]
+    det_sizes = ADAPTIVE_DET_SIZES if adaptive_det else None
+    if crop_store_dir:
+        store = CropStore(crop_store_dir)
+        with span("crop_store_detect"):
+            store.add_images(store.missing(to_extract, input_dir), input_dir,
+                             progress_callback=progress_callback, det_sizes=det_sizes,
+                             det_threshold=DET_THRESHOLD)
+        with span("crop_store_embed"):
+            embed_from_store(
+                store, to_extract, embeddings, rec_model, det_threshold=DET_THRESHOLD,
+                progress_callback=progress_callback
+            )
+    else:
+        with span("extract_features", images=len(to_extract), workers=workers):
+            extract_all_features(
+                to_extract, input_dir, embeddings, workers, progress_callback, shot_mode, det_sizes, rec_model
+            )
+    for dup, rep in dup_of.items():
+        embeddings.add_alias(dup, rep)
+
+    # ---- 第一阶段: 在已有角色基础上建立/更新 centroid ----
+    with span("first_pass"):
+        centroids = first_pass_clustering(todo, input_dir, sim_threshold, embeddings, state)
+
+    # ---- 第二阶段: refine 聚类（准确度更高）----
+    with span("second_pass"):
+        new_groups = second_pass_assign(todo, input_dir, centroids, embeddings, sim_threshold)
+    for role, images in new_groups.items():
+        state["groups"][role] |= images
+
+    # ---- 角色库: 识别往期角色并增量入库（已命名的角色不再重复匹配）----
+    if library_dir:
+        tag = os.path.basename(os.path.normpath(input_dir))
+        unnamed = {r: imgs for r, imgs in state["groups"].items() if r not in state["names"]}
+        with span("character_library"):
+            state["names"].update(apply_character_library(
+                unnamed, centroids, embeddings, library_dir, tag
+            ))
+
+    state["files"] = signatures
+    with span("save_state"):
+        save_grouping_state(output_dir, state)
+
+    # 输出（未变化的文件跳过，增量模式下只落盘新图片）
+    final_groups = output_groups(state)
+    with span("materialize"):
+        stats = materialize([
+            (os.path.join(input_dir, img_name), os.path.join(output_dir, f"role_{role}", img_name))
+            for role, images in final_groups.items() for img_name in images
+        ], strategy=link_mode)
+    for used, n in stats.items():
+        count(f"files_{used}", n)
+
+    if manifest:
+        with span("manifest"):
+            manifest.add_faces(embeddings, file_list, "step2")
+            manifest.set_roles(final_groups, "step2")
+        manifest.close()
+
+    # 每个角色的图片按 “代表图在前、离群图在后” 排序，审核页面只需显示前几张
+    with span("exemplars"):
+        return order_role_images(final_groups, embeddings, exemplar_k)
+
+
+def group_from_embeddings(source, name_map, input_dir, output_dir, sim_threshold=0.55, link_mode="copy",
+                          exemplar_k=EXEMPLAR_K):
+    """
+    用已经算好的人脸特征（例如 Step 0 抽帧流水线的结果）直接分组，不再做人脸推理。
+    name_map = {source 中的名称: input_dir 中的文件名}。
+    写出的聚类状态与 group_roles 一致，之后在 Step 2 用增量模式打开同一 output_dir 会直接复用。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = new_grouping_state(sim_threshold)
+    embeddings = state["embeddings"]
+    for src, dst in name_map.items():
+        embeddings.copy_image(source, src, dst)
+
+    file_list = sorted(name_map.values(), key=natural_sort_key)
+    centroids = first_pass_clustering(file_list, input_dir, sim_threshold, embeddings, state)
+    for role, images in second_pass_assign(file_list, input_dir, centroids, embeddings, sim_threshold).items():
+        state["groups"][role] |= images
+    state["files"] = {f: file_signature(os.path.join(input_dir, f)) for f in file_list}
+    save_grouping_state(output_dir, state)
+
+    final_groups = output_groups(state)
+    materialize([
+        (os.path.join(input_dir, img_name), os.path.join(output_dir, f"role_{role}", img_name))
+        for role, images in final_groups.items() for img_name in images
+    ], strategy=link_mode)
+    return order_role_images(final_groups, embeddings, exemplar_k)
 
 
 # ------------------------------------------------
@@ -192,6 +514,72 @@ def run_step2():
     cache.set("output_dir", output_dir)
 
     sim_threshold = st.slider("Sim Threshold", 0.0, 1.0, 0.55, 0.05)
+    workers = st.number_input(
+        "Worker Processes (0/1 = single process)", 0, os.cpu_count() or 1,
+        cache.get("workers", 0)
+    )
+    cache.set("workers", workers)
+
+    library_dir = st.text_input(
+        "Character Library Directory (optional):", cache.get("library_dir", "")
+    )
+    cache.set("library_dir", library_dir)
+
+    incremental = st.checkbox(
+        "Incremental (only process new or changed images)", cache.get("incremental", False)
+    )
+    cache.set("incremental", incremental)
+
+    shot_mode = st.checkbox(
+        "Shot-aware analysis (track faces within cut(N.M) frames)", cache.get("shot_mode", False)
+    )
+    cache.set("shot_mode", shot_mode)
+
+    dedup = st.checkbox(
+        "Skip near-duplicate frames (perceptual hash)", cache.get("dedup", False)
+    )
+    cache.set("dedup", dedup)
+
+    adaptive_det = st.checkbox(
+        "Adaptive detection resolution (320 first, 640 for small or missed faces)",
+        cache.get("adaptive_det", False)
+    )
+    cache.set("adaptive_det", adaptive_det)
+
+    compact_embeddings = st.checkbox(
+        "Compact embeddings (float16 memory-mapped matrix in the output directory)",
+        cache.get("compact_embeddings", False)
+    )
+    cache.set("compact_embeddings", compact_embeddings)
+
+    crop_store_dir = st.text_input(
+        "Face Crop Cache Directory (optional, detect once and re-embed):",
+        cache.get("crop_store_dir", "")
+    )
+    cache.set("crop_store_dir", crop_store_dir)
+    rec_model = st.selectbox(
+        "Recognition Model", REC_MODELS,
+        index=REC_MODELS.index(cache.get("rec_model", model_name)),
+        help="-int8: dynamically quantized recognition model, compare with `python -m utils.quant_utils <labeled dir>`"
+    )
+    cache.set("rec_model", rec_model)
+
+    embed_socket = st.text_input(
+        "Embedding Server Socket (optional, start with `python -m utils.service_utils <path>`):",
+        cache.get("embed_socket", "")
+    )
+    cache.set("embed_socket", embed_socket)
+
+    link_mode = st.selectbox(
+        "Output Mode", STRATEGIES, index=STRATEGIES.index(cache.get("link_mode", "copy")),
+        help="hardlink/reflink/symlink avoid duplicating image data; manifest writes no image files"
+    )
+    cache.set("link_mode", link_mode)
+
+    exemplar_k = st.number_input(
+        "Exemplars shown per role (outliers on request)", 1, 200, cache.get("exemplar_k", EXEMPLAR_K)
+    )
+    cache.set("exemplar_k", exemplar_k)
 
     if "role_images" not in st.session_state:
         st.session_state.role_images = {}
@@ -200,10 +588,40 @@ def run_step2():
         if not os.path.exists(input_dir):
             st.error("Input directory does not exist")
         else:
-            st.session_state.role_images = group_roles(input_dir, output_dir, sim_threshold)
+            progress = st.progress(0.0, text="Extracting face features...")
+
+            def on_progress(done, total, elapsed):
+                rate = done / elapsed if elapsed > 0 else 0.0
+                progress.progress(done / total, text=f"Extracting {done}/{total} images ({rate:.1f} img/s)")
+
+            # 嵌入服务只对本次运行生效，其他会话不受影响
+            with trace_run("step2_grouping", output_dir) as tracer, embedding_server(embed_socket or None):
+                st.session_state.role_images = group_roles(
+                    input_dir, output_dir, sim_threshold,
+                    workers=int(workers), progress_callback=on_progress,
+                    library_dir=library_dir or None, incremental=incremental,
+                    link_mode=link_mode, shot_mode=shot_mode, dedup=dedup,
+                    crop_store_dir=crop_store_dir or None, rec_model=rec_model,
+                    adaptive_det=adaptive_det, compact_embeddings=compact_embeddings,
+                    exemplar_k=exemplar_k
+                )
+                st.session_state.role_images_k = exemplar_k
+            st.session_state["last_trace"] = tracer.result
             st.success("Grouping completed!")
 
+    # 代表图是最远点采样的前 K 张，K 改变后用保存的特征按新的 K 重新排序
+    if st.session_state.role_images and st.session_state.get("role_images_k", EXEMPLAR_K) != exemplar_k:
+        state = load_grouping_state(output_dir, sim_threshold, rec_model, compact_embeddings)
+        if state is not None:
+            st.session_state.role_images = order_role_images(
+                st.session_state.role_images, state["embeddings"], exemplar_k
+            )
+        else:
+            st.caption("No saved grouping state for these settings - run grouping again to re-rank exemplars.")
+        st.session_state.role_images_k = exemplar_k
+
     roles_to_delete = []
+    roles_to_rename = []
     for role, images in st.session_state.role_images.items():
         container = st.container()
         with container:
@@ -218,7 +636,49 @@ def run_step2():
                 container.empty()
                 continue
 
-            display_images(images, input_dir, container, IMAGES_PER_ROW)
+            if library_dir and role != "other":
+                name_col, btn_col = st.columns([4, 1])
+                new_name = name_col.text_input(
+                    "Library name", value=role, key=f"name_{role}", label_visibility="collapsed"
+                ).strip().replace(os.sep, "_")
+                if btn_col.button("Rename", key=f"rename_{role}") and new_name and new_name != role:
+                    roles_to_rename.append((role, new_name))
+
+            # 只显示前 exemplar_k 张代表图；离群图（与角色中心最不相似）按需逐页展开
+            display_images(images[:exemplar_k], input_dir, container, IMAGES_PER_ROW)
+            rest = images[exemplar_k:]
+            if rest:
+                shown_key = f"outliers_shown_{role}"
+                shown = st.session_state.get(shown_key, 0)
+                if shown:
+                    st.caption(f"Least similar to the role centre ({min(shown, len(rest))} of {len(rest)})")
+                    display_images(rest[::-1][:shown], input_dir, container, IMAGES_PER_ROW)
+                if shown < len(rest) and st.button(
+                    f"Show {min(exemplar_k, len(rest) - shown)} outliers", key=f"outliers_{role}"
+                ):
+                    st.session_state[shown_key] = shown + exemplar_k
+                    st.rerun()
 
     for role in roles_to_delete:
-        st.session_state.role_images.pop(role, None)
\ No newline at end of file
+        st.session_state.role_images.pop(role, None)
+
+    if roles_to_rename:
+        library = CharacterLibrary(library_dir)
+        state = load_grouping_state(output_dir, sim_threshold, rec_model, compact_embeddings)
+        for old, new in roles_to_rename:
+            library.rename(old, new)
+            if state is not None:
+                for label, name in list(state["names"].items()):
+                    if name == old:
+                        state["names"][label] = new
+                if old in state["groups"] and old not in state["names"]:
+                    state["names"][old] = new
+            move_role_dir(input_dir, output_dir, old, new, link_mode)
+            images = st.session_state.role_images.pop(old, [])
+            existing = st.session_state.role_images.get(new, [])
+            seen = set(existing)
+            st.session_state.role_images[new] = existing + [i for i in images if i not in seen]
+        library.save()
+        if state is not None:
+            save_grouping_state(output_dir, state)
+        st.rerun()
\ No newline at end of file
@@ -1,14 +1,107 @@
 # step3_prompt_check.py
 import os
-import re
+import hashlib
+import html
 import streamlit as st
 from utils import CacheManager
+from utils.media_utils import shot_index, media_url, public_media_host
+from utils.proxy_utils import generate_proxies
+from utils.subtitle_utils import parse_srt, cue_times, generate_cue_strips
+from utils.sprite_utils import read_sprite_map, image_data_uri, sprite_css, sprite_tile
 
 cache = CacheManager("step2_cache.pkl")  # Each page uses separate cache file
 
-def natural_sort_key(s):
-    """Sort strings with numbers in a natural order."""
-    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
+PAGE_SIZES = [5, 10, 20, 50]
+VIEW_MODES = ["Paginated", "One shot at a time"]
+CUE_SCALE = 1.0
+
+
+def render_cues(entry, content, stream_videos):
+    """Show one cue-aligned thumbnail per subtitle line, cut from a single cached sprite image."""
+    cues = parse_srt(content)
+    if not cues:
+        return
+    sprite_map = read_sprite_map(entry["cues_path"]) if entry["cues_path"] else None
+    if not sprite_map:
+        st.caption("No cue strip yet - use \"Build cue strips\" above.")
+        return
+    if sprite_map.get("times") != cue_times(cues):
+        st.caption("⚠️ Cue timings changed since the strip was built - rebuild to refresh the frames.")
+
+    src = media_url(entry["cues_path"]) if stream_videos else image_data_uri(entry["cues_path"])
+    css_class = "cues_" + hashlib.sha1(entry["cues_path"].encode("utf-8")).hexdigest()[:10]
+    rows = []
+    for cue, tile in zip(cues, sprite_map["tiles"]):
+        label = f"{cue['start']:.1f}s - {cue['end']:.1f}s"
+        rows.append(
+            f'<div style="display:flex;gap:8px;align-items:flex-start;margin-bottom:4px">'
+            f'{sprite_tile(css_class, tile, CUE_SCALE, label)}'
+            f'<div style="font-size:0.85em"><b>{label}</b><br>{html.escape(cue["text"]).replace(chr(10), "<br>")}</div>'
+            f'</div>'
+        )
+    st.markdown(
+        f'<style>{sprite_css(css_class, src, sprite_map, CUE_SCALE)}</style>'
+        f'<div style="max-height:360px;overflow-y:auto">{"".join(rows)}</div>',
+        unsafe_allow_html=True
+    )
+
+
+def render_shot(entry, stream_videos, use_proxies=True, show_cues=True):
+    """Render one text editor + video preview; text is read only for shots on screen."""
+    filename = entry["name"]
+    txt_path = entry["txt_path"]
+    # Prefer the low-res preview proxy, fall back to the original cut
+    video_path = (use_proxies and entry["proxy_path"]) or entry["video_path"]
+    poster_path = entry["poster_path"] if use_proxies else None
+
+    # Read file content
+    try:
+        with open(txt_path, "r", encoding="utf-8") as f:
+            content = f.read()
+    except Exception as e:
+        st.error(f"Error reading {filename}: {e}")
+        return
+
+    # Layout: Text editor + Video preview
+    cols = st.columns([3, 2])  # 3:2 ratio for text vs video
+
+    with cols[0]:
+        st.subheader(f"📄 Editor: `{filename}`")
+        new_content = st.text_area(
+            "File content:",
+            value=content,
+            height=300,
+            key=f"text_{filename}"
+        )
+
+        if st.button(f"💾 Save Changes", key=f"save_{filename}"):
+            try:
+                with open(txt_path, "w", encoding="utf-8") as f:
+                    f.write(new_content)
+                st.success(f"✅ `{filename}` saved successfully!")
+            except Exception as e:
+                st.error(f"❌ Failed to save `{filename}`: {e}")
+
+    with cols[1]:
+        st.subheader("🎬 Video Preview")
+        if video_path:
+            if stream_videos:
+                # A URL lets the browser fetch byte ranges on demand instead of Streamlit loading the whole file;
+                # preload="none" means only the poster is fetched until the reviewer presses play
+                poster = f' poster="{media_url(poster_path)}"' if poster_path else ""
+                st.markdown(
+                    f'<video src="{media_url(video_path)}"{poster} controls preload="none" width="100%"></video>',
+                    unsafe_allow_html=True
+                )
+            else:
+                st.video(video_path)
+            proxy_note = " (preview proxy)" if video_path == entry["proxy_path"] else ""
+            st.caption(f"Playing: `{os.path.basename(video_path)}`{proxy_note}")
+        else:
+            st.info("ⓘ No matching video file found for this text file.")
+        if show_cues and entry["video_path"]:
+            render_cues(entry, new_content, stream_videos)
+
 
 def run_step3():
     st.header("Step 3 - Prompt Verification")
@@ -16,11 +109,11 @@ def run_step3():
     # --- Input Fields ---
     with st.container():
         txt_folder = st.text_input(
-            "📂 Enter folder path for TXT/SRT files:", 
+            "📂 Enter folder path for TXT/SRT files:",
             value=cache.get("txt_folder", "")
         )
         video_folder = st.text_input(
-            "🎬 Enter folder path for video files:", 
+            "🎬 Enter folder path for video files:",
             value=cache.get("video_folder", "")
         )
         cache.set("txt_folder", txt_folder)
@@ -30,70 +123,99 @@ def run_step3():
         st.info("Please enter a valid folder path for TXT/SRT files to begin.")
         return
 
-    # --- File Discovery and Display ---
+    # --- File Discovery (cached by directory mtime) ---
     try:
-        text_files = [f for f in os.listdir(txt_folder) if f.lower().endswith((".txt", ".srt"))]
-        if not text_files:
+        index = shot_index(txt_folder, video_folder if os.path.isdir(video_folder or "") else None)
+        if not index:
             st.warning("⚠️ No TXT or SRT files found in the specified folder.")
             return
-        
-        text_files.sort(key=natural_sort_key)
-        
-        st.success(f"Found {len(text_files)} files.")
-        
+
+        st.success(f"Found {len(index)} files.")
+
     except Exception as e:
         st.error(f"❌ An error occurred while reading the folder: {e}")
         return
 
-    # --- Display All Files ---
-    video_exts = [".mp4", ".mov", ".avi", ".mkv", ".webm"]
-    
-    for filename in text_files:
-        st.markdown("---")
-        txt_path = os.path.join(txt_folder, filename)
-        
-        # Read file content
-        try:
-            with open(txt_path, "r", encoding="utf-8") as f:
-                content = f.read()
-        except Exception as e:
-            st.error(f"Error reading {filename}: {e}")
-            continue
-
-        # Find matching video file
-        video_path = None
-        if video_folder and os.path.isdir(video_folder):
-            name_without_ext = os.path.splitext(filename)[0]
-            for ext in video_exts:
-                candidate = os.path.join(video_folder, name_without_ext + ext)
-                if os.path.exists(candidate):
-                    video_path = candidate
-                    break
-        
-        # Layout: Text editor + Video preview
-        cols = st.columns([3, 2])  # 3:2 ratio for text vs video
-
-        with cols[0]:
-            st.subheader(f"📄 Editor: `{filename}`")
-            new_content = st.text_area(
-                "File content:",
-                value=content,
-                height=300,
-                key=f"text_{filename}"
+    # --- View Options ---
+    opt_cols = st.columns(5)
+    view_mode = opt_cols[0].radio(
+        "View", VIEW_MODES, index=VIEW_MODES.index(cache.get("view_mode", VIEW_MODES[0]))
+    )
+    cache.set("view_mode", view_mode)
+    # Streaming URLs only work in a browser that can reach the media server, so it stays off
+    # (st.video and inline cue strips) until MEDIA_PUBLIC_HOST names a host the reviewers can reach
+    public_host = public_media_host()
+    stream_videos = opt_cols[2].checkbox(
+        "Stream videos from a local media server",
+        cache.get("stream_videos", False) and bool(public_host),
+        disabled=not public_host,
+        help="Requires MEDIA_PUBLIC_HOST (the host name reviewers' browsers use) and usually MEDIA_BIND_HOST "
+             "(e.g. 0.0.0.0, exposes the files without authentication). Off: videos and cue strips are "
+             "sent through Streamlit"
+    )
+    if public_host:
+        cache.set("stream_videos", stream_videos)
+    use_proxies = opt_cols[3].checkbox(
+        "Use preview proxies", cache.get("use_proxies", True),
+        help="Low-bitrate copies in <video folder>/proxies, falls back to the original cut"
+    )
+    cache.set("use_proxies", use_proxies)
+    show_cues = opt_cols[4].checkbox(
+        "Subtitle-aligned frames", cache.get("show_cues", True),
+        help="One thumbnail per SRT cue, packed into <video folder>/proxies/<name>.cues.jpg"
+    )
+    cache.set("show_cues", show_cues)
+
+    if use_proxies and video_folder and os.path.isdir(video_folder):
+        # Use the cached index rather than stat-ing every proxy on each rerun
+        todo = [e["video_path"] for e in index if e["video_path"] and not (e["proxy_path"] and e["poster_path"])]
+        if todo and st.button(f"🎞️ Generate {len(todo)} missing preview proxies"):
+            progress = st.progress(0.0, text="Generating preview proxies...")
+            generate_proxies(todo, progress_callback=lambda done, total, _: progress.progress(
+                done / total, text=f"Generating preview proxies {done}/{total}"
+            ))
+            st.rerun()
+
+    if show_cues and video_folder and os.path.isdir(video_folder):
+        srts = [e for e in index if e["video_path"] and e["name"].lower().endswith(".srt")]
+        todo = [e for e in srts if not e["cues_path"]]
+        label = f"🖼️ Build {len(todo)} missing cue strips" if todo else f"🖼️ Rebuild cue strips ({len(srts)})"
+        if srts and st.button(label):
+            progress = st.progress(0.0, text="Building cue strips...")
+            # One sequential decode per video; the proxy is decoded when present (same timeline, far fewer pixels)
+            generate_cue_strips(
+                [(e["video_path"], e["txt_path"], e["proxy_path"]) for e in (todo or srts)],
+                progress_callback=lambda done, total, _: progress.progress(
+                    done / total, text=f"Building cue strips {done}/{total}"
+                )
             )
+            st.rerun()
 
-            if st.button(f"💾 Save Changes", key=f"save_{filename}"):
-                try:
-                    with open(txt_path, "w", encoding="utf-8") as f:
-                        f.write(new_content)
-                    st.success(f"✅ `{filename}` saved successfully!")
-                except Exception as e:
-                    st.error(f"❌ Failed to save `{filename}`: {e}")
-
-        with cols[1]:
-            st.subheader("🎬 Video Preview")
-            if video_path:
-                st.video(video_path)
-                st.caption(f"Playing: `{os.path.basename(video_path)}`")
-            else:
-                st.info("ⓘ No matching video file found for this text file.")
+    if view_mode == VIEW_MODES[0]:
+        page_size = opt_cols[1].selectbox(
+            "Shots per page", PAGE_SIZES, index=PAGE_SIZES.index(cache.get("page_size", 10))
+        )
+        cache.set("page_size", page_size)
+        num_pages = (len(index) + page_size - 1) // page_size
+        page = st.number_input(
+            f"Page (1-{num_pages})", 1, num_pages, min(cache.get("page", 1), num_pages)
+        )
+        cache.set("page", page)
+        shown = index[(page - 1) * page_size: page * page_size]
+    else:
+        names = [e["name"] for e in index]
+        current = cache.get("current_shot")
+        pos = names.index(current) if current in names else 0
+        nav = opt_cols[1].columns(2)
+        if nav[0].button("◀ Prev"):
+            pos = max(0, pos - 1)
+        if nav[1].button("Next ▶"):
+            pos = min(len(names) - 1, pos + 1)
+        pos = names.index(st.selectbox("Shot", names, index=pos))
+        cache.set("current_shot", names[pos])
+        shown = [index[pos]]
+
+    # --- Display Visible Shots Only ---
+    for entry in shown:
+        st.markdown("---")
+        render_shot(entry, stream_videos, use_proxies, show_cues)
@@ -0,0 +1,107 @@
+import os
+import shutil
+
+from utils.cache_utils import ArtifactCache, video_fingerprint, dir_size
+
+
+def _fill(path, size):
+    with open(os.path.join(path, "data.bin"), "wb") as f:
+        f.write(b"\0" * size)
+
+
+def test_get_reports_hits_and_check_failures(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    path, hit = cache.get("fp", "frames")
+    assert not hit
+    _fill(path, 10)
+    cache.commit("fp", "frames")
+    assert cache.get("fp", "frames") == (path, True)
+    assert cache.get("fp", "frames", check=lambda d: False) == (path, False)
+    assert not os.listdir(path)
+    kinds = cache.report()["kinds"]
+    assert kinds["frames"]["hits"] == 1 and kinds["frames"]["misses"] == 2
+
+
+def test_evicts_least_recently_used_first(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    paths = {}
+    for fp in ("a", "b", "c"):
+        paths[fp], _ = cache.get(fp, "frames")
+        _fill(paths[fp], 100)
+        cache.commit(fp, "frames")
+    cache.get("a", "frames")          # a 最近使用过
+    cache.budget = 250
+    assert cache.evict() == ["b/frames"]
+    assert not os.path.exists(paths["b"])
+    assert os.path.exists(paths["a"]) and os.path.exists(paths["c"])
+    assert not os.path.exists(os.path.join(cache.root, "b"))
+
+
+def test_pinned_entries_survive(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    path, _ = cache.get("a", "frames")
+    cache.pin("a", "frames", "session")
+    _fill(path, 100)
+    cache.budget = 10
+    assert cache.commit("a", "frames") == []
+    assert os.path.exists(path)
+    cache.unpin_owner("session")
+    assert cache.evict() == ["a/frames"]
+    assert not os.path.exists(path)
+
+
+def test_external_entries_without_files_are_kept(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    external = tmp_path / "cuts" / "proxies"
+    path, _ = cache.get("a", "proxies", path=str(external))
+    _fill(path, 100)
+    cache.budget = 10
+    assert cache.commit("a", "proxies") == []
+    assert os.path.exists(os.path.join(path, "data.bin"))
+    report = cache.report()
+    assert report["unevictable"] == ["a/proxies"] and report["total_bytes"] == 100
+    assert cache.get("a", "proxies", path=str(external), check=lambda d: False)[1] is False
+    assert os.path.exists(os.path.join(path, "data.bin"))
+
+
+def test_external_entries_evict_only_registered_files(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    external = tmp_path / "cuts" / "proxies"
+    path, _ = cache.get("a", "proxies", path=str(external))
+    proxy, cues = external / "cut(1).mp4", external / "cut(1).cues.jpg"
+    proxy.write_bytes(b"\0" * 100)
+    cues.write_bytes(b"\0" * 50)           # Step 3 写入的字幕条，不属于缓存
+    cache.commit("a", "proxies", files=[str(proxy)])
+    assert cache.report()["total_bytes"] == 100 and cache.report()["unevictable"] == []
+    assert cache.evict(budget=10) == ["a/proxies"]
+    assert not proxy.exists() and cues.exists()
+    assert cache.report()["entries"] == 0
+
+
+def test_undeletable_entries_are_not_counted_as_freed(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    for fp in ("a", "b"):
+        path, _ = cache.get(fp, "frames")
+        _fill(path, 100)
+        cache.commit(fp, "frames")
+    monkeypatch.setattr(shutil, "rmtree", lambda *a, **k: None)   # 例如文件被占用
+    assert cache.evict(budget=150) == []
+    assert cache.report()["total_bytes"] == 200
+
+
+def test_fingerprint_changes_with_content(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"a" * 1000)
+    first = video_fingerprint(str(video))
+    assert first.startswith("clip.mp4_") and video_fingerprint(str(video)) == first
+    video.write_bytes(b"b" * 1000)
+    assert video_fingerprint(str(video)) != first
+    assert dir_size(str(tmp_path)) == 1000
+
+
+def test_entry_pinned_by_get_survives_its_own_commit(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"), budget_gb=0)
+    path, _ = cache.get("a", "frames", owner="session")
+    _fill(path, 100)
+    assert cache.commit("a", "frames") == []
+    assert os.path.exists(os.path.join(path, "data.bin"))
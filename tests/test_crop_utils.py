@@ -0,0 +1,90 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import utils.crop_utils as crop_utils
+from utils.crop_utils import CropStore, embed_from_store
+from utils.embedding_utils import EmbeddingMatrix
+
+# insightface 112x112 对齐模板上的关键点，放大 2 倍后作为假检测结果
+_KPS = np.array([[38.3, 51.7], [73.5, 51.5], [56.0, 71.7], [41.5, 92.4], [70.7, 92.2]], np.float32) * 2
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    calls = []
+
+    def detect(img, face_model=None, det_sizes=None, det_threshold=None):
+        calls.append(det_threshold)
+        boxes = np.array([[40, 40, 200, 220], [0, 0, 10, 10]], np.float32)
+        return boxes, np.stack([_KPS, _KPS]), np.array([0.9, 0.5], np.float32), 320
+
+    class Rec:
+        def get_feat(self, crops):
+            return np.stack([np.full(512, float(c.mean()) + 1) for c in crops])
+
+    monkeypatch.setattr(crop_utils, "detect_boxes", detect)
+    monkeypatch.setattr(crop_utils, "load_recognition_model", lambda name: Rec())
+    return calls
+
+
+def _write_images(folder, names, value=100):
+    for name in names:
+        cv2.imwrite(os.path.join(folder, name), np.full((240, 240, 3), value, np.uint8))
+
+
+def test_store_passes_threshold_and_keeps_det_size_and_bbox(tmp_path, fake_models):
+    _write_images(tmp_path, ["a.jpg", "b.jpg"])
+    store = CropStore(str(tmp_path / "store"))
+    assert store.missing(["a.jpg", "b.jpg"], str(tmp_path)) == ["a.jpg", "b.jpg"]
+    store.add_images(["a.jpg", "b.jpg"], str(tmp_path), det_threshold=0.65)
+    assert fake_models == [0.65, 0.65]
+    assert store.missing(["a.jpg", "b.jpg"], str(tmp_path)) == []
+
+    crops, bbox, kps, scores, det_size = store.faces("a.jpg", det_threshold=0.65)
+    assert crops.shape == (1, 112, 112, 3) and det_size == 320
+    assert len(store.faces("a.jpg", det_threshold=0.3)[0]) == 2
+
+    embeddings = embed_from_store(store, ["a.jpg", "b.jpg"], EmbeddingMatrix(), det_threshold=0.65)
+    assert list(embeddings.det_sizes("a.jpg")) == [320]
+    assert list(embeddings.bboxes("a.jpg")[0]) == [40, 40, 200, 220]
+    assert not np.isnan(embeddings.qualities("b.jpg")).any()
+
+
+def test_superseded_segments_are_compacted(tmp_path, fake_models):
+    _write_images(tmp_path, ["a.jpg", "b.jpg"])
+    store = CropStore(str(tmp_path / "store"))
+    store.add_images(["a.jpg", "b.jpg"], str(tmp_path))
+    for value in (120, 140, 160):
+        _write_images(tmp_path, ["a.jpg"], value)
+        os.utime(tmp_path / "a.jpg", ns=(value * 10 ** 9, value * 10 ** 9))
+        store.add_images(store.missing(["a.jpg", "b.jpg"], str(tmp_path)), str(tmp_path))
+
+    assert len(store.segments) == 1
+    assert len(os.listdir(tmp_path / "store")) == 2
+    assert store.missing(["a.jpg", "b.jpg"], str(tmp_path)) == []
+    crops, bbox, _, _, det_size = store.faces("a.jpg", det_threshold=0.3)
+    assert len(crops) == 2 and det_size == 320
+    assert abs(float(crops[0].mean()) - 160) < 2
+
+    reloaded = CropStore(str(tmp_path / "store"))
+    assert sorted(reloaded.index) == ["a.jpg", "b.jpg"]
+    assert not reloaded.compact()
+
+
+def test_add_images_flushes_segments_and_compact_closes_memmaps(tmp_path, fake_models, monkeypatch):
+    monkeypatch.setattr(crop_utils, "STORE_FLUSH_FACES", 2)     # 每张图 2 张裁剪，每张图写一段
+    names = ["a.jpg", "b.jpg", "c.jpg"]
+    _write_images(tmp_path, names)
+    store = CropStore(str(tmp_path / "store"))
+    store.add_images(names, str(tmp_path))
+    assert len(store.segments) == 3
+    assert all(len(store.faces(n, det_threshold=0.3)[0]) == 2 for n in names)
+
+    old = [crops for crops, _ in store.segments]
+    assert store.compact(force=True)
+    assert all(crops._mmap.closed for crops in old)
+    assert len(store.segments) == 1 and len(os.listdir(tmp_path / "store")) == 2
+    assert sorted(store.index) == names
@@ -0,0 +1,99 @@
+import os
+import pickle
+
+import numpy as np
+
+from utils.embedding_utils import EmbeddingMatrix
+
+
+def _vec(i, dim=8):
+    v = np.zeros(dim, np.float32)
+    v[i % dim] = 2.0
+    return v
+
+
+def test_add_normalizes_and_tracks_rows():
+    m = EmbeddingMatrix(dim=8, capacity=2)
+    m.add_image("a", [_vec(0), _vec(1)], [{"score": 0.9, "det_size": 640, "bbox": [1, 2, 3, 4]}, {"score": 0.4}])
+    m.add_image("b", [_vec(2)], [0.7])
+    m.add_image("empty", [])
+    assert m.capacity >= 3
+    assert np.allclose(np.linalg.norm(m.matrix, axis=1), 1.0, atol=1e-4)
+    assert list(m.rows("a")) == [0, 1] and list(m.rows("empty")) == []
+    assert np.allclose(m.qualities("a"), [0.9, 0.4])
+    assert list(m.det_sizes("a")) == [640, 0]
+    assert list(m.bboxes("a")[0]) == [1, 2, 3, 4] and np.isnan(m.bboxes("a")[1]).all()
+    assert np.isnan(m.bboxes("b")).all()
+    assert "empty" in m and len(m) == 3
+
+
+def test_alias_and_compact_keep_live_rows():
+    m = EmbeddingMatrix(dim=8)
+    m.add_image("a", [_vec(0)], [{"score": 0.5, "det_size": 320, "bbox": [5, 5, 9, 9]}])
+    m.add_alias("a_dup", "a")
+    for i in range(3):
+        m.add_image("b", [_vec(i + 1)], [0.1 * (i + 1)])
+    m.remove_image("gone")
+    m.compact()
+    assert m.n == 2 and m.dead == 0
+    assert m.image_rows["a"] == m.image_rows["a_dup"]
+    assert np.allclose(m.features("b"), _vec(3) / 2)
+    assert np.allclose(m.qualities("b"), [0.3])
+    assert list(m.det_sizes("a")) == [320] and list(m.bboxes("a")[0]) == [5, 5, 9, 9]
+
+
+def test_memmap_roundtrip_and_copy(tmp_path):
+    path = str(tmp_path / "emb.f16")
+    m = EmbeddingMatrix(dim=8, dtype=np.float16, path=path, capacity=1)
+    for i in range(5):
+        m.add_image(f"img{i}", [_vec(i)], [{"score": 0.5, "det_size": 640, "bbox": [i, i, i + 1, i + 1]}])
+    restored = pickle.loads(pickle.dumps(m))
+    assert restored.matrix.dtype == np.float16
+    assert np.allclose(restored.features("img4"), _vec(4) / 2, atol=1e-3)
+
+    other = EmbeddingMatrix(dim=8)
+    other.copy_image(restored, "img3", "renamed")
+    assert list(other.det_sizes("renamed")) == [640]
+    assert list(other.bboxes("renamed")[0]) == [3, 3, 4, 4]
+
+
+def test_memmap_compact_closes_old_mapping(tmp_path):
+    path = str(tmp_path / "emb.f16")
+    m = EmbeddingMatrix(dim=8, dtype=np.float16, path=path, capacity=4)
+    for i in range(6):                                  # 容量不足时扩展，旧映射先关闭
+        m.add_image(f"img{i}", [_vec(i)])
+    grown = m.data
+    for i in range(4):
+        m.remove_image(f"img{i}")
+    m.compact()
+    assert grown._mmap.closed and not m.data._mmap.closed
+    assert sorted(os.listdir(tmp_path)) == ["emb.f16"] and m.n == 2
+    assert np.allclose(m.features("img5"), _vec(5) / 2, atol=1e-3)
+    m.close()
+    assert m.data is None
+
+
+def test_old_pickles_without_bbox_load():
+    m = EmbeddingMatrix(dim=8)
+    m.add_image("a", [_vec(0)], [0.5])
+    state = m.__getstate__()
+    del state["face_bbox"]
+    restored = EmbeddingMatrix.__new__(EmbeddingMatrix)
+    restored.__setstate__(state)
+    assert np.isnan(restored.bboxes("a")).all()
+    restored.add_image("b", [_vec(1)])
+    assert len(restored) == 2
+
+
+def test_image_det_size_recorded_without_faces():
+    m = EmbeddingMatrix(dim=8)
+    m.add_image("none", [], det_size=640)
+    m.add_image("a", [_vec(0)], [{"score": 0.9, "det_size": 320}])
+    m.add_alias("b", "none")
+    assert m.det_size("none") == 640 and m.det_size("a") == 320 and m.det_size("b") == 640
+    m.add_image("a", [_vec(1)], [0.5])      # 重新提取且没有尺寸信息时不沿用旧值
+    assert m.det_size("a") is None
+    m.remove_image("none")
+    assert m.det_size("none") is None and m.det_size("b") == 640
+    m.compact()
+    assert m.det_size("b") == 640
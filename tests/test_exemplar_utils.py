@@ -0,0 +1,51 @@
+import numpy as np
+
+from utils.embedding_utils import EmbeddingMatrix
+from utils.exemplar_utils import rank_exemplars, order_role_images
+
+
+def _arc(n, dim=8):
+    """单位圆上 -60°..60° 的一段弧，中心在 0°"""
+    angles = np.linspace(-np.pi / 3, np.pi / 3, n)
+    feats = np.zeros((n, dim), np.float32)
+    feats[:, 0], feats[:, 1] = np.cos(angles), np.sin(angles)
+    return feats
+
+
+def test_rank_starts_with_medoid_then_spreads_out():
+    feats = _arc(7)
+    order, sims = rank_exemplars(feats, np.ones(7), np.eye(8, dtype=np.float32)[0], k=3)
+    assert order[0] == 3                      # 中间那个点
+    assert set(order[1:3]) == {0, 6}          # 两端
+    assert sorted(order) == list(range(7))
+    rest = order[3:]
+    assert list(sims[rest]) == sorted(sims[rest], reverse=True)
+
+
+def test_rank_prefers_high_quality_when_far_apart():
+    feats = _arc(5)
+    quality = np.array([0.0, 1.0, 1.0, 1.0, 1.0])
+    order, _ = rank_exemplars(feats, quality, np.eye(8, dtype=np.float32)[0], k=2)
+    assert order[1] == 4
+
+
+def test_rank_stops_on_duplicates():
+    feats = np.repeat(_arc(1), 4, axis=0)
+    order, _ = rank_exemplars(feats, np.ones(4), feats[0], k=4)
+    assert sorted(order) == [0, 1, 2, 3]
+
+
+def test_order_role_images_uses_k():
+    feats = _arc(9)
+    embeddings = EmbeddingMatrix(dim=8, capacity=16)
+    names = [f"img_{i}.jpg" for i in range(9)]
+    for name, f in zip(names, feats):
+        embeddings.add_image(name, f[None], [1.0])
+    embeddings.add_image("no_face.jpg", np.zeros((0, 8)))
+
+    top3 = order_role_images({"1": names + ["no_face.jpg"]}, embeddings, k=3)["1"]
+    assert set(top3[:3]) == {"img_4.jpg", "img_0.jpg", "img_8.jpg"}
+    assert top3[-1] == "no_face.jpg"
+    top1 = order_role_images({"1": names}, embeddings, k=1)["1"]
+    assert top1[0] == "img_4.jpg"
+    assert set(top1[:3]) != set(top3[:3])
@@ -0,0 +1,57 @@
+import numpy as np
+
+from utils.face_utils import analyze_faces, detect_boxes
+
+
+class Det:
+    """按输入尺寸返回预设检测结果的假检测模型"""
+    input_size = (640, 640)
+
+    def __init__(self, results):
+        self.results = results
+        self.sizes = []
+
+    def detect(self, img, input_size=None, max_num=0, metric='default'):
+        size = input_size[0] if input_size else self.input_size[0]
+        self.sizes.append(size)
+        boxes = self.results.get(size, [])
+        if not boxes:
+            return np.zeros((0, 5), np.float32), None
+        return np.array(boxes, np.float32), np.zeros((len(boxes), 5, 2), np.float32)
+
+
+class Model:
+    def __init__(self, results):
+        self.det_model = Det(results)
+        self.models = {"detection": self.det_model}
+
+
+IMG = np.zeros((400, 400, 3), np.uint8)   # 小脸阈值：短边 20px
+
+
+def test_detect_boxes_stops_at_first_size_with_large_confident_face():
+    model = Model({320: [[0, 0, 100, 100, 0.9]], 640: [[0, 0, 100, 100, 0.9]]})
+    boxes, _, _, size = detect_boxes(IMG, model, (320, 640))
+    assert size == 320 and model.det_model.sizes == [320] and len(boxes) == 1
+
+
+def test_detect_boxes_escalates_for_small_or_unconfident_faces():
+    small = Model({320: [[0, 0, 10, 10, 0.9]], 640: [[0, 0, 12, 12, 0.9], [50, 50, 60, 60, 0.8]]})
+    boxes, _, _, size = detect_boxes(IMG, small, (320, 640))
+    assert size == 640 and small.det_model.sizes == [320, 640] and len(boxes) == 2
+
+    weak = Model({320: [[0, 0, 100, 100, 0.3]]})
+    boxes, _, _, size = detect_boxes(IMG, weak, (320, 640))
+    assert size == 640 and weak.det_model.sizes == [320, 640] and len(boxes) == 0
+
+
+def test_detect_boxes_without_sizes_uses_prepared_size():
+    model = Model({640: [[0, 0, 100, 100, 0.9]]})
+    assert detect_boxes(IMG, model)[3] == 640 and model.det_model.sizes == [640]
+
+
+def test_analyze_faces_records_det_size_for_image_without_faces():
+    model = Model({})
+    feats, qualities, size = analyze_faces("unused.jpg", face_model=model, img=IMG, det_sizes=(320, 640))
+    assert feats == [] and qualities == [] and size == 640
+    assert analyze_faces("missing.jpg", face_model=model) == ([], [], None)
@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+
+from utils.hash_utils import HammingIndex, hamming, dedup_paths, dhash_batch
+
+
+def test_hamming_counts_bits():
+    assert hamming(0, 0b1011) == 3
+    assert hamming(np.uint64(2**64 - 1), 0) == 64
+    assert list(hamming(np.array([1, 3], dtype=np.uint64), 0)) == [1, 2]
+
+
+def test_index_handles_top_bit_hashes():
+    index = HammingIndex(max_distance=5)
+    high = 2**63 | 0x0F0F0F0F
+    a = index.add(high)
+    b = index.add(np.uint64(2**64 - 1))
+    assert index.query(high) == [(a, 0)]
+    assert index.query(high ^ 0b111) == [(a, 3)]
+    assert index.query(np.uint64(2**64 - 1) ^ np.uint64(1 << 63)) == [(b, 1)]
+    assert index.query(0) == []
+
+
+def test_index_finds_everything_within_distance():
+    rng = np.random.default_rng(0)
+    hashes = [int(h) for h in rng.integers(0, 2**64, size=200, dtype=np.uint64)]
+    index = HammingIndex(max_distance=5)
+    for h in hashes:
+        index.add(h)
+    for i, h in enumerate(hashes[:20]):
+        flipped = h
+        for bit in rng.choice(64, size=5, replace=False):
+            flipped ^= 1 << int(bit)
+        assert (i, 5) in index.query(flipped)
+
+
+def test_dhash_is_stable_under_small_noise():
+    rng = np.random.default_rng(1)
+    img = rng.integers(0, 255, size=(90, 160), dtype=np.uint8)
+    noisy = np.clip(img.astype(int) + rng.integers(-3, 4, size=img.shape), 0, 255).astype(np.uint8)
+    a, b = dhash_batch([img, noisy])
+    assert hamming(a, b) <= 5
+
+
+def test_dedup_paths_groups_within_scene(tmp_path):
+    rng = np.random.default_rng(2)
+    base = cv2.resize(rng.integers(0, 255, size=(9, 16, 3), dtype=np.uint8), (320, 180))
+    other = cv2.resize(rng.integers(0, 255, size=(9, 16, 3), dtype=np.uint8), (320, 180))
+    paths = []
+    for name, img in (("a", base), ("b", base), ("c", other), ("d", base)):
+        path = str(tmp_path / f"{name}.jpg")
+        cv2.imwrite(path, img)
+        paths.append(path)
+    reps, dups = dedup_paths(paths, group_keys=[1, 1, 1, 2])
+    assert reps == [paths[0], paths[2], paths[3]]
+    assert dups == {paths[1]: paths[0]}
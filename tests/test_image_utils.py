@@ -0,0 +1,59 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from utils import image_utils
+from utils.image_utils import iter_images, image_clarity
+
+
+def test_yields_in_input_order_despite_decode_times(tmp_path, monkeypatch):
+    paths = [str(tmp_path / f"{i}.png") for i in range(8)]
+    for i, p in enumerate(paths):
+        cv2.imwrite(p, np.full((4, 4, 3), i, np.uint8))
+    real = cv2.imread
+
+    def slow_imread(path, *args):
+        time.sleep(0.02 * (8 - int(path[-5])))     # 前面的图解码最慢
+        return real(path, *args)
+
+    monkeypatch.setattr(image_utils.cv2, "imread", slow_imread)
+    out = list(iter_images(paths, num_threads=4, max_ahead=4))
+    assert [p for p, _ in out] == paths
+    assert [int(img[0, 0, 0]) for _, img in out] == list(range(8))
+
+
+def test_prefetch_is_bounded(tmp_path, monkeypatch):
+    started = []
+    lock = threading.Lock()
+
+    def fake_imread(path, *args):
+        with lock:
+            started.append(path)
+        return np.zeros((2, 2, 3), np.uint8)
+
+    monkeypatch.setattr(image_utils.cv2, "imread", fake_imread)
+    gen = iter_images([f"{i}.jpg" for i in range(20)], num_threads=2, max_ahead=3)
+    next(gen)
+    time.sleep(0.05)
+    assert len(started) <= 4      # 已提交 max_ahead 张，取走一张后再补一张
+    assert len(list(gen)) == 19
+
+
+def test_unreadable_images_yield_none(tmp_path):
+    bad = tmp_path / "bad.jpg"
+    bad.write_bytes(b"not a jpeg")
+    good = tmp_path / "good.png"
+    cv2.imwrite(str(good), np.zeros((4, 4, 3), np.uint8))
+    out = dict(iter_images([str(bad), str(tmp_path / "missing.jpg"), str(good)]))
+    assert out[str(bad)] is None and out[str(tmp_path / "missing.jpg")] is None
+    assert out[str(good)].shape == (4, 4, 3)
+    assert list(iter_images([])) == []
+
+
+def test_image_clarity_range():
+    flat = np.full((64, 64), 128, np.uint8)
+    noisy = np.random.default_rng(0).integers(0, 255, (64, 64), dtype=np.uint8)
+    assert image_clarity(None) == 0.3
+    assert image_clarity(flat) == 0.05 and image_clarity(noisy) == 1.0
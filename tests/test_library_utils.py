@@ -0,0 +1,75 @@
+import numpy as np
+
+from utils.library_utils import CharacterLibrary, EMB_DIM, MAX_EXEMPLARS
+
+
+def _ids(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, EMB_DIM)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def _faces(base, k, seed):
+    """同一身份的 k 张脸：与 base 的相似度约 0.8，彼此不算近重复"""
+    rng = np.random.default_rng(seed)
+    return base + rng.normal(scale=0.033, size=(k, EMB_DIM)).astype(np.float32)
+
+
+def _filled(tmp_path, n_ids=30, k=6):
+    lib = CharacterLibrary(str(tmp_path / "lib"))
+    bases = _ids(n_ids)
+    for i, b in enumerate(bases):
+        lib.add(f"c{i}", _faces(b, k, seed=100 + i))
+    return lib, bases
+
+
+def test_empty_library_matches_nothing(tmp_path):
+    lib = CharacterLibrary(str(tmp_path / "lib"))
+    assert len(lib) == 0
+    assert lib.match(_ids(2)) == [(None, 0.0), (None, 0.0)]
+
+
+def test_ivf_trained_and_recalls_known_characters(tmp_path):
+    lib, bases = _filled(tmp_path)
+    assert len(lib.vectors) < 2 * lib.trained_size      # 样本数翻倍才重训
+    assert len(lib.coarse) == int(np.sqrt(lib.trained_size))
+    queries = np.vstack([_faces(b, 1, seed=1000 + i) for i, b in enumerate(bases)])
+    names = [name for name, _ in lib.match(queries)]
+    assert names == [f"c{i}" for i in range(len(bases))]
+
+
+def test_unknown_faces_fall_below_threshold(tmp_path):
+    lib, _ = _filled(tmp_path)
+    for name, sim in lib.match(_ids(5, seed=7)):
+        assert name is None and sim < 0.5
+
+
+def test_near_duplicates_and_exemplar_cap(tmp_path):
+    lib = CharacterLibrary(str(tmp_path / "lib"))
+    base = _ids(1)
+    lib.add("a", np.repeat(base, 5, axis=0))
+    assert len(lib.vectors) == 1 and lib.counts == [5]
+    lib.add("a", _faces(base[0], MAX_EXEMPLARS + 10, seed=3))
+    assert int((lib.owner == 0).sum()) == MAX_EXEMPLARS
+
+
+def test_save_load_roundtrip(tmp_path):
+    lib, bases = _filled(tmp_path)
+    lib.save()
+    again = CharacterLibrary(lib.library_dir)
+    assert again.names == lib.names and again.trained_size == lib.trained_size
+    queries = np.vstack([_faces(b, 1, seed=2000 + i) for i, b in enumerate(bases)])
+    assert [n for n, _ in again.match(queries)] == [n for n, _ in lib.match(queries)]
+
+
+def test_rename_merges_and_remove_reindexes(tmp_path):
+    lib, bases = _filled(tmp_path, n_ids=4, k=3)
+    lib.rename("c1", "c0")
+    assert lib.names == ["c0", "c2", "c3"]
+    assert lib.match(_faces(bases[1], 1, seed=9))[0][0] == "c0"
+
+    lib.remove("c2")
+    assert lib.names == ["c0", "c3"] and set(lib.owner.tolist()) == {0, 1}
+    assert len(lib.centroids) == 2
+    assert lib.match(_faces(bases[3], 1, seed=9))[0][0] == "c3"
+    assert lib.match(_faces(bases[2], 1, seed=9))[0][0] is None
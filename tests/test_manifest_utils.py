@@ -0,0 +1,92 @@
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from utils.embedding_utils import EmbeddingMatrix
+from utils.manifest_utils import RunManifest, find_manifest, list_images, MANIFEST_DB
+
+
+def _manifest(tmp_path):
+    m = RunManifest(str(tmp_path / "proj"))
+    m.add_scene_rows("v.mp4", [(1, 0, 40, 0.0, 1.6), (2, 40, 100, 1.6, 4.0)])
+    m.add_frames([
+        ("f/1_0.jpg", "v.mp4", 1, 0, 0.0),
+        ("f/1_38.jpg", "v.mp4", 1, 38, 1.52),
+        ("f/2_40.jpg", "v.mp4", 2, 40, 1.6),
+    ])
+    return m
+
+
+def test_scenes_frames_and_column_whitelist(tmp_path):
+    m = _manifest(tmp_path)
+    assert m.scene_count("v.mp4") == 2
+    assert m.frames_in_scenes("v.mp4", 2, 2) == [(2, "f/2_40.jpg")]
+    batches = list(m.iter_rows("frames", ("path",), order_by=("frame_index",), batch_size=2, video="v.mp4"))
+    assert [len(b) for b in batches] == [2, 1]
+    with pytest.raises(ValueError):
+        m.frames(("path; DROP TABLE frames",))
+
+
+def test_selected_files_follow_latest_selection(tmp_path):
+    m = _manifest(tmp_path)
+    sel = tmp_path / "sel"
+    sel.mkdir()
+    (sel / "cut(1.1).jpg").write_bytes(b"x")
+    m.set_selected([("f/1_0.jpg", str(sel / "cut(1.1).jpg"))])
+    m.set_selected([("f/1_38.jpg", str(sel / "cut(1.1).jpg"))])   # 同名覆盖
+    assert m.frames(("path",), selected_name="cut(1.1).jpg") == [("f/1_38.jpg",)]
+    assert m.selected_files(str(sel)) == ["cut(1.1).jpg"]
+
+
+def test_list_images_merges_unregistered_files(tmp_path):
+    m = _manifest(tmp_path)
+    sel = tmp_path / "proj" / "selected"
+    sel.mkdir()
+    for name in ("cut(2).jpg", "cut(1).jpg", "dropped_in.png", "notes.txt"):
+        (sel / name).write_bytes(b"x")
+    m.set_selected([("f/2_40.jpg", str(sel / "cut(2).jpg")), ("f/1_0.jpg", str(sel / "cut(1).jpg")),
+                    ("f/1_38.jpg", str(sel / "deleted.jpg"))])
+    listed = list_images(str(sel), m)
+    assert sorted(listed[:2]) == ["cut(1).jpg", "cut(2).jpg"] and listed[2:] == ["dropped_in.png"]
+    assert list_images(str(sel)) == ["cut(1).jpg", "cut(2).jpg", "dropped_in.png"]
+    assert list_images(str(sel), find_manifest(str(sel))) == list_images(str(sel), m)
+
+
+def test_add_faces_uses_qualities_then_matrix_bbox(tmp_path):
+    m = _manifest(tmp_path)
+    emb = EmbeddingMatrix(dim=4)
+    emb.add_image("a.jpg", np.eye(4, dtype=np.float32)[:2],
+                  [{"score": 0.9, "det_size": 640, "bbox": [1, 2, 3, 4]}, {"score": 0.5}])
+    m.add_faces(emb, ["a.jpg"], "step2")
+    rows = m.faces(("face_idx", "quality", "det_size", "bbox"), image="a.jpg", stage="step2")
+    assert rows[0][0] == 0 and rows[0][1] == pytest.approx(0.9) and rows[0][2] == 640
+    assert json.loads(rows[0][3]) == [1, 2, 3, 4]
+    assert rows[1][3] is None
+
+    m.add_faces(emb, ["a.jpg"], "step2", qualities={"a.jpg": [{"bbox": [9, 9, 9, 9]}, {"bbox": None}]})
+    assert [r[0] for r in m.faces(("bbox",), image="a.jpg", stage="step2")] == [json.dumps([9, 9, 9, 9]), None]
+
+
+def test_reset_video_and_roles(tmp_path):
+    m = _manifest(tmp_path)
+    m.set_roles({"A": ["f/1_0.jpg"], "B": ["f/2_40.jpg"]}, "step2")
+    m.set_roles({"A": ["f/1_0.jpg"]}, "step2")
+    assert m.roles(stage="step2") == [("f/1_0.jpg", "A")]
+    m.reset_video("v.mp4")
+    assert m.scene_count("v.mp4") == 0 and m.frames() == [] and m.roles() == []
+
+
+def test_find_manifest_and_migration(tmp_path):
+    proj = tmp_path / "proj"
+    proj.mkdir()
+    conn = sqlite3.connect(str(proj / MANIFEST_DB))
+    conn.execute("CREATE TABLE faces (image TEXT, face_idx INTEGER, emb_row INTEGER, stage TEXT)")
+    conn.commit()
+    conn.close()
+    (proj / "frames" / "selected").mkdir(parents=True)
+    m = find_manifest(str(proj / "frames" / "selected"))
+    assert m is not None and m.project_dir == str(proj)
+    assert m.faces(("det_size", "bbox")) == []
+    assert find_manifest(str(tmp_path / "elsewhere")) is None
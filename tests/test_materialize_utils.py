@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils.materialize_utils import (
+    materialize, place_file, read_manifest, remove_materialized, write_frames, FRAMES_INDEX
+)
+
+
+def _src(tmp_path, n=3):
+    src_dir = tmp_path / "src"
+    src_dir.mkdir()
+    paths = []
+    for i in range(n):
+        p = src_dir / f"{i}.jpg"
+        p.write_bytes(bytes([i]) * 100)
+        paths.append(str(p))
+    return paths
+
+
+@pytest.mark.parametrize("strategy", ["copy", "hardlink", "symlink"])
+def test_materialize_places_and_skips(tmp_path, strategy):
+    srcs = _src(tmp_path)
+    pairs = [(s, str(tmp_path / "out" / os.path.basename(s))) for s in srcs]
+    assert materialize(pairs, strategy) == {strategy: 3}
+    for s, d in pairs:
+        assert open(d, "rb").read() == open(s, "rb").read()
+    assert materialize(pairs, strategy) == {"skipped": 3}
+
+
+def test_reflink_falls_back_to_copy(tmp_path):
+    src = _src(tmp_path, 1)[0]
+    assert place_file(src, str(tmp_path / "dst.jpg"), "reflink") in ("reflink", "copy")
+
+
+def test_hardlink_copy_fallback_is_skipped_next_time(tmp_path, monkeypatch):
+    src = _src(tmp_path, 1)[0]
+    dst = str(tmp_path / "dst.jpg")
+
+    def cross_device(a, b):
+        raise OSError(18, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    assert place_file(src, dst, "hardlink") == "copy"
+    assert place_file(src, dst, "hardlink") == "skipped"
+    with open(src, "ab") as f:
+        f.write(b"changed")
+    assert place_file(src, dst, "hardlink") == "copy"
+
+
+def test_manifest_strategy_and_removal(tmp_path):
+    srcs = _src(tmp_path)
+    out = tmp_path / "out"
+    pairs = [(s, str(out / f"f{i}.jpg")) for i, s in enumerate(srcs)]
+    assert materialize(pairs, "manifest") == {"manifest": 3}
+    assert read_manifest(str(out)) == {f"f{i}.jpg": os.path.abspath(s) for i, s in enumerate(srcs)}
+    assert not os.path.exists(out / "f0.jpg")
+    remove_materialized([str(out / "f0.jpg")])
+    assert set(read_manifest(str(out))) == {"f1.jpg", "f2.jpg"}
+
+
+def test_unknown_strategy_raises():
+    with pytest.raises(ValueError):
+        materialize([], "teleport")
+
+
+def test_write_frames_skips_unchanged(tmp_path):
+    img = np.zeros((8, 8, 3), dtype=np.uint8)
+    out = str(tmp_path / "frames")
+    items = [("a.jpg", "v:1", img), ("b.jpg", "v:2", img)]
+    assert write_frames(items, out) == {"written": 2, "skipped": 0}
+    assert os.path.exists(os.path.join(out, FRAMES_INDEX))
+    items[1] = ("b.jpg", "v:3", img)
+    assert write_frames(items, out) == {"written": 1, "skipped": 1}
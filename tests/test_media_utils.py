@@ -0,0 +1,47 @@
+import urllib.request
+from urllib.error import HTTPError
+
+import pytest
+
+from utils.media_utils import media_url, public_media_host, start_media_server, MEDIA_BIND_ENV, MEDIA_HOST_ENV
+
+
+def _get(url, headers=None):
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=5)
+
+
+def test_server_binds_loopback_only(monkeypatch):
+    monkeypatch.delenv(MEDIA_BIND_ENV, raising=False)
+    assert start_media_server().server_address[0] == "127.0.0.1"
+
+
+def test_range_request_without_cors(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(bytes(range(256)) * 4)
+    with _get(media_url(str(path)), {"Range": "bytes=10-19"}) as r:
+        assert r.status == 206
+        assert r.headers["Content-Range"] == "bytes 10-19/1024"
+        assert r.headers.get("Access-Control-Allow-Origin") is None
+        assert r.read() == bytes(range(10, 20))
+    with _get(media_url(str(path)), {"Range": "bytes=-4"}) as r:
+        assert r.read() == bytes(range(252, 256))
+
+
+def test_unregistered_and_escaping_paths_are_rejected(tmp_path):
+    (tmp_path / "a.mp4").write_bytes(b"x")
+    url = media_url(str(tmp_path / "a.mp4"))
+    base = url.rsplit("/", 1)[0]
+    for bad in (base + "/../secret.txt", url.replace(base.rsplit("/", 1)[1], "0" * 16)):
+        with pytest.raises(HTTPError) as e:
+            _get(bad)
+        assert e.value.code == 404
+
+
+def test_public_host_controls_url(tmp_path, monkeypatch):
+    path = str(tmp_path / "clip.mp4")
+    monkeypatch.delenv(MEDIA_HOST_ENV, raising=False)
+    assert public_media_host() is None
+    assert media_url(path).startswith("http://127.0.0.1:")
+    monkeypatch.setenv(MEDIA_HOST_ENV, "review.local")
+    assert public_media_host() == "review.local"
+    assert media_url(path).startswith("http://review.local:")
@@ -0,0 +1,56 @@
+import numpy as np
+
+from utils.packet_utils import candidate_cuts, candidate_windows, scenes_from_cuts, _thin
+
+
+def _stats(n=300, gop=50, fps=25.0):
+    sizes = np.full(n, 2000.0)
+    keys = np.zeros(n, dtype=bool)
+    keys[::gop] = True
+    sizes[keys] = 20000
+    return {"fps": fps, "sizes": sizes, "keys": keys}
+
+
+def test_steady_stream_has_no_candidates():
+    idx, _ = candidate_cuts(_stats())
+    assert len(idx) == 0
+
+
+def test_irregular_keyframe_and_size_spike_are_candidates():
+    stats = _stats()
+    stats["keys"][120] = True           # 编码器在切换处插入的 I 帧
+    stats["sizes"][120] = 20000
+    stats["sizes"][210] = 9000          # 非关键帧突然变大
+    idx, scores = candidate_cuts(stats)
+    found = dict(zip(idx.tolist(), scores.tolist()))
+    assert found[120] == np.inf
+    assert 210 in found and found[210] > 3
+
+
+def test_inserted_keyframe_does_not_shift_the_gop_cadence():
+    stats = _stats()
+    stats["keys"][120] = True
+    stats["sizes"][120] = 20000
+    idx, scores = candidate_cuts(stats)
+    assert idx.tolist() == [120] and scores[0] == np.inf
+
+
+def test_cadence_restarting_at_inserted_keyframe_is_regular():
+    stats = _stats()
+    stats["keys"][:] = False
+    stats["keys"][[0, 50, 100, 120, 170, 220, 270]] = True     # 编码器在 120 处重新计数
+    stats["sizes"][stats["keys"]] = 20000
+    stats["sizes"][~stats["keys"]] = 2000
+    idx, _ = candidate_cuts(stats)
+    assert idx.tolist() == [120]
+
+
+def test_windows_merge_and_thin():
+    assert candidate_windows([10, 30, 200], total_frames=210, pad=15) == [(0, 46), (185, 210)]
+    assert _thin([0, 40, 45, 70], min_len=15) == [40, 70]
+
+
+def test_scenes_from_cuts():
+    assert scenes_from_cuts([], 100, 25.0) == []
+    scenes = scenes_from_cuts([40, 70], 100, 25.0)
+    assert [(s.get_frames(), e.get_frames()) for s, e in scenes] == [(0, 40), (40, 70), (70, 100)]
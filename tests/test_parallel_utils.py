@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+
+from utils.embedding_utils import EmbeddingMatrix
+from utils.parallel_utils import extract_features_parallel
+from utils.service_utils import EmbeddingServer, StubBackend, embedding_server
+
+
+def test_spawn_pool_returns_embeddings_per_image(tmp_path):
+    names = [f"cut({i}).png" for i in range(7)]
+    for i, name in enumerate(names):
+        img = np.random.default_rng(i).integers(0, 255, size=(40, 60, 3), dtype=np.uint8)
+        cv2.imwrite(str(tmp_path / name), img)
+    (tmp_path / "broken.png").write_bytes(b"not an image")   # 解码失败：没有人脸
+    names.append("broken.png")
+
+    server = EmbeddingServer(str(tmp_path / "e.sock"), backend=StubBackend()).start()
+    progress = []
+    try:
+        with embedding_server(server.socket_path):
+            embeddings = extract_features_parallel(
+                names, str(tmp_path), EmbeddingMatrix(), workers=2, chunk_size=3,
+                progress_callback=lambda done, total, _: progress.append((done, total))
+            )
+    finally:
+        server.stop()
+
+    stub = StubBackend()
+    for name in names[:-1]:
+        expected, _, _ = stub.process([(cv2.imread(str(tmp_path / name)), {})])[0]
+        feats = embeddings.features(name)
+        assert feats.shape == (1, 512) and np.allclose(feats[0], expected[0], atol=1e-5)
+        assert list(embeddings.det_sizes(name)) == [0]
+    assert len(embeddings.features("broken.png")) == 0
+    # 各图片的行连续且互不重叠（共享内存结果按 chunk 内顺序切片）
+    rows = [int(embeddings.rows(n)[0]) for n in names[:-1]]
+    assert sorted(rows) == list(range(len(rows)))
+    assert [d for d, _ in progress] == sorted(d for d, _ in progress) and progress[-1] == (8, 8)
+    assert sum(server.backend.calls) == 7
@@ -0,0 +1,60 @@
+import threading
+
+import numpy as np
+
+from utils.face_utils import use_embedding_client
+from utils.manifest_utils import RunManifest
+from utils.pipeline_utils import FacePipeline
+from utils.service_utils import InProcessClient
+from utils.trace_utils import trace_run
+
+
+def _img(seed):
+    return np.random.default_rng(seed).integers(0, 255, size=(32, 32, 3), dtype=np.uint8)
+
+
+class Client(InProcessClient):
+    """可以阻塞、也可以对指定名称报错的进程内客户端"""
+
+    def __init__(self, fail_seed=None):
+        super().__init__()
+        self.gate = threading.Event()
+        self.gate.set()
+        self.fail = None if fail_seed is None else _img(fail_seed)
+
+    def analyze_faces(self, img, *args):
+        self.gate.wait(5)
+        if self.fail is not None and np.array_equal(img, self.fail):
+            raise ValueError("bad frame")
+        return super().analyze_faces(img, *args)
+
+
+def test_pipeline_uses_caller_client_and_records_faces(tmp_path):
+    manifest = RunManifest(str(tmp_path / "proj"))
+    with trace_run("step0") as tracer, use_embedding_client(Client(fail_seed=2)):
+        pipeline = FacePipeline(manifest=manifest)
+        for i in range(4):
+            pipeline.submit(f"f{i}.jpg", _img(i))
+        embeddings = pipeline.close()
+    assert [len(embeddings.features(f"f{i}.jpg")) for i in (0, 1, 3)] == [1, 1, 1]
+    assert "f2.jpg" not in embeddings and pipeline.errors == {"f2.jpg": "bad frame"}
+    assert embeddings.det_size("f0.jpg") == 0
+    assert sorted(r[0] for r in manifest.faces(("image",), stage="step0")) == ["f0.jpg", "f1.jpg", "f3.jpg"]
+    assert tracer.counters["pipeline_frames"] == 4
+
+
+def test_submit_blocks_when_queue_is_full():
+    client = Client()
+    client.gate.clear()
+    with use_embedding_client(client):
+        pipeline = FacePipeline(maxsize=1)
+        pipeline.submit("a.jpg", _img(0))          # 被后台线程取走后阻塞在 gate
+        pipeline.submit("b.jpg", _img(1))          # 占满队列
+        blocked = threading.Thread(target=pipeline.submit, args=("c.jpg", _img(2)))
+        blocked.start()
+        blocked.join(0.3)
+        assert blocked.is_alive()
+        client.gate.set()
+        blocked.join(5)
+        embeddings = pipeline.close()
+    assert not blocked.is_alive() and len(embeddings) == 3
@@ -0,0 +1,67 @@
+import os
+
+from utils import proxy_utils
+from utils.proxy_utils import make_proxy, missing_proxies, proxy_paths
+
+
+def _video(tmp_path, name="cut(1).mp4", mtime=1000):
+    path = tmp_path / name
+    path.write_bytes(b"video")
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def _touch(path, mtime):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    os.utime(path, (mtime, mtime))
+
+
+def _fake_ffmpeg(monkeypatch, calls):
+    """记录调用并直接写出临时文件，代替真正的 ffmpeg"""
+    class Result:
+        returncode, stderr = 0, ""
+
+    def run(cmd, **kwargs):
+        calls.append(cmd[-1])
+        _touch(cmd[-1], 2000)
+        return Result()
+
+    monkeypatch.setattr(proxy_utils.shutil, "which", lambda name: "/usr/bin/" + name)
+    monkeypatch.setattr(proxy_utils.subprocess, "run", run)
+
+
+def test_proxy_paths_live_in_proxies_dir(tmp_path):
+    proxy, poster = proxy_paths(str(tmp_path / "cut(3).mp4"))
+    assert proxy == str(tmp_path / "proxies" / "cut(3).mp4")
+    assert poster == str(tmp_path / "proxies" / "cut(3).jpg")
+
+
+def test_missing_proxies_checks_both_files_and_mtime(tmp_path):
+    fresh, stale, half = (_video(tmp_path, f"cut({i}).mp4") for i in (1, 2, 3))
+    for path in proxy_paths(fresh):
+        _touch(path, 1500)
+    for path in proxy_paths(stale):
+        _touch(path, 500)                       # 比源视频旧
+    _touch(proxy_paths(half)[0], 1500)          # 海报缺失
+    assert missing_proxies([fresh, stale, half]) == [stale, half]
+
+
+def test_make_proxy_skips_up_to_date_outputs(tmp_path, monkeypatch):
+    calls = []
+    _fake_ffmpeg(monkeypatch, calls)
+    video = _video(tmp_path)
+    proxy, poster = proxy_paths(video)
+    _touch(proxy, 1500)
+    assert make_proxy(video) == (proxy, poster)
+    assert calls == [poster + ".part.jpg"]      # 只补生成缺失的海报
+    assert make_proxy(video) == (proxy, poster) and len(calls) == 1
+    make_proxy(video, force=True)
+    assert len(calls) == 3
+    assert not [n for n in os.listdir(os.path.dirname(proxy)) if ".part" in n]
+
+
+def test_make_proxy_without_ffmpeg_returns_none(tmp_path, monkeypatch):
+    monkeypatch.setattr(proxy_utils.shutil, "which", lambda name: None)
+    assert make_proxy(_video(tmp_path)) == (None, None)
@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+
+from utils.quality_utils import batch_face_quality, CROP_SIZE
+
+FRONTAL = np.array([[38, 50], [74, 50], [56, 70], [42, 90], [70, 90]], np.float32)
+
+
+def _crop(seed, blur=0):
+    crop = np.random.default_rng(seed).integers(0, 255, (CROP_SIZE, CROP_SIZE, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(crop, (0, 0), blur) if blur else crop
+
+
+def test_scores_rank_sharpness_size_and_pose():
+    yawed = FRONTAL.copy()
+    yawed[2, 0] += 20                                  # 鼻尖偏向一侧
+    crops = np.stack([_crop(0), _crop(0, blur=3), _crop(0), _crop(0)])
+    bboxes = [[0, 0, 200, 200], [0, 0, 200, 200], [0, 0, 30, 30], [0, 0, 200, 200]]
+    q = batch_face_quality(crops, bboxes, [FRONTAL, FRONTAL, FRONTAL, yawed])
+
+    sharp, blurred, small, turned = q
+    assert sharp["sharpness"] > blurred["sharpness"] and sharp["score"] > blurred["score"]
+    assert sharp["size"] == 1.0 and small["size"] < 0.3 and small["score"] < sharp["score"]
+    assert sharp["pose"] > 0.9 and turned["pose"] < 0.5 and turned["score"] < sharp["score"]
+    assert small["bbox"] == [0.0, 0.0, 30.0, 30.0]
+    assert all(0.05 <= f["score"] <= 1.0 for f in q)
+
+
+def test_batch_matches_one_at_a_time():
+    crops = np.stack([_crop(i, blur=i) for i in range(5)])
+    bboxes = [[0, 0, 40 + 20 * i, 50 + 20 * i] for i in range(5)]
+    kpss = [FRONTAL + i for i in range(5)]
+    batch = batch_face_quality(crops, bboxes, kpss)
+    single = [batch_face_quality(crops[i:i + 1], bboxes[i:i + 1], kpss[i:i + 1])[0] for i in range(5)]
+    for a, b in zip(batch, single):
+        assert a.keys() == b.keys()
+        assert all(np.isclose(a[k], b[k], rtol=1e-5) for k in ("sharpness", "size", "pose", "score"))
+    assert batch_face_quality(np.zeros((0, CROP_SIZE, CROP_SIZE, 3), np.uint8), [], []) == []
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from utils.quant_utils import (adjusted_rand_index, leader_clusters, load_labeled_images, nn_accuracy,
+                               split_model_name)
+
+
+def _unit(*rows):
+    x = np.asarray(rows, np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_split_model_name():
+    assert split_model_name("buffalo_l-int8") == ("buffalo_l", True)
+    assert split_model_name("buffalo_l") == ("buffalo_l", False)
+
+
+def test_ari_ignores_label_names_and_matches_sklearn():
+    sklearn = pytest.importorskip("sklearn.metrics")
+    a = [0, 0, 1, 1, 2, 2]
+    assert adjusted_rand_index(a, [5, 5, 3, 3, 9, 9]) == 1.0
+    assert adjusted_rand_index([0, 0, 0], [1, 1, 1]) == 1.0
+    rng = np.random.default_rng(0)
+    for _ in range(5):
+        x, y = rng.integers(0, 4, 40), rng.integers(0, 3, 40)
+        assert adjusted_rand_index(x, y) == pytest.approx(sklearn.adjusted_rand_score(x, y))
+
+
+def test_leader_clusters_follows_running_centroid():
+    embs = _unit([1, 0, 0], [0.9, 0.1, 0], [0, 1, 0], [0.95, 0.05, 0], [0, 0.9, 0.1])
+    assert list(leader_clusters(embs, 0.8)) == [0, 0, 1, 0, 1]
+    assert list(leader_clusters(embs, 1.01)) == [0, 1, 2, 3, 4]   # 阈值过高时每张脸自成一簇
+
+
+def test_nn_accuracy_leaves_self_out():
+    embs = _unit([1, 0], [0.9, 0.1], [0, 1], [0.1, 0.9])
+    assert nn_accuracy(embs, np.array([0, 0, 1, 1])) == 1.0
+    assert nn_accuracy(embs, np.array([0, 1, 0, 1])) == 0.0
+
+
+def test_load_labeled_images_skips_other_and_non_images(tmp_path):
+    for rel in ("role_1/a.jpg", "role_1/b.PNG", "role_1/notes.txt", "role_2/c.jpeg", "role_other/d.jpg"):
+        (tmp_path / rel).parent.mkdir(exist_ok=True)
+        (tmp_path / rel).write_bytes(b"")
+    items = [(p.split("/")[-1], label) for p, label in load_labeled_images(str(tmp_path))]
+    assert items == [("a.jpg", "role_1"), ("b.PNG", "role_1"), ("c.jpeg", "role_2")]
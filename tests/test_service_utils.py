@@ -0,0 +1,107 @@
+import os
+import stat
+import threading
+
+import numpy as np
+import pytest
+
+from utils import face_utils
+from utils.face_utils import extract_faces, get_embedding_client, use_embedding_client
+from utils.service_utils import (
+    EmbeddingServer, EmbeddingClient, InProcessClient, StubBackend, embedding_server, SOCKET_ENV
+)
+
+
+def _img(seed):
+    return np.random.default_rng(seed).integers(0, 255, size=(48, 64, 3), dtype=np.uint8)
+
+
+class FailingBackend:
+    def process(self, requests):
+        raise ValueError("boom")
+
+
+@pytest.fixture
+def server(tmp_path):
+    srv = EmbeddingServer(str(tmp_path / "e.sock"), backend=StubBackend(), batch_window=0.2).start()
+    yield srv
+    srv.stop()
+
+
+@pytest.fixture(autouse=True)
+def no_process_client(monkeypatch):
+    monkeypatch.delenv(SOCKET_ENV, raising=False)
+    monkeypatch.setattr(face_utils, "_process_client", None)
+
+
+def test_round_trip_matches_backend(server):
+    assert stat.S_IMODE(os.stat(server.socket_path).st_mode) == 0o600
+    client = EmbeddingClient(server.socket_path)
+    img = _img(0)
+    feats, qualities, det_size = client.analyze_faces(img)
+    expected, _, _ = StubBackend().process([(img, {})])[0]
+    assert len(feats) == 1 and np.allclose(feats[0], expected[0])
+    assert qualities == [{"score": 1.0, "det_size": 0}] and det_size == 0
+    client.close()
+
+
+def test_concurrent_requests_are_batched(server):
+    client = EmbeddingClient(server.socket_path)
+    barrier = threading.Barrier(4)
+    results = {}
+
+    def call(i):
+        barrier.wait()
+        results[i] = client.analyze_faces(_img(i))[0][0]
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(server.backend.calls) == 4 and max(server.backend.calls) > 1
+    assert server.stats["requests"] == 4 and server.stats["batches"] == len(server.backend.calls)
+    for i, feat in results.items():       # 凑批后结果仍按请求对应
+        assert np.allclose(feat, StubBackend().process([(_img(i), {})])[0][0][0])
+
+
+def test_backend_error_is_reported_and_server_keeps_serving(server):
+    client = EmbeddingClient(server.socket_path)
+    server.backend = FailingBackend()
+    with pytest.raises(RuntimeError, match="inference failed"):
+        client.analyze_faces(_img(0))
+    server.backend = StubBackend()
+    assert len(client.analyze_faces(_img(0))[0]) == 1
+
+
+def test_client_reconnects_after_server_restart(tmp_path):
+    path = str(tmp_path / "e.sock")
+    srv = EmbeddingServer(path, backend=StubBackend()).start()
+    client = EmbeddingClient(path, timeout=5)
+    client.analyze_faces(_img(0))
+    srv.stop()
+    srv = EmbeddingServer(path, backend=StubBackend()).start()
+    try:
+        with pytest.raises(OSError):
+            client.analyze_faces(_img(0))       # 旧连接已断开
+        assert len(client.analyze_faces(_img(0))[0]) == 1
+    finally:
+        srv.stop()
+
+
+def test_client_is_scoped_to_the_calling_context(server):
+    seen = {}
+    with embedding_server(server.socket_path) as client:
+        assert get_embedding_client() is client
+        t = threading.Thread(target=lambda: seen.setdefault("other", get_embedding_client()))
+        t.start()
+        t.join()
+        assert SOCKET_ENV not in os.environ
+    assert seen["other"] is None and get_embedding_client() is None
+
+
+def test_extract_faces_uses_in_process_stub():
+    img = _img(1)
+    with use_embedding_client(InProcessClient()):
+        feats, qualities = extract_faces("unused.jpg", img=img)
+    assert len(feats) == 1 and qualities[0]["det_size"] == 0
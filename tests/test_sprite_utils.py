@@ -0,0 +1,37 @@
+import os
+
+import cv2
+import numpy as np
+
+from utils.sprite_utils import pack_sprite, contact_sheet, read_sprite_map, EMPTY_TILE
+
+
+def test_pack_sprite_layout():
+    img = np.full((180, 320, 3), 255, dtype=np.uint8)
+    sprite, tiles = pack_sprite([img, None, img], tile_height=90, columns=2)
+    assert sprite.shape == (180, 320, 3)
+    assert tiles == [(0, 0, 160, 90), (160, 0, 160, 90), (0, 90, 160, 90)]
+    assert (sprite[:90, 160:] == EMPTY_TILE).all() and (sprite[90:, :160] == 255).all()
+    assert pack_sprite([None, None]) == (None, [])
+
+
+def test_contact_sheet_rows_and_reuse(tmp_path):
+    paths = []
+    for i in range(3):
+        p = str(tmp_path / f"{i}.jpg")
+        cv2.imwrite(p, np.full((120, 160, 3), 60 * i, dtype=np.uint8))
+        paths.append(p)
+    sheet = str(tmp_path / "sheet.jpg")
+    rows = [paths[:2], paths[2:]]
+
+    first = contact_sheet(rows, sheet, tile_height=30)
+    assert first["paths"] == rows and [len(r) for r in first["rows"]] == [2, 1]
+    assert read_sprite_map(sheet) == first
+
+    built = os.path.getmtime(sheet)
+    os.utime(sheet, (built - 10, built - 10))     # 让源图比联系表新
+    assert contact_sheet(rows, sheet, tile_height=30) == first
+    assert os.path.getmtime(sheet) > built - 10   # 已重建
+    stamp = os.path.getmtime(sheet)
+    contact_sheet(rows, sheet, tile_height=30)
+    assert os.path.getmtime(sheet) == stamp       # 命中缓存
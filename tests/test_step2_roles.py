@@ -0,0 +1,98 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from step2_roles import group_roles, load_grouping_state, move_role_dir, STATE_FILE
+from utils.materialize_utils import read_manifest
+from utils.face_utils import use_embedding_client
+from utils.service_utils import InProcessClient, StubBackend
+
+BASES = {s: np.random.default_rng(s).integers(0, 255, size=(64, 128), dtype=np.uint8) for s in (1, 2)}
+
+
+def _write(folder, name, person, seed):
+    """同一 person 的图只加轻微噪声，替身后端给出相近的特征"""
+    noise = np.random.default_rng(seed).integers(-8, 8, size=BASES[person].shape)
+    img = np.clip(BASES[person].astype(int) + noise, 0, 255).astype(np.uint8)
+    cv2.imwrite(str(folder / name), cv2.cvtColor(img, cv2.COLOR_GRAY2BGR))
+
+
+@pytest.fixture
+def run(tmp_path):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    for i, (name, person) in enumerate([("a1.png", 1), ("a2.png", 1), ("b1.png", 2), ("b2.png", 2)]):
+        _write(input_dir, name, person, i)
+    backend = StubBackend()
+
+    def group(**kwargs):
+        with use_embedding_client(InProcessClient(backend)):
+            return group_roles(str(input_dir), str(output_dir), incremental=True, **kwargs)
+
+    return input_dir, output_dir, backend, group
+
+
+def _roles(groups):
+    return sorted(sorted(images) for images in groups.values())
+
+
+def test_incremental_run_only_processes_changed_files(run):
+    input_dir, output_dir, backend, group = run
+    assert _roles(group()) == [["a1.png", "a2.png"], ["b1.png", "b2.png"]]
+    assert sum(backend.calls) == 4
+
+    _write(input_dir, "a3.png", 1, 10)
+    os.remove(input_dir / "b2.png")
+    groups = group()
+    assert sum(backend.calls) == 5                       # 只处理新增的 a3
+    assert _roles(groups) == [["a1.png", "a2.png", "a3.png"], ["b1.png"]]
+    role_b = next(r for r, images in groups.items() if "b1.png" in images)
+    assert os.listdir(output_dir / f"role_{role_b}") == ["b1.png"]
+
+    state = load_grouping_state(str(output_dir), 0.55)
+    assert set(state["files"]) == {"a1.png", "a2.png", "a3.png", "b1.png"}
+    assert "b2.png" not in state["embeddings"]
+
+
+def test_changed_settings_invalidate_state(run):
+    _, output_dir, backend, group = run
+    group(compact_embeddings=True)
+    out = str(output_dir)
+    assert load_grouping_state(out, 0.55, compact=True) is not None
+    assert load_grouping_state(out, 0.55) is None                      # 存放方式不同
+    assert load_grouping_state(out, 0.6, compact=True) is None         # 阈值不同
+    assert load_grouping_state(out, 0.55, "buffalo_l-int8", compact=True) is None
+
+    group(compact_embeddings=True)
+    assert sum(backend.calls) == 4                       # 设置不变：全部沿用
+    group()
+    assert sum(backend.calls) == 8                       # 改为内存特征：全量重跑
+    assert load_grouping_state(out, 0.55)["embeddings"].dtype == np.float32
+
+
+def test_corrupt_state_is_ignored(run):
+    _, output_dir, backend, group = run
+    output_dir.mkdir()
+    (output_dir / STATE_FILE).write_bytes(b"not a pickle")
+    assert load_grouping_state(str(output_dir), 0.55) is None
+    assert len(group()) == 2 and sum(backend.calls) == 4
+
+
+@pytest.mark.parametrize("link_mode", ["copy", "symlink", "manifest"])
+def test_role_rename_keeps_materialized_files(run, link_mode):
+    input_dir, output_dir, _, group = run
+    groups = group(link_mode=link_mode)
+    old = next(r for r, images in groups.items() if "a1.png" in images)
+    other = next(r for r in groups if r != old)
+    move_role_dir(str(input_dir), str(output_dir), old, other, link_mode)
+    new_dir = output_dir / f"role_{other}"
+    assert not (output_dir / f"role_{old}").exists()
+    if link_mode == "manifest":
+        assert set(read_manifest(str(new_dir))) == {"a1.png", "a2.png", "b1.png", "b2.png"}
+        assert read_manifest(str(new_dir))["a1.png"] == str(input_dir / "a1.png")
+    else:
+        assert sorted(os.listdir(new_dir)) == ["a1.png", "a2.png", "b1.png", "b2.png"]
+        assert (new_dir / "a1.png").read_bytes() == (input_dir / "a1.png").read_bytes()
+        assert (new_dir / "a1.png").is_symlink() == (link_mode == "symlink")
@@ -0,0 +1,10 @@
+from utils.stream_utils import sample_frame_ids
+
+
+def test_sample_frame_ids():
+    assert sample_frame_ids(10, 10) == []
+    assert sample_frame_ids(10, 12) == [10]
+    for _ in range(20):
+        ids = sample_frame_ids(100, 160)
+        assert ids[0] == 100 and ids[-1] == 158 and len(ids) == 4
+        assert all(100 < i < 157 for i in ids[1:-1])
@@ -0,0 +1,16 @@
+from utils.subtitle_utils import parse_srt, cue_times
+
+SRT = "﻿1\r\n00:00:01,000 --> 00:00:03,500\r\n你好\r\n世界\r\n\r\n2\r\n00:01:02.5 --> 00:01:04.25\r\n再见\r\n\r\n垃圾段落\r\n"
+
+
+def test_parse_srt():
+    cues = parse_srt(SRT)
+    assert [(c["index"], c["start"], c["end"], c["text"]) for c in cues] == [
+        (1, 1.0, 3.5, "你好\n世界"),
+        (2, 62.5, 64.25, "再见"),
+    ]
+    assert parse_srt("no timeline here") == []
+
+
+def test_cue_times_use_midpoint():
+    assert cue_times([{"start": 1.0, "end": 3.5}, {"start": 5.0, "end": 4.0}]) == [2.25, 5.0]
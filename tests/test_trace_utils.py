@@ -0,0 +1,45 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.trace_utils import trace_run, span, count, get_tracer, bind_tracer
+
+
+def test_run_collects_spans_and_counters(tmp_path):
+    with trace_run("job", str(tmp_path)) as tracer:
+        with span("stage"):
+            count("frames", 3)
+        assert get_tracer() is tracer
+    assert get_tracer() is not tracer
+    assert tracer.result["counters"] == {"frames": 3}
+    assert tracer.result["spans"]["stage"]["count"] == 1
+    assert (tmp_path / "run_log.jsonl").exists()
+
+
+def test_concurrent_runs_do_not_mix():
+    barrier = threading.Barrier(2)
+    results = {}
+
+    def job(name, n):
+        with trace_run(name) as tracer:
+            barrier.wait()
+            for _ in range(n):
+                count("items")
+            barrier.wait()
+        results[name] = tracer.result["counters"]
+
+    threads = [threading.Thread(target=job, args=(f"run{n}", n)) for n in (5, 7)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {"run5": {"items": 5}, "run7": {"items": 7}}
+
+
+def test_bind_tracer_carries_run_into_worker_threads():
+    with trace_run("job") as tracer:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            list(pool.map(bind_tracer(lambda _: count("done")), range(10)))
+        thread = threading.Thread(target=lambda: count("unbound"))
+        thread.start()
+        thread.join()
+    assert tracer.result["counters"] == {"done": 10}
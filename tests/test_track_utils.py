@@ -0,0 +1,108 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+from insightface.app.common import Face
+
+import utils.track_utils as track_utils
+from utils.track_utils import shot_key, group_by_shot, associate, extract_shot_features
+
+_KPS = np.array([[38.3, 51.7], [73.5, 51.5], [56.0, 71.7], [41.5, 92.4], [70.7, 92.2]], np.float32)
+
+
+def _face(x, emb=None, score=0.9):
+    face = Face(bbox=np.array([x, 20, x + 112, 132], np.float32), kps=_KPS + [x, 20], det_score=score)
+    if emb is not None:
+        face.embedding = emb
+        face.det_size = 640
+    return face
+
+
+def test_shot_key_and_grouping():
+    assert shot_key("cut(3).jpg") == (3, 1)
+    assert shot_key("cut(3.2).jpg") == (3, 2)
+    assert shot_key("scene_4_frame_812.jpg") == (4, 812)
+    assert shot_key("other.jpg") is None
+    assert group_by_shot(["cut(2.2).jpg", "x.jpg", "cut(1).jpg", "cut(2).jpg"]) == [
+        ["cut(1).jpg"], ["cut(2).jpg", "cut(2.2).jpg"], ["x.jpg"]
+    ]
+
+
+def test_associate_by_iou_and_landmarks():
+    tracks = [{"bbox": f.bbox, "kps": f.kps} for f in (_face(0), _face(300))]
+    moved = [_face(310), _face(8)]
+    assert associate([f.bbox for f in moved], [f.kps for f in moved], tracks) == {0: 1, 1: 0}
+    # 框重叠但关键点错位（另一张脸）不关联
+    flipped = _face(5)
+    flipped.kps = flipped.kps[::-1] * [1, 1.8]
+    assert associate([flipped.bbox], [flipped.kps], tracks) == {}
+    assert associate([_face(150).bbox], [_face(150).kps], tracks) == {}
+
+
+@pytest.fixture
+def shot(tmp_path, monkeypatch):
+    names = ["cut(1).jpg", "cut(1.2).jpg", "cut(1.3).jpg"]
+    for name in names:
+        cv2.imwrite(str(tmp_path / name), np.full((200, 600, 3), 128, np.uint8))
+    frames = {
+        "cut(1).jpg": [_face(0)],
+        "cut(1.2).jpg": [_face(6)],
+        "cut(1.3).jpg": [_face(10), _face(400)],
+    }
+    current = {}
+
+    def detect_faces(img, path, norm, det, model, det_sizes, return_size=False):
+        kept = [_face(f.bbox[0], np.ones(512, np.float32)) for f in frames[os.path.basename(path)]]
+        return (kept, 640) if return_size else kept
+
+    def detect_boxes(img, model, det_sizes, det_threshold):
+        faces = frames[current["name"]]
+        return (np.array([f.bbox for f in faces]), np.array([f.kps for f in faces]),
+                np.array([f.det_score for f in faces], np.float32), 320)
+
+    real_iter = track_utils.iter_images
+
+    def iter_images(paths, **kwargs):
+        for path, img in real_iter(paths, **kwargs):
+            current["name"] = os.path.basename(path)
+            yield path, img
+
+    class Rec:
+        calls = 0
+
+        def get(self, img, face):
+            Rec.calls += 1
+            face.embedding = np.full(512, 2.0, np.float32)
+
+    class Model:
+        models = {"recognition": Rec()}
+
+    monkeypatch.setattr(track_utils, "detect_faces", detect_faces)
+    monkeypatch.setattr(track_utils, "detect_boxes", detect_boxes)
+    monkeypatch.setattr(track_utils, "iter_images", iter_images)
+    return names, str(tmp_path), Model(), Rec
+
+
+def test_shot_features_link_tracks_and_embed_only_new_faces(shot, monkeypatch):
+    monkeypatch.setattr(track_utils, "TRACK_EMBED_FRAMES", 1)   # 只在锚帧识别
+    names, folder, model, rec = shot
+    feats, quals, sizes, embedded = extract_shot_features(names, folder, face_model=model)
+    assert embedded == 2 and rec.calls == 1      # 锚帧 1 张 + 第三帧新出现的 1 张
+    assert [len(feats[n]) for n in names] == [1, 1, 2]
+    assert np.allclose(feats["cut(1.3).jpg"][0], 1.0) and np.allclose(feats["cut(1.3).jpg"][1], 2.0)
+    first, linked = quals["cut(1).jpg"][0], quals["cut(1.2).jpg"][0]
+    assert first["det_size"] == 640 and linked["det_size"] == 320
+    assert linked["bbox"] == [6.0, 20.0, 118.0, 132.0]
+    assert sizes == {"cut(1).jpg": 640, "cut(1.2).jpg": 320, "cut(1.3).jpg": 320}
+    assert all({"score", "bbox", "det_size"} <= set(q) for qs in quals.values() for q in qs)
+
+
+@pytest.mark.parametrize("frames, calls, mean", [(3, 3, 5 / 3), (2, 2, 1.5)])
+def test_linked_faces_are_embedded_on_spaced_frames_and_averaged(shot, monkeypatch, frames, calls, mean):
+    monkeypatch.setattr(track_utils, "TRACK_EMBED_FRAMES", frames)
+    names, folder, model, rec = shot
+    feats, _, _, embedded = extract_shot_features(names, folder, face_model=model)
+    assert rec.calls == calls and embedded == calls + 1       # 锚帧的 1 张由 detect_faces 完成
+    assert np.allclose(feats["cut(1.3).jpg"][0], mean) and np.allclose(feats["cut(1.3).jpg"][1], 2.0)
+    assert np.allclose(feats["cut(1).jpg"][0], mean)          # 镜头内各帧共享轨迹的平均特征
@@ -1,7 +1,29 @@
 from .file_utils import *
+from .trace_utils import *
 from .ui_utils import *
 from .face_utils import *
 from .video_utils import *
+from .image_utils import *
+from .quality_utils import *
+from .library_utils import *
+from .materialize_utils import *
+from .track_utils import *
+from .hash_utils import *
+from .crop_utils import *
+from .embedding_utils import *
+from .pipeline_utils import *
+from .service_utils import *
+from .quant_utils import *
+from .proxy_utils import *
+from .media_utils import *
+from .cache_utils import *
+from .manifest_utils import *
+from .packet_utils import *
+from .stream_utils import *
+from .exemplar_utils import *
+from .sprite_utils import *
+from .subtitle_utils import *
+from .parallel_utils import *
 
 
 
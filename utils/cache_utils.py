@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+
+CACHE_DIR = "temp"          # 默认放在 Step 0 输出目录下：<output>/temp/<指纹>/<类型>/
+INDEX_FILE = "index.json"
+DEFAULT_BUDGET_GB = 20
+PIN_TTL = 6 * 3600          # 会话 pin 的租期（秒），会话异常退出后自动失效
+FINGERPRINT_SAMPLE = 1 << 20
+
+_lock = threading.Lock()
+
+
+def video_fingerprint(path):
+    """
+    视频指纹：大小 + mtime + 首尾各 1MB 的 SHA1，不读整个文件（file_md5 对大视频很慢）。
+    返回 "<文件名>_<12 位哈希>"，便于在缓存目录中辨认。
+    """
+    st_ = os.stat(path)
+    h = hashlib.sha1(f"{st_.st_size}:{st_.st_mtime_ns}".encode())
+    with open(path, "rb") as f:
+        h.update(f.read(FINGERPRINT_SAMPLE))
+        if st_.st_size > FINGERPRINT_SAMPLE:
+            f.seek(max(FINGERPRINT_SAMPLE, st_.st_size - FINGERPRINT_SAMPLE))
+            h.update(f.read(FINGERPRINT_SAMPLE))
+    return f"{os.path.basename(path)}_{h.hexdigest()[:12]}"
+
+
+def cache_root(output_dir):
+    return os.path.join(output_dir, CACHE_DIR)
+
+
+def dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ArtifactCache:
+    """
+    按视频指纹管理可重建的中间产物（抽帧、预览代理、人脸裁剪/特征），总大小受磁盘预算约束。
+
+    - 条目键为 "<指纹>/<类型>"，默认存放在 root/<指纹>/<类型>/，也可以登记外部目录（get 的 path 参数）
+    - index.json 记录每个条目的大小、最后访问时间、pin 租约，以及各类型的命中/未命中次数
+    - evict() 按最后访问时间淘汰超出预算的条目，被 pin 的条目（有会话正在使用）不淘汰；
+      root 下的条目整个删除；外部目录（例如 cuts/proxies）只删除 commit 时登记的文件，
+      没有登记文件的外部条目无法淘汰，不计入释放的空间（见 report 的 unevictable）
+    """
+
+    def __init__(self, root, budget_gb=DEFAULT_BUDGET_GB):
+        self.root = root
+        self.budget = int(budget_gb * 2 ** 30)
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, INDEX_FILE)
+
+    def owns(self, path):
+        """path 是否位于缓存目录下（只有这些目录会被缓存删除）"""
+        root = os.path.realpath(self.root)
+        return os.path.commonpath([root, os.path.realpath(path)]) == root and os.path.realpath(path) != root
+
+    # ------------------ index ------------------
+    def _load(self):
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"读取缓存索引失败: {e}")
+        return {"entries": {}, "stats": {}}
+
+    def _save(self, index):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def _update(self, fn):
+        with _lock:
+            index = self._load()
+            result = fn(index)
+            self._save(index)
+            return result
+
+    # ------------------ 使用 ------------------
+    def get(self, fingerprint, kind, path=None, check=None, owner=None, ttl=PIN_TTL):
+        """
+        返回条目目录（不存在时创建），并记录命中/未命中：目录已存在且非空、且 check(目录) 为真时为命中，
+        check 不通过（例如参数变了）时清空目录后按未命中处理。
+        path 不为空时把该外部目录登记为条目（例如 cuts/proxies）。
+        owner 不为空时在同一次索引更新中 pin 住条目：之后写入、commit 触发的淘汰都不会删掉它。
+        返回 (目录, 是否命中)。
+        """
+        key = f"{fingerprint}/{kind}"
+        path = path or os.path.join(self.root, fingerprint, kind)
+        hit = os.path.isdir(path) and any(os.scandir(path))
+        if hit and check is not None and not check(path):
+            if self.owns(path):
+                shutil.rmtree(path, ignore_errors=True)
+            hit = False
+        os.makedirs(path, exist_ok=True)
+
+        def _touch(index):
+            entry = index["entries"].setdefault(key, {"path": path, "size": 0, "created": time.time()})
+            entry["path"] = path
+            entry["last_access"] = time.time()
+            if owner is not None:
+                entry.setdefault("pins", {})[owner] = time.time() + ttl
+            stats = index["stats"].setdefault(kind, {"hits": 0, "misses": 0})
+            stats["hits" if hit else "misses"] += 1
+
+        self._update(_touch)
+        return path, hit
+
+    def commit(self, fingerprint, kind, files=None):
+        """
+        条目写完后更新大小，并按预算淘汰。
+        files 为外部条目中由缓存使用方生成、可以随时重建的文件（例如代理视频和海报），
+        与之前登记的合并；淘汰时只删除这些文件，大小也只按它们计算。
+        """
+        key = f"{fingerprint}/{kind}"
+
+        def _size(index):
+            entry = index["entries"].get(key)
+            if entry:
+                if files is not None:
+                    entry["files"] = sorted(set(entry.get("files", [])) | {os.path.abspath(f) for f in files})
+                entry["size"] = self._entry_size(entry)
+                entry["last_access"] = time.time()
+
+        self._update(_size)
+        return self.evict()
+
+    def pin(self, fingerprint, kind, owner, ttl=PIN_TTL):
+        """owner（例如会话 id）正在使用该条目，租期内不会被淘汰"""
+        key = f"{fingerprint}/{kind}"
+
+        def _pin(index):
+            entry = index["entries"].get(key)
+            if entry:
+                entry.setdefault("pins", {})[owner] = time.time() + ttl
+
+        self._update(_pin)
+
+    def unpin_owner(self, owner):
+        """释放 owner 持有的全部 pin（会话切换到别的视频时调用）"""
+        def _unpin(index):
+            for entry in index["entries"].values():
+                entry.get("pins", {}).pop(owner, None)
+
+        self._update(_unpin)
+
+    # ------------------ 淘汰 ------------------
+    def _entry_size(self, entry):
+        if "files" in entry and not self.owns(entry["path"]):
+            return sum(os.path.getsize(f) for f in entry["files"] if os.path.isfile(f))
+        return dir_size(entry["path"])
+
+    def evictable(self, entry):
+        """root 下的条目，或登记了可删除文件的外部条目"""
+        return self.owns(entry["path"]) or bool(entry.get("files"))
+
+    def _remove(self, entry):
+        """删除条目的文件，返回实际释放的字节数"""
+        path = entry["path"]
+        if self.owns(path):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    print(f"删除缓存文件失败 {path}: {e}")
+        else:
+            for f in entry.get("files", []):
+                try:
+                    if os.path.isfile(f):
+                        os.remove(f)
+                except OSError as e:
+                    print(f"删除缓存文件失败 {f}: {e}")
+        left = self._entry_size(entry) if os.path.exists(path) else 0
+        return max(0, entry["size"] - left)
+
+    def evict(self, budget=None):
+        """按 LRU 淘汰未被 pin 的可淘汰条目直到总大小不超过预算，返回被淘汰的键"""
+        budget = self.budget if budget is None else budget
+
+        def _evict(index):
+            now = time.time()
+            entries = index["entries"]
+            # 已被外部删除的条目直接移除
+            for key in [k for k, e in entries.items() if not os.path.exists(e["path"])]:
+                del entries[key]
+            total = sum(e["size"] for e in entries.values())
+            evicted = []
+            for key, entry in sorted(entries.items(), key=lambda kv: kv[1].get("last_access", 0)):
+                if total <= budget:
+                    break
+                pins = {o: t for o, t in entry.get("pins", {}).items() if t > now}
+                entry["pins"] = pins
+                if pins or not self.evictable(entry):
+                    continue
+                freed = self._remove(entry)
+                total -= freed
+                if freed < entry["size"]:
+                    entry["size"] -= freed   # 部分文件删不掉（例如被占用），保留条目
+                    continue
+                evicted.append(key)
+            for key in evicted:
+                del entries[key]
+            return evicted
+
+        evicted = self._update(_evict)
+        # 清理空的指纹目录
+        for key in evicted:
+            parent = os.path.join(self.root, key.split("/")[0])
+            if os.path.isdir(parent) and not os.listdir(parent):
+                os.rmdir(parent)
+        return evicted
+
+    # ------------------ 统计 ------------------
+    def report(self):
+        """
+        返回 {"total_bytes", "budget_bytes", "entries", "unevictable": [键, ...],
+              "kinds": {类型: {size, entries, hits, misses, hit_rate}}}
+        """
+        index = self._load()
+        kinds = {}
+        for key, entry in index["entries"].items():
+            k = kinds.setdefault(key.split("/", 1)[1], {"size": 0, "entries": 0})
+            k["size"] += entry["size"]
+            k["entries"] += 1
+        for kind, stats in index["stats"].items():
+            k = kinds.setdefault(kind, {"size": 0, "entries": 0})
+            k.update(stats)
+            lookups = stats["hits"] + stats["misses"]
+            k["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        return {
+            "total_bytes": sum(e["size"] for e in index["entries"].values()),
+            "budget_bytes": self.budget,
+            "entries": len(index["entries"]),
+            "unevictable": sorted(k for k, e in index["entries"].items() if not self.evictable(e)),
+            "kinds": kinds,
+        }
@@ -0,0 +1,263 @@
+import os
+import glob
+import time
+import numpy as np
+from insightface.utils import face_align
+
+from .face_utils import detect_boxes, load_recognition_model, model_name, NORM_THRESHOLD, DET_THRESHOLD
+from .image_utils import iter_images
+from .quality_utils import batch_face_quality, CROP_SIZE
+from .trace_utils import span, count
+
+STORE_MIN_SCORE = 0.3   # 入库的最低检测置信度，之后可按更高阈值重新过滤
+STORE_MAX_SEGMENTS = 8  # 分段数超过该值，或被覆盖的记录超过一半时合并分段
+STORE_FLUSH_FACES = 2048  # add_images 每攒够这么多张裁剪（约 77MB）就写出一个分段，内存有界
+EMBED_BATCH = 64
+
+
+class CropStore:
+    """
+    人脸对齐裁剪缓存：检测一次，之后更换识别模型或阈值时只需在裁剪上重新提特征。
+
+    每次 add_images 追加一个分段：
+        crops_<k>.npy   (N, 112, 112, 3) uint8 对齐人脸
+        meta_<k>.npz    图片名、文件签名、检测尺寸、人脸所属图片、bbox、关键点、检测置信度
+    同一张图片以最新分段为准；被覆盖的旧记录由 compact() 清理。
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.segments = []   # [(crops memmap, meta dict)]
+        self.index = {}      # 图片名 -> (分段号, 人脸行号数组, 签名, 分段内图片下标)
+        self.load()
+
+    def load(self):
+        self.segments = []
+        self.index = {}
+        for meta_path in sorted(glob.glob(os.path.join(self.store_dir, "meta_*.npz"))):
+            seg_id = os.path.basename(meta_path)[5:-4]
+            crops_path = os.path.join(self.store_dir, f"crops_{seg_id}.npy")
+            if not os.path.exists(crops_path):
+                continue
+            with np.load(meta_path) as npz:   # 及时关闭 npz，Windows 下之后才能删除
+                meta = dict(npz)
+            crops = np.load(crops_path, mmap_mode="r")
+            seg = len(self.segments)
+            self.segments.append((crops, meta))
+            # face_image 按图片顺序写入，是有序的
+            bounds = np.searchsorted(meta["face_image"], np.arange(len(meta["images"]) + 1))
+            for i, (name, sig) in enumerate(zip(meta["images"], meta["signatures"])):
+                rows = np.arange(bounds[i], bounds[i + 1])
+                self.index[str(name)] = (seg, rows, tuple(int(x) for x in sig), i)
+
+    # ------------------ 检测入库 ------------------
+    def missing(self, file_list, input_dir):
+        """返回不在库中或文件已变化的图片名"""
+        todo = []
+        for name in file_list:
+            st_ = os.stat(os.path.join(input_dir, name))
+            entry = self.index.get(name)
+            if entry is None or entry[2] != (st_.st_mtime_ns, st_.st_size):
+                todo.append(name)
+        return todo
+
+    def add_images(self, file_list, input_dir, face_model=None, progress_callback=None,
+                   det_sizes=None, det_threshold=DET_THRESHOLD):
+        """
+        只跑检测，对齐裁剪后写入新分段（每 STORE_FLUSH_FACES 张裁剪写出一段，不在内存中攒完整批）。
+        det_sizes / det_threshold 见 face_utils.detect_boxes（自适应检测时判断可信人脸的阈值，
+        应与之后 embed_from_store 使用的阈值一致）。
+        """
+        if not file_list:
+            return
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        images, signatures, det_used = [], [], []
+        crops, face_image, bboxes, kpss, scores = [], [], [], [], []
+
+        def flush():
+            seg_id = self._new_segment_id()
+            arr = np.stack(crops) if crops else np.zeros((0, CROP_SIZE, CROP_SIZE, 3), np.uint8)
+            np.save(os.path.join(self.store_dir, f"crops_{seg_id}.npy"), arr)
+            self._write_meta(seg_id, images, signatures, det_used, face_image, bboxes, kpss, scores)
+            for buf in (images, signatures, det_used, crops, face_image, bboxes, kpss, scores):
+                buf.clear()
+
+        start = time.time()
+        paths = {os.path.join(input_dir, name): name for name in file_list}
+        for i, (path, img) in enumerate(iter_images(paths), 1):
+            st_ = os.stat(path)
+            img_idx = len(images)
+            images.append(paths[path])
+            signatures.append((st_.st_mtime_ns, st_.st_size))
+            det_used.append(0)
+            if img is not None:
+                with span("detect"):
+                    boxes, kps, det, det_used[-1] = detect_boxes(img, face_model, det_sizes, det_threshold)
+                count("faces_detected", len(boxes))
+                for b, k, d in zip(boxes, kps, det):
+                    if d < STORE_MIN_SCORE:
+                        continue
+                    crops.append(face_align.norm_crop(img, landmark=k, image_size=CROP_SIZE))
+                    face_image.append(img_idx)
+                    bboxes.append(b)
+                    kpss.append(k)
+                    scores.append(d)
+            if len(crops) >= STORE_FLUSH_FACES:
+                flush()
+            if progress_callback:
+                progress_callback(i, len(paths), time.time() - start)
+
+        if images:
+            flush()
+        self.load()
+        self.compact()
+
+    def _new_segment_id(self):
+        """毫秒时间戳（按文件名排序即写入顺序）；同一毫秒内多次写入时顺延"""
+        seg_id = int(time.time() * 1000)
+        while os.path.exists(os.path.join(self.store_dir, f"meta_{seg_id:d}.npz")):
+            seg_id += 1
+        return f"{seg_id:d}"
+
+    def _write_meta(self, seg_id, images, signatures, det_size, face_image, bboxes, kpss, scores):
+        np.savez(
+            os.path.join(self.store_dir, f"meta_{seg_id}.npz"),
+            images=np.array(images), signatures=np.array(signatures, dtype=np.int64).reshape(-1, 2),
+            det_size=np.array(det_size, dtype=np.int32),
+            face_image=np.array(face_image, dtype=np.int32),
+            bbox=np.array(bboxes, dtype=np.float32).reshape(-1, 4),
+            kps=np.array(kpss, dtype=np.float32).reshape(-1, 5, 2),
+            det_score=np.array(scores, dtype=np.float32),
+        )
+
+    # ------------------ 合并分段 ------------------
+    def compact(self, force=False):
+        """
+        分段数超过 STORE_MAX_SEGMENTS，或被新分段覆盖的图片 / 人脸超过一半时，
+        把仍有效的记录写成一个新分段（裁剪逐段拷贝到 memmap，不整体读入内存），再删除旧分段。
+        返回是否做了合并。
+        """
+        total_images = sum(len(meta["images"]) for _, meta in self.segments)
+        total_faces = sum(len(meta["face_image"]) for _, meta in self.segments)
+        live_faces = sum(len(entry[1]) for entry in self.index.values())
+        stale = (total_images - len(self.index)) * 2 > total_images or (total_faces - live_faces) * 2 > total_faces
+        if len(self.segments) <= 1 or not (force or stale or len(self.segments) > STORE_MAX_SEGMENTS):
+            return False
+
+        with span("crop_store_compact"):
+            old_files = [
+                p for pattern in ("meta_*.npz", "crops_*.npy")
+                for p in glob.glob(os.path.join(self.store_dir, pattern))
+            ]
+            by_segment = {}
+            for name, (seg, rows, sig, pos) in self.index.items():
+                by_segment.setdefault(seg, []).append((name, rows, sig, pos))
+
+            seg_id = self._new_segment_id()
+            out = np.lib.format.open_memmap(
+                os.path.join(self.store_dir, f"crops_{seg_id}.npy"), mode="w+",
+                dtype=np.uint8, shape=(live_faces, CROP_SIZE, CROP_SIZE, 3)
+            )
+            images, signatures, det_size, face_image, bboxes, kpss, scores = [], [], [], [], [], [], []
+            n = 0
+            for seg, entries in sorted(by_segment.items()):
+                crops, meta = self.segments[seg]
+                for name, rows, sig, pos in entries:
+                    out[n:n + len(rows)] = crops[rows]
+                    n += len(rows)
+                    face_image.extend([len(images)] * len(rows))
+                    images.append(name)
+                    signatures.append(sig)
+                    det_size.append(meta["det_size"][pos])
+                    bboxes.extend(meta["bbox"][rows])
+                    kpss.extend(meta["kps"][rows])
+                    scores.extend(meta["det_score"][rows])
+            out.flush()
+            del out
+            self._write_meta(seg_id, images, signatures, det_size, face_image, bboxes, kpss, scores)
+
+            # 新分段写完后再删旧文件；中途中断时新分段编号最大，加载结果不变
+            # 先关闭旧分段的 memmap，Windows 下仍被映射的文件无法删除
+            crops = None
+            self.close()
+            for p in old_files:
+                os.remove(p)
+            self.load()
+        return True
+
+    def close(self):
+        """关闭所有分段的 memmap（faces() 返回的裁剪是拷贝，不受影响）"""
+        for crops, _ in self.segments:
+            mm = getattr(crops, "_mmap", None)
+            if mm is not None:
+                mm.close()
+        self.segments = []
+        self.index = {}
+
+    # ------------------ 读取 ------------------
+    def faces(self, name, det_threshold=DET_THRESHOLD):
+        """返回某张图通过阈值的 (crops, bbox, kps, det_score, 检测尺寸)"""
+        entry = self.index.get(name)
+        if entry is None:
+            return None
+        seg, rows, _, pos = entry
+        crops, meta = self.segments[seg]
+        rows = rows[meta["det_score"][rows] >= det_threshold]
+        det_size = int(meta["det_size"][pos])
+        return crops[rows], meta["bbox"][rows], meta["kps"][rows], meta["det_score"][rows], det_size
+
+
+def embed_from_store(store, file_list, embeddings,
+                     rec_model_name=model_name,
+                     norm_threshold=NORM_THRESHOLD,
+                     det_threshold=DET_THRESHOLD,
+                     progress_callback=None):
+    """
+    在缓存的对齐裁剪上批量提特征，按图片写入 embeddings（EmbeddingMatrix）。
+    质量 dict 与在线检测一致，包含入库时的 bbox 和检测尺寸 det_size。
+    """
+    rec = load_recognition_model(rec_model_name)
+
+    # 按图片收集裁剪，攒够一批再送入识别模型
+    pending = []   # [(图片名, crop, bbox, kps)]
+    det_size_of = {}
+    names = []     # pending 中的图片名（按顺序、去重）
+    start = time.time()
+
+    def flush():
+        if not pending:
+            for name in names:
+                embeddings.add_image(name, [], det_size=det_size_of.get(name))
+            names.clear()
+            det_size_of.clear()
+            return
+        crops = np.stack([c for _, c, _, _ in pending])
+        start_inf = time.perf_counter()
+        embs = np.asarray(rec.get_feat(list(crops)), dtype=np.float32).reshape(len(pending), -1)
+        count("inference_ms", (time.perf_counter() - start_inf) * 1000)
+        count("faces_embedded", len(pending))
+        quals = batch_face_quality(crops, [b for _, _, b, _ in pending], [k for _, _, _, k in pending])
+        keep = np.linalg.norm(embs, axis=1) >= norm_threshold
+        owner = np.array([name for name, _, _, _ in pending])
+        for q, (name, _, _, _) in zip(quals, pending):
+            q["det_size"] = det_size_of[name]
+        for name in names:
+            rows = np.flatnonzero((owner == name) & keep)
+            embeddings.add_image(name, embs[rows], [quals[r] for r in rows], det_size_of.get(name))
+        pending.clear()
+        names.clear()
+        det_size_of.clear()
+
+    for i, name in enumerate(file_list, 1):
+        entry = store.faces(name, det_threshold)
+        names.append(name)
+        if entry is not None:
+            crops, bboxes, kpss, _, det_size_of[name] = entry
+            pending.extend((name, c, b, k) for c, b, k in zip(crops, bboxes, kpss))
+        if len(pending) >= EMBED_BATCH:
+            flush()
+        if progress_callback:
+            progress_callback(i, len(file_list), time.time() - start)
+    flush()
+    return embeddings
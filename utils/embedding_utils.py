@@ -0,0 +1,260 @@
+import os
+import numpy as np
+
+EMB_DIM = 512
+INITIAL_CAPACITY = 1024
+
+
+class EmbeddingMatrix:
+    """
+    连续存储的人脸特征矩阵，替代 {图片名: [特征, ...]} 这类零散的 Python 列表。
+
+    - 每行一张脸，插入时 L2 归一化；dtype 可选 float16 以减半内存
+    - path 不为空时以 np.memmap 落在磁盘上，容量不足时按倍数扩展文件
+    - 同一张图片的人脸行号连续，image_rows[名称] = (起始行, 人脸数)
+    - 人脸 -> 图片、质量、检测尺寸、人脸框都是与行号对齐的定长数组
+    - image_det_size[名称] 为该图实际使用的检测尺寸（没有人脸的图也记录）
+    所有相似度计算都直接在 matrix / features() 返回的视图上进行。
+    """
+
+    def __init__(self, dim=EMB_DIM, dtype=np.float32, path=None, capacity=INITIAL_CAPACITY):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.n = 0
+        self.capacity = 0
+        self.data = None
+        self.face_image = np.zeros(0, dtype=np.int32)     # 行 -> 图片下标
+        self.face_quality = np.zeros(0, dtype=np.float32) # 行 -> 人脸质量（NaN 表示未知）
+        self.face_det_size = np.zeros(0, dtype=np.int16)  # 行 -> 检测尺寸
+        self.face_bbox = np.zeros((0, 4), dtype=np.float32)  # 行 -> 原图人脸框 x1,y1,x2,y2（NaN 表示未知）
+        self.images = []                                  # 图片下标 -> 名称
+        self.image_ids = {}                               # 名称 -> 图片下标
+        self.image_rows = {}                              # 名称 -> (起始行, 人脸数)
+        self.image_det_size = {}                          # 名称 -> 检测尺寸
+        self.dead = 0                                     # 已失效的行数（触发 compact）
+        if path:
+            # 新建矩阵时清空旧文件
+            open(path, "wb").close()
+        self._grow(capacity)
+
+    # ------------------ 存储 ------------------
+    def _grow(self, capacity):
+        if capacity <= self.capacity:
+            return
+        if self.path:
+            self.close()   # Windows 下仍被映射的文件不能改变大小
+            with open(self.path, "r+b") as f:
+                f.truncate(capacity * self.dim * self.dtype.itemsize)
+            self.data = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        else:
+            data = np.zeros((capacity, self.dim), dtype=self.dtype)
+            if self.data is not None:
+                data[:self.n] = self.data[:self.n]
+            self.data = data
+
+        for attr in _ROW_ATTRS:
+            old = getattr(self, attr)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+        self.capacity = capacity
+
+    def __getstate__(self):
+        """pickle 时 memmap 只记录路径，内存矩阵只保存有效部分"""
+        state = self.__dict__.copy()
+        if self.path:
+            self.data.flush()
+            state["data"] = None
+        else:
+            state["data"] = self.data[:self.n].copy()
+            state["capacity"] = self.n
+            for attr in _ROW_ATTRS:
+                state[attr] = getattr(self, attr)[:self.n].copy()
+        return state
+
+    def __setstate__(self, state):
+        if "face_bbox" not in state:
+            # 旧版本状态没有人脸框
+            state["face_bbox"] = np.full((len(state["face_quality"]), 4), np.nan, dtype=np.float32)
+        state.setdefault("image_det_size", {})
+        self.__dict__.update(state)
+        if self.path:
+            self.data = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(self.capacity, self.dim))
+
+    def flush(self):
+        if self.path and self.data is not None:
+            self.data.flush()
+
+    def close(self):
+        """写回并关闭 memmap（之前 features() / matrix 返回的视图随之失效），内存矩阵不受影响"""
+        if not self.path or self.data is None:
+            return
+        self.data.flush()
+        mm = getattr(self.data, "_mmap", None)
+        self.data = None
+        if mm is not None:
+            mm.close()
+
+    # ------------------ 写入 ------------------
+    def add_image(self, name, features, qualities=None, det_size=None):
+        """
+        追加一张图片的人脸特征（可为空）。qualities 可以是 quality_utils 的 dict 列表或分数数组。
+        det_size 为该图使用的检测尺寸，None 时取人脸记录中的检测尺寸（都没有则不记录）。
+        同名图片再次写入时旧行作废。
+        """
+        feats = np.asarray(features, dtype=np.float32).reshape(-1, self.dim)
+        feats = feats / (np.linalg.norm(feats, axis=1, keepdims=True) + 1e-6)
+        k = len(feats)
+
+        if name in self.image_rows:
+            self.dead += self.image_rows[name][1]
+        if name not in self.image_ids:
+            self.image_ids[name] = len(self.images)
+            self.images.append(name)
+
+        if self.n + k > self.capacity:
+            self._grow(max(self.capacity * 2, self.n + k))
+
+        start = self.n
+        self.data[start:start + k] = feats.astype(self.dtype)
+        self.face_image[start:start + k] = self.image_ids[name]
+        score, face_sizes, bbox = _split_qualities(qualities, k)
+        self.face_quality[start:start + k] = score
+        self.face_det_size[start:start + k] = face_sizes
+        self.face_bbox[start:start + k] = bbox
+        self.image_rows[name] = (start, k)
+        self.n += k
+        if det_size is None and k:
+            det_size = int(self.face_det_size[start:start + k].max()) or None   # 0 表示未知
+        if det_size is None:
+            self.image_det_size.pop(name, None)
+        else:
+            self.image_det_size[name] = int(det_size)
+
+    def add_alias(self, name, target):
+        """name 与 target 共享同一组人脸行（近重复图片），不复制特征"""
+        if target not in self.image_rows:
+            return
+        if name not in self.image_ids:
+            self.image_ids[name] = len(self.images)
+            self.images.append(name)
+        self.image_rows[name] = self.image_rows[target]
+        if target in self.image_det_size:
+            self.image_det_size[name] = self.image_det_size[target]
+
+    def remove_image(self, name):
+        if name in self.image_rows:
+            self.dead += self.image_rows.pop(name)[1]
+        self.image_det_size.pop(name, None)
+
+    def compact(self):
+        """失效行超过一半时重排，只保留仍被引用的行"""
+        if self.dead * 2 < self.n:
+            return
+        ranges = {}
+        for name, (start, k) in self.image_rows.items():
+            ranges.setdefault((start, k), []).append(name)
+
+        old = self.data
+        meta = self._row_meta(slice(0, self.n)).copy()
+        live = sum(k for _, k in ranges)
+        if self.path:
+            tmp_path = self.path + ".tmp"
+            fresh = EmbeddingMatrix(self.dim, self.dtype, tmp_path, max(live, INITIAL_CAPACITY))
+        else:
+            fresh = EmbeddingMatrix(self.dim, self.dtype, None, max(live, INITIAL_CAPACITY))
+
+        for (start, k), names in ranges.items():
+            fresh.add_image(names[0], old[start:start + k], meta[start:start + k] if k else None,
+                            self.image_det_size.get(names[0]))
+            for alias in names[1:]:
+                fresh.add_alias(alias, names[0])
+
+        if self.path:
+            # 两个文件都关闭映射后再替换，否则 Windows 下 os.replace 失败
+            old = None
+            self.close()
+            fresh.close()
+            os.replace(tmp_path, self.path)
+            fresh.path = self.path
+            fresh.data = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(fresh.capacity, self.dim))
+        self.__dict__.update(fresh.__dict__)
+
+    # ------------------ 读取 ------------------
+    def __contains__(self, name):
+        return name in self.image_rows
+
+    def __len__(self):
+        return len(self.image_rows)
+
+    @property
+    def matrix(self):
+        """(n, dim) 视图，包括已失效的行"""
+        return self.data[:self.n]
+
+    def rows(self, name):
+        """某张图片的人脸行号 range"""
+        start, k = self.image_rows.get(name, (0, 0))
+        return range(start, start + k)
+
+    def features(self, name):
+        """某张图片的人脸特征视图（不复制）"""
+        start, k = self.image_rows.get(name, (0, 0))
+        return self.data[start:start + k]
+
+    def qualities(self, name):
+        start, k = self.image_rows.get(name, (0, 0))
+        return self.face_quality[start:start + k]
+
+    def det_sizes(self, name):
+        start, k = self.image_rows.get(name, (0, 0))
+        return self.face_det_size[start:start + k]
+
+    def det_size(self, name):
+        """该图使用的检测尺寸，未知时为 None"""
+        return self.image_det_size.get(name)
+
+    def bboxes(self, name):
+        start, k = self.image_rows.get(name, (0, 0))
+        return self.face_bbox[start:start + k]
+
+    def _row_meta(self, rows):
+        """(k, 6) 数组：质量、检测尺寸、人脸框，可直接作为 add_image 的 qualities"""
+        return np.concatenate([
+            self.face_quality[rows, None], self.face_det_size[rows, None].astype(np.float32), self.face_bbox[rows]
+        ], axis=1)
+
+    def copy_image(self, source, name, new_name=None):
+        """从另一个 EmbeddingMatrix 复制一张图片的特征、质量和人脸框（可改名）"""
+        start, k = source.image_rows.get(name, (0, 0))
+        self.add_image(new_name or name, source.features(name), source._row_meta(slice(start, start + k)),
+                       source.det_size(name))
+
+    def nbytes(self):
+        return self.n * self.dim * self.dtype.itemsize
+
+
+_ROW_ATTRS = ("face_image", "face_quality", "face_det_size", "face_bbox")
+
+
+def _split_qualities(qualities, k):
+    """
+    把质量信息统一成 (分数数组, 检测尺寸数组, (k, 4) 人脸框)，未知分数 / 人脸框用 NaN。
+    数组形式的列依次为 分数、检测尺寸、x1、y1、x2、y2（后面的列可以省略）。
+    """
+    bbox = np.full((k, 4), np.nan, dtype=np.float32)
+    if qualities is None or len(qualities) != k or k == 0:
+        return np.full(k, np.nan, dtype=np.float32), np.zeros(k, dtype=np.int16), bbox
+    if k and isinstance(qualities[0], dict):
+        score = [q.get("score", np.nan) for q in qualities]
+        det_size = [q.get("det_size", 0) for q in qualities]
+        for i, q in enumerate(qualities):
+            if q.get("bbox") is not None:
+                bbox[i] = q["bbox"]
+        return np.asarray(score, dtype=np.float32), np.asarray(det_size, dtype=np.int16), bbox
+    arr = np.asarray(qualities, dtype=np.float32).reshape(k, -1)
+    det_size = arr[:, 1] if arr.shape[1] > 1 else np.zeros(k)
+    if arr.shape[1] >= 6:
+        bbox = arr[:, 2:6]
+    return arr[:, 0], det_size.astype(np.int16), bbox
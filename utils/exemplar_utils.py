@@ -0,0 +1,86 @@
+import numpy as np
+
+EXEMPLAR_K = 12          # 每个角色排在最前面的代表图数量
+QUALITY_FLOOR = 0.25     # 最远点采样时低质量人脸的最低权重，质量 1 的权重为 1
+
+
+def _normalize(v):
+    return v / (np.linalg.norm(v, axis=-1, keepdims=True) + 1e-6)
+
+
+def image_vectors(images, embeddings):
+    """
+    每张图取一张代表人脸：先用全部人脸的均值作为初始中心，每张图选与之最相似的人脸，
+    再用选出的人脸重新求中心并再选一次（多人同框时选到的是该角色的脸）。
+    返回 (有人脸的图片下标, (M, D) 特征, (M,) 质量, 中心)，没有人脸时特征为空。
+    """
+    spans = [embeddings.image_rows.get(name, (0, 0)) for name in images]
+    has_face = np.array([k > 0 for _, k in spans], dtype=bool)
+    idx = np.flatnonzero(has_face)
+    if not len(idx):
+        return idx, np.zeros((0, embeddings.dim), np.float32), np.zeros(0, np.float32), None
+
+    counts = np.array([spans[i][1] for i in idx])
+    rows = np.concatenate([np.arange(spans[i][0], spans[i][0] + spans[i][1]) for i in idx])
+    owner = np.repeat(np.arange(len(idx)), counts)
+    feats = embeddings.matrix[rows].astype(np.float32)
+
+    center = _normalize(feats.mean(axis=0))
+    for _ in range(2):
+        sims = feats @ center
+        # 每张图内按相似度降序，取每组第一个
+        order = np.lexsort((-sims, owner))
+        first = order[np.concatenate([[0], np.cumsum(counts)[:-1]])]
+        center = _normalize(feats[first].mean(axis=0))
+
+    quality = embeddings.face_quality[rows[first]].astype(np.float32)
+    quality = np.where(np.isnan(quality), 0.5, quality)
+    return idx, feats[first], quality, center
+
+
+def rank_exemplars(feats, quality, center, k=EXEMPLAR_K):
+    """
+    返回 (排序后的下标, 与中心的相似度)：
+    先是 medoid，然后按 “到已选集合的最小余弦距离 × 质量权重” 做最远点采样直到 k 个，
+    其余按与中心的相似度降序（最后几张即最可能分错的离群图）。
+    """
+    n = len(feats)
+    sims = feats @ center
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), sims
+    # 余弦 medoid：与其余所有点相似度之和最大（X @ ΣX 一次矩阵乘法）
+    medoid = int(np.argmax(feats @ feats.sum(axis=0)))
+    weight = QUALITY_FLOOR + (1 - QUALITY_FLOOR) * np.clip(quality, 0, 1)
+
+    chosen = [medoid]
+    min_dist = 1 - feats @ feats[medoid]
+    min_dist[medoid] = -np.inf
+    for _ in range(min(k, n) - 1):
+        pick = int(np.argmax(min_dist * weight))
+        if min_dist[pick] <= 0:
+            break  # 剩下的都与已选的重复
+        chosen.append(pick)
+        min_dist = np.minimum(min_dist, 1 - feats @ feats[pick])
+        min_dist[chosen] = -np.inf
+
+    rest = np.setdiff1d(np.arange(n), chosen)
+    rest = rest[np.argsort(-sims[rest], kind="stable")]
+    return np.concatenate([np.array(chosen, dtype=np.int64), rest]), sims
+
+
+def order_role_images(groups, embeddings, k=EXEMPLAR_K):
+    """
+    把每个角色的图片排成 “代表图在前、离群图在后” 的顺序，返回 {角色: [图片, ...]}。
+    没有人脸特征的图片排在最后。
+    """
+    ordered = {}
+    for role, images in groups.items():
+        images = sorted(images)
+        idx, feats, quality, center = image_vectors(images, embeddings)
+        if center is None:
+            ordered[role] = images
+            continue
+        rank, _ = rank_exemplars(feats, quality, center, k)
+        no_face = np.setdiff1d(np.arange(len(images)), idx)
+        ordered[role] = [images[i] for i in idx[rank]] + [images[i] for i in no_face]
+    return ordered
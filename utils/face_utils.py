@@ -1,31 +1,195 @@
 import insightface
 import numpy as np
 import os
+import time
+import contextvars
+from contextlib import contextmanager
 import cv2
+from .quality_utils import face_quality
+from .quant_utils import split_model_name, quantize_recognition_model
+from .trace_utils import span, count
 
 model_name = 'buffalo_l' # 'antelopev2'#buffalo_l
-# 初始化模型
-model = insightface.app.FaceAnalysis(name=model_name, providers=['CPUExecutionProvider'])
-model.prepare(ctx_id=0)
+# 模型懒加载：子进程 import 本模块时不会立即初始化；按模型名缓存
+_models = {}
 
 NORM_THRESHOLD = 0.5 # 人脸特征向量范数过滤阈值
 DET_THRESHOLD = 0.75  # 人脸检测置信度过滤阈值
 
+ADAPTIVE_DET_SIZES = (320, 640)  # 自适应检测：先低分辨率，必要时升级到更高分辨率
+SMALL_FACE_RATIO = 0.05          # 人脸短边 / 图像短边 低于该值视为小脸
+
+
+# ------------------ 模型加载 ------------------
+def load_model(name=model_name, num_threads=0):
+    """
+    初始化 FaceAnalysis；num_threads>0 时限制每个 ONNX session 的线程数。
+    name 带 "-int8" 后缀时识别模型换成动态量化的 INT8 版本（检测等其余模型不变）。
+    """
+    providers = ['CPUExecutionProvider']
+    pack, int8 = split_model_name(name)
+    app = insightface.app.FaceAnalysis(name=pack, providers=providers)
+    app.prepare(ctx_id=0)
+    if int8:
+        app.models['recognition'] = load_recognition_model(name)
+
+    if num_threads > 0:
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = num_threads
+        opts.inter_op_num_threads = 1
+        # insightface 不透传 sess_options，这里按同一模型文件重建 session
+        for m in app.models.values():
+            m.session = ort.InferenceSession(m.model_file, sess_options=opts, providers=providers)
+    return app
+
+
+def get_model(name=model_name):
+    """返回进程内共享的模型，首次调用时加载"""
+    if name not in _models:
+        _models[name] = load_model(name)
+    return _models[name]
+
+
+# ------------------ 嵌入服务客户端 ------------------
+# 设置后 extract_faces 不再本地推理，而是把图片发给共享的嵌入服务（见 service_utils）。
+# 按上下文保存：Streamlit 每个会话的运行各自设置，互不影响
+_client = contextvars.ContextVar("embedding_client", default=None)
+_process_client = None   # 进程级客户端：worker 进程启动时设置，或由环境变量 FACE_EMBED_SOCKET 指定
+
+
+@contextmanager
+def use_embedding_client(client):
+    """
+    with use_embedding_client(client): ...  期间当前上下文的 extract_faces 走 client（None 为本地模型）；
+    client 需提供 analyze_faces(img, norm_threshold, det_threshold, det_sizes)
+    """
+    token = _client.set(client)
+    try:
+        yield client
+    finally:
+        _client.reset(token)
+
+
+def set_process_embedding_client(client):
+    """设置本进程的默认客户端（只在独立的 worker 进程中使用，不影响其他会话）"""
+    global _process_client
+    _process_client = client
+
+
+def get_embedding_client():
+    """当前上下文的客户端，没有时为进程级客户端；环境变量 FACE_EMBED_SOCKET 在进程启动时设置时自动连接"""
+    global _process_client
+    client = _client.get()
+    if client is not None:
+        return client
+    if _process_client is None and os.environ.get("FACE_EMBED_SOCKET"):
+        from .service_utils import EmbeddingClient
+        _process_client = EmbeddingClient(os.environ["FACE_EMBED_SOCKET"])
+    return _process_client
+
+
+_rec_models = {}
+
+
+def load_recognition_model(name=model_name):
+    """
+    只加载模型包中的识别模型（ArcFace），用于在对齐裁剪上重新提特征。
+    name 带 "-int8" 后缀时首次使用会量化 FP32 模型并缓存（见 quant_utils）。
+    """
+    if name in _rec_models:
+        return _rec_models[name]
+    pack, int8 = split_model_name(name)
+    model_dir = os.path.join(os.path.expanduser("~/.insightface/models"), pack)
+    if not os.path.isdir(model_dir):
+        load_model(pack)  # 触发模型包下载
+    for f in sorted(os.listdir(model_dir)):
+        if not f.endswith(".onnx"):
+            continue
+        path = os.path.join(model_dir, f)
+        m = insightface.model_zoo.get_model(path, providers=['CPUExecutionProvider'])
+        if m is not None and m.taskname == 'recognition':
+            if int8:
+                m = insightface.model_zoo.get_model(
+                    quantize_recognition_model(path), providers=['CPUExecutionProvider']
+                )
+            m.prepare(ctx_id=0)
+            _rec_models[name] = m
+            return m
+    raise FileNotFoundError(f"no recognition model in {model_dir}")
+
+
+def _detect_at(m, img, size):
+    """按指定输入尺寸检测，size 为 None 时使用 prepare 时的默认尺寸"""
+    input_size = (size, size) if size else None
+    bboxes, kpss = m.det_model.detect(img, input_size=input_size, max_num=0, metric='default')
+    if bboxes is None or len(bboxes) == 0:
+        return np.zeros((0, 4), np.float32), np.zeros((0, 5, 2), np.float32), np.zeros(0, np.float32)
+    return bboxes[:, :4].astype(np.float32), kpss.astype(np.float32), bboxes[:, 4].astype(np.float32)
+
+
+def detect_boxes(img, face_model=None, det_sizes=None, det_threshold=DET_THRESHOLD):
+    """
+    只做人脸检测，返回 (bboxes(N,4), kpss(N,5,2), det_scores(N,), 实际使用的检测尺寸)。
+    det_sizes 为递增的尺寸序列时自适应：低分辨率没有找到足够大的可信人脸才升级到下一档。
+    """
+    m = face_model or get_model()
+    if not det_sizes:
+        return (*_detect_at(m, img, None), m.det_model.input_size[0])
+
+    short_side = min(img.shape[:2])
+    for size in det_sizes:
+        bboxes, kpss, scores = _detect_at(m, img, size)
+        confident = scores >= det_threshold
+        if confident.any():
+            sides = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1])[confident]
+            if sides.max() >= SMALL_FACE_RATIO * short_side:
+                break
+    return bboxes, kpss, scores, size
+
 
 # ------------------ 工具函数 ------------------
-def extract_feature(image_path,
-                    norm_threshold=NORM_THRESHOLD,
-                    det_threshold=DET_THRESHOLD):
-    """提取人脸特征，过滤掉低质量人脸"""
-    img = cv2.imread(image_path)
-    if img is None:
-        return []
+def _faces_adaptive(m, img, det_sizes, det_threshold):
+    """自适应尺寸检测后，按 FaceAnalysis.get 的方式对可信人脸运行其余模型"""
+    from insightface.app.common import Face
 
-    faces = model.get(img)
+    bboxes, kpss, scores, size = detect_boxes(img, m, det_sizes, det_threshold)
+    faces = []
+    for bbox, kps, score in zip(bboxes, kpss, scores):
+        face = Face(bbox=bbox, kps=kps, det_score=score)
+        if score >= det_threshold:
+            for taskname, sub_model in m.models.items():
+                if taskname != 'detection':
+                    sub_model.get(img, face)
+        faces.append(face)
+    return faces, size
+
+
+def detect_faces(img, image_path="",
+                 norm_threshold=NORM_THRESHOLD,
+                 det_threshold=DET_THRESHOLD,
+                 face_model=None,
+                 det_sizes=None,
+                 return_size=False):
+    """
+    检测 + 提取特征，返回通过置信度/范数过滤的 insightface Face 对象。
+    每个 Face 的 det_size 记录检测时使用的输入尺寸；det_sizes 见 detect_boxes。
+    return_size=True 时返回 (faces, 该图使用的检测尺寸)，没有人脸时尺寸同样有效。
+    """
+    m = face_model or get_model()
+    start = time.perf_counter()
+    if det_sizes:
+        faces, size = _faces_adaptive(m, img, det_sizes, det_threshold)
+    else:
+        faces, size = m.get(img), m.det_model.input_size[0]
+    size = int(size)
+    count("inference_ms", (time.perf_counter() - start) * 1000)
+    count("images_inferred")
+    count(f"images_det_{size}")
     if not faces:
-        return []
+        return ([], size) if return_size else []
 
-    features = []
+    kept = []
     for f in faces:
         if f.det_score is not None and f.det_score < det_threshold:
             continue  # 置信度太低
@@ -35,8 +199,69 @@ def extract_feature(image_path,
         norm = np.linalg.norm(emb)
         if norm < norm_threshold:  # 特征向量太小/太弱
             continue
-        print(f.det_score, norm,image_path)
-        features.append(emb)
+        f.det_size = size
+        kept.append(f)
+    count("faces_detected", len(faces))
+    count("faces_kept", len(kept))
+    return (kept, size) if return_size else kept
+
+
+def analyze_faces(image_path,
+                  norm_threshold=NORM_THRESHOLD,
+                  det_threshold=DET_THRESHOLD,
+                  face_model=None,
+                  img=None,
+                  det_sizes=None):
+    """
+    提取人脸特征并评估人脸裁剪质量，返回 (features, qualities, 检测尺寸)，前两者一一对应。
+    检测尺寸是该图实际使用的输入尺寸（没有人脸的图同样记录），图片无法解码时为 None。
+    已设置嵌入服务客户端且未指定 face_model 时交给服务端，服务不可用时退回本地模型。
+    img 为已解码图像时不再读盘。
+    """
+    if img is None:
+        img = cv2.imread(image_path)
+        count("images_decoded")
+    if img is None:
+        return [], [], None
+
+    client = get_embedding_client() if face_model is None else None
+    if client is not None:
+        try:
+            with span("embed_server_request"):
+                return client.analyze_faces(img, norm_threshold, det_threshold, det_sizes)
+        except (OSError, RuntimeError) as e:
+            print(f"嵌入服务不可用，改为本地推理: {e}")
+
+    kept, size = detect_faces(img, image_path, norm_threshold, det_threshold, face_model, det_sizes,
+                              return_size=True)
+    if not kept:
+        return [], [], size
+
+    features = [f.embedding for f in kept]
+    qualities = face_quality(img, kept)
+    for q in qualities:
+        q["det_size"] = size
+    return features, qualities, size
+
+
+def extract_faces(image_path,
+                  norm_threshold=NORM_THRESHOLD,
+                  det_threshold=DET_THRESHOLD,
+                  face_model=None,
+                  img=None,
+                  det_sizes=None):
+    """返回 (features, qualities)，见 analyze_faces"""
+    return analyze_faces(image_path, norm_threshold, det_threshold, face_model, img, det_sizes)[:2]
+
+
+def extract_feature(image_path,
+                    norm_threshold=NORM_THRESHOLD,
+                    det_threshold=DET_THRESHOLD,
+                    face_model=None,
+                    img=None,
+                    det_sizes=None):
+    """提取人脸特征，过滤掉低质量人脸；img 为已解码图像时不再读盘"""
+    features, _ = extract_faces(image_path, norm_threshold, det_threshold, face_model, img, det_sizes)
     return features
 
 
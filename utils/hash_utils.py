@@ -0,0 +1,144 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+HASH_BITS = 64
+DUP_DISTANCE = 5        # 汉明距离 <= 该值视为近重复
+HASH_THREADS = 4
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+# ------------------ 批量计算哈希 ------------------
+def _load_small_gray(path):
+    """JPEG 在解码时直接 1/8 降采样，只为哈希服务，比完整解码快很多"""
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    return img
+
+
+def _pack_bits(bits):
+    """(N, 64) bool -> (N,) uint64"""
+    return np.packbits(bits.astype(np.uint8), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def dhash_batch(grays):
+    """差值哈希：缩放到 9x8，比较相邻像素，整批向量化"""
+    small = np.stack([cv2.resize(g, (9, 8), interpolation=cv2.INTER_AREA) for g in grays])
+    return _pack_bits((small[:, :, 1:] > small[:, :, :-1]).reshape(len(small), -1))
+
+
+def phash_batch(grays):
+    """感知哈希：32x32 DCT 取左上 8x8 低频，与中位数比较，整批向量化"""
+    small = np.stack([
+        cv2.resize(g, (32, 32), interpolation=cv2.INTER_AREA) for g in grays
+    ]).astype(np.float32)
+    dct = np.einsum("ij,njk,lk->nil", _DCT32, small, _DCT32)[:, :8, :8].reshape(len(small), -1)
+    med = np.median(dct[:, 1:], axis=1, keepdims=True)  # 去掉直流分量
+    return _pack_bits(dct > med)
+
+
+def compute_hashes(paths, method="dhash", num_threads=HASH_THREADS):
+    """
+    返回 (有效路径列表, uint64 哈希数组)。读图由线程池并行，哈希计算整批完成；
+    读取失败的文件不参与去重。
+    """
+    with ThreadPoolExecutor(max_workers=num_threads) as pool:
+        grays = list(pool.map(_load_small_gray, paths))
+    valid = [(p, g) for p, g in zip(paths, grays) if g is not None]
+    if not valid:
+        return [], np.zeros(0, dtype=np.uint64)
+    fn = phash_batch if method == "phash" else dhash_batch
+    return [p for p, _ in valid], fn([g for _, g in valid])
+
+
+def hamming(a, b):
+    """汉明距离，a/b 为 uint64 标量或数组（可广播）"""
+    x = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    return _POPCOUNT8[np.atleast_1d(x).view(np.uint8)].reshape(np.shape(x) + (8,)).sum(axis=-1)
+
+
+# ------------------ 汉明距离索引 ------------------
+class HammingIndex:
+    """
+    多索引哈希：把 64 位切成 max_distance+1 段，每段建一张精确查找表。
+    由抽屉原理，距离 <= max_distance 的两个哈希至少有一段完全相同，
+    因此只需比较段命中的候选。
+    """
+
+    def __init__(self, max_distance=DUP_DISTANCE):
+        self.max_distance = max_distance
+        self.num_bands = max_distance + 1
+        bounds = np.linspace(0, HASH_BITS, self.num_bands + 1).astype(int)
+        # 转成 Python int：numpy int64 与 >= 2**63 的 Python int 移位会溢出
+        self.bands = [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        self.tables = [defaultdict(list) for _ in self.bands]
+        self.hashes = []
+
+    def _band_values(self, h):
+        h = int(h)
+        return [(h >> lo) & ((1 << (hi - lo)) - 1) for lo, hi in self.bands]
+
+    def add(self, h):
+        """加入一个哈希，返回其编号"""
+        idx = len(self.hashes)
+        self.hashes.append(int(h))
+        for table, v in zip(self.tables, self._band_values(h)):
+            table[v].append(idx)
+        return idx
+
+    def query(self, h):
+        """返回距离 <= max_distance 的 [(编号, 距离), ...]，按距离升序"""
+        cand = set()
+        for table, v in zip(self.tables, self._band_values(h)):
+            cand.update(table.get(v, ()))
+        if not cand:
+            return []
+        cand = sorted(cand)
+        dist = hamming(np.array([self.hashes[i] for i in cand], dtype=np.uint64), h)
+        hits = [(i, int(d)) for i, d in zip(cand, dist) if d <= self.max_distance]
+        return sorted(hits, key=lambda x: x[1])
+
+
+# ------------------ 去重 ------------------
+def dedup_paths(paths, max_distance=DUP_DISTANCE, method="dhash", group_keys=None):
+    """
+    按顺序贪心去重，返回 (代表图路径列表, {被合并路径: 代表图路径})。
+    group_keys 不为空时只在同一 key（例如同一镜头）内合并。
+    读取失败的文件原样保留为代表图。
+    """
+    paths = list(paths)
+    valid, hashes = compute_hashes(paths, method)
+    hash_of = dict(zip(valid, hashes))
+    key_of = dict(zip(paths, group_keys)) if group_keys is not None else {}
+
+    indexes = defaultdict(lambda: HammingIndex(max_distance))
+    reps_by_index = defaultdict(list)
+    representatives = []
+    duplicates = {}
+    for p in paths:
+        if p not in hash_of:
+            representatives.append(p)
+            continue
+        key = key_of.get(p)
+        hits = indexes[key].query(hash_of[p])
+        if hits:
+            duplicates[p] = reps_by_index[key][hits[0][0]]
+            continue
+        indexes[key].add(hash_of[p])
+        reps_by_index[key].append(p)
+        representatives.append(p)
+    return representatives, duplicates
@@ -0,0 +1,52 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+from .trace_utils import count
+
+PREFETCH_THREADS = 4   # 读盘 + JPEG 解码线程数
+PREFETCH_AHEAD = 16    # 最多提前解码的图片数（限制内存）
+
+
+# ------------------ 预读解码 ------------------
+def iter_images(paths, num_threads=PREFETCH_THREADS, max_ahead=PREFETCH_AHEAD):
+    """
+    按顺序产出 (path, BGR 图像)，后台线程提前读盘解码。
+    cv2.imread 解码时释放 GIL，因此 I/O 和解码可以与模型推理重叠。
+    解码失败时图像为 None。
+    """
+    paths = list(paths)
+    if not paths:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, num_threads)) as pool:
+        pending = deque()
+        it = iter(paths)
+
+        for path in it:
+            pending.append((path, pool.submit(cv2.imread, path)))
+            if len(pending) >= max_ahead:
+                break
+
+        while pending:
+            path, fut = pending.popleft()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(cv2.imread, nxt)))
+            count("images_decoded")
+            yield path, fut.result()
+
+
+# ------------------ 清晰度 ------------------
+def image_clarity(img):
+    """返回 0~1 之间清晰度分数（输入为已解码的 BGR 或灰度图）"""
+    if img is None:
+        return 0.3
+
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    lap = cv2.Laplacian(gray, cv2.CV_64F)
+    score = lap.var()
+
+    # normalize
+    score = min(score / 1500.0, 1.0)
+    return max(score, 0.05)
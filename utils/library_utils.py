@@ -0,0 +1,231 @@
+import os
+import json
+import numpy as np
+
+EMB_DIM = 512
+MAX_EXEMPLARS = 32       # 每个角色最多保留的样本特征数
+DUP_SIM = 0.95           # 与已有样本相似度高于此值的新样本视为重复
+NPROBE = 8               # 查询时探测的倒排列表数
+KMEANS_ITERS = 10
+
+
+def _normalize_rows(x):
+    x = np.asarray(x, dtype=np.float32).reshape(-1, EMB_DIM)
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-6)
+
+
+def _spherical_kmeans(x, k, iters=KMEANS_ITERS, seed=0):
+    """余弦 kmeans，返回 (k, D) 单位向量中心"""
+    rng = np.random.default_rng(seed)
+    centers = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(x @ centers.T, axis=1)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                centers[c] = members.sum(axis=0)
+        centers = _normalize_rows(centers)
+    return centers
+
+
+class CharacterLibrary:
+    """
+    跨集数角色库：每个命名角色保存一个 centroid 和若干样本特征。
+    检索使用纯 NumPy 的 IVF 索引（粗聚类 + 倒排列表），只比较 nprobe 个列表中的向量。
+
+    目录结构：
+        index.npz        特征矩阵(float16)、所属角色、倒排列表编号、粗聚类中心
+        characters.json  角色名列表、累计人脸数
+    """
+
+    def __init__(self, library_dir):
+        self.library_dir = library_dir
+        self.names = []                 # 角色 id -> 名称
+        self.counts = []                # 角色 id -> 累计人脸数（用于 centroid 滑动平均）
+        self.centroids = np.zeros((0, EMB_DIM), dtype=np.float32)
+        self.vectors = np.zeros((0, EMB_DIM), dtype=np.float16)  # 样本特征
+        self.owner = np.zeros(0, dtype=np.int32)                 # 样本 -> 角色 id
+        self.list_id = np.zeros(0, dtype=np.int32)               # 样本 -> 倒排列表
+        self.coarse = np.zeros((0, EMB_DIM), dtype=np.float32)   # 粗聚类中心
+        self.trained_size = 0
+        self._order = None              # 按倒排列表排序后的样本下标（懒构建）
+        self._bounds = None
+        self.load()
+
+    # ------------------ 持久化 ------------------
+    def load(self):
+        """加载角色库，不存在时为空库"""
+        meta_path = os.path.join(self.library_dir, "characters.json")
+        index_path = os.path.join(self.library_dir, "index.npz")
+        if not (os.path.exists(meta_path) and os.path.exists(index_path)):
+            return
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            data = np.load(index_path)
+            self.names = meta["names"]
+            self.counts = meta["counts"]
+            self.trained_size = meta.get("trained_size", 0)
+            self.centroids = data["centroids"].astype(np.float32)
+            self.vectors = data["vectors"]
+            self.owner = data["owner"]
+            self.list_id = data["list_id"]
+            self.coarse = data["coarse"]
+        except Exception as e:
+            print(f"加载角色库失败: {e}")
+
+    def save(self):
+        """写回磁盘（先写临时文件再替换，避免中途中断损坏索引）"""
+        os.makedirs(self.library_dir, exist_ok=True)
+        index_path = os.path.join(self.library_dir, "index.npz")
+        tmp_path = index_path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids.astype(np.float16),
+                 vectors=self.vectors, owner=self.owner,
+                 list_id=self.list_id, coarse=self.coarse)
+        os.replace(tmp_path, index_path)
+        with open(os.path.join(self.library_dir, "characters.json"), "w", encoding="utf-8") as f:
+            json.dump({"names": self.names, "counts": self.counts,
+                       "trained_size": self.trained_size}, f, ensure_ascii=False)
+
+    def __len__(self):
+        return len(self.names)
+
+    # ------------------ 索引 ------------------
+    def _maybe_retrain(self):
+        """样本数翻倍后重新训练粗聚类，nlist ≈ sqrt(N)"""
+        n = len(self.vectors)
+        if n < 64:
+            self.coarse = np.zeros((0, EMB_DIM), dtype=np.float32)
+            self.list_id = np.zeros(n, dtype=np.int32)
+            return
+        if self.trained_size and n < 2 * self.trained_size:
+            return
+        x = _normalize_rows(self.vectors)
+        nlist = int(np.sqrt(n))
+        self.coarse = _spherical_kmeans(x, nlist)
+        self.list_id = np.argmax(x @ self.coarse.T, axis=1).astype(np.int32)
+        self.trained_size = n
+
+    def _build_lists(self):
+        """倒排列表：样本按 list_id 排序，_bounds[i]:_bounds[i+1] 为第 i 个列表"""
+        self._order = np.argsort(self.list_id, kind="stable")
+        self._bounds = np.searchsorted(self.list_id[self._order], np.arange(len(self.coarse) + 1))
+
+    def _assign_lists(self, x):
+        if len(self.coarse) == 0:
+            return np.zeros(len(x), dtype=np.int32)
+        return np.argmax(x @ self.coarse.T, axis=1).astype(np.int32)
+
+    def _candidates(self, q):
+        """单个查询向量的候选样本下标"""
+        if len(self.coarse) == 0:
+            return np.arange(len(self.vectors))
+        if self._order is None:
+            self._build_lists()
+        probe = np.argsort(-(self.coarse @ q))[:NPROBE]
+        return np.concatenate([self._order[self._bounds[p]:self._bounds[p + 1]] for p in probe])
+
+    # ------------------ 检索 ------------------
+    def match(self, queries, threshold=0.5):
+        """
+        为每个查询特征返回 (角色名, 相似度)，低于阈值时角色名为 None。
+        相似度取样本最大相似度与 centroid 相似度中的较大者。
+        """
+        queries = _normalize_rows(queries)
+        results = []
+        if len(self.names) == 0:
+            return [(None, 0.0) for _ in range(len(queries))]
+
+        for q in queries:
+            cand = self._candidates(q)
+            best_id, best_sim = None, -1.0
+            if len(cand):
+                sims = self.vectors[cand].astype(np.float32) @ q
+                k = int(np.argmax(sims))
+                best_id, best_sim = int(self.owner[cand[k]]), float(sims[k])
+
+                # 用候选角色的 centroid 复核
+                for cid in np.unique(self.owner[cand]):
+                    sim = float(self.centroids[cid] @ q)
+                    if sim > best_sim:
+                        best_id, best_sim = int(cid), sim
+
+            if best_id is None or best_sim < threshold:
+                results.append((None, best_sim))
+            else:
+                results.append((self.names[best_id], best_sim))
+        return results
+
+    # ------------------ 增量更新 ------------------
+    def add(self, name, features):
+        """把一组人脸特征并入角色 name（不存在则新建），只更新索引不落盘"""
+        feats = _normalize_rows(features)
+        if len(feats) == 0:
+            return
+
+        if name in self.names:
+            cid = self.names.index(name)
+        else:
+            cid = len(self.names)
+            self.names.append(name)
+            self.counts.append(0)
+            self.centroids = np.vstack([self.centroids, np.zeros((1, EMB_DIM), dtype=np.float32)])
+
+        # centroid 按累计人脸数滑动平均
+        n_old = self.counts[cid]
+        merged = self.centroids[cid] * n_old + feats.sum(axis=0)
+        self.centroids[cid] = merged / (np.linalg.norm(merged) + 1e-6)
+        self.counts[cid] = n_old + len(feats)
+
+        # 样本：跳过近重复，超过上限时替换最旧的样本
+        own_rows = np.flatnonzero(self.owner == cid)
+        own = self.vectors[own_rows].astype(np.float32)
+        new_rows = []
+        for f in feats:
+            if len(own) and float(np.max(own @ f)) >= DUP_SIM:
+                continue
+            if len(own_rows) + len(new_rows) < MAX_EXEMPLARS:
+                new_rows.append(f)
+            elif len(own_rows):
+                oldest, own_rows = own_rows[0], own_rows[1:]
+                self.vectors[oldest] = f.astype(np.float16)
+                self.list_id[oldest] = self._assign_lists(f[None])[0]
+                own_rows = np.append(own_rows, oldest)
+            own = np.vstack([own, f[None]])
+
+        self._order = None
+        if new_rows:
+            new_rows = np.asarray(new_rows, dtype=np.float32)
+            self.vectors = np.vstack([self.vectors, new_rows.astype(np.float16)])
+            self.owner = np.concatenate([self.owner, np.full(len(new_rows), cid, dtype=np.int32)])
+            self.list_id = np.concatenate([self.list_id, self._assign_lists(new_rows)])
+        self._maybe_retrain()
+
+    def rename(self, old_name, new_name):
+        """重命名角色；新名称已存在时合并特征"""
+        if old_name not in self.names or old_name == new_name:
+            return
+        old_id = self.names.index(old_name)
+        if new_name not in self.names:
+            self.names[old_id] = new_name
+            return
+
+        rows = np.flatnonzero(self.owner == old_id)
+        feats = np.vstack([self.centroids[old_id][None], self.vectors[rows].astype(np.float32)])
+        self.remove(old_name)
+        self.add(new_name, feats)
+
+    def remove(self, name):
+        """删除角色及其样本"""
+        if name not in self.names:
+            return
+        cid = self.names.index(name)
+        keep = self.owner != cid
+        self.vectors = self.vectors[keep]
+        self.list_id = self.list_id[keep]
+        owner = self.owner[keep]
+        self.owner = np.where(owner > cid, owner - 1, owner).astype(np.int32)
+        self._order = None
+        self.centroids = np.delete(self.centroids, cid, axis=0)
+        del self.names[cid]
+        del self.counts[cid]
@@ -0,0 +1,285 @@
+import os
+import json
+import sqlite3
+import threading
+
+MANIFEST_DB = "manifest.sqlite"
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+# 每个项目（Step 0 的输出目录）一个 SQLite 文件，各步骤按列读取 / 追加，
+# 不再靠 listdir 和 "cut(3.2).jpg" / "scene_4_frame_812.jpg" 这类文件名传递元数据
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    video TEXT NOT NULL,
+    scene_id INTEGER NOT NULL,
+    start_frame INTEGER,
+    end_frame INTEGER,
+    start_sec REAL,
+    end_sec REAL,
+    cut_path TEXT,
+    PRIMARY KEY (video, scene_id)
+);
+CREATE TABLE IF NOT EXISTS frames (
+    path TEXT PRIMARY KEY,          -- 抽帧文件
+    video TEXT,
+    scene_id INTEGER,
+    frame_index INTEGER,
+    timestamp REAL,
+    selected_path TEXT,             -- 选中后落盘的文件（selected/cut(3.2).jpg）
+    selected_name TEXT,
+    duplicate_of TEXT               -- 镜头内近重复帧的代表帧
+);
+CREATE INDEX IF NOT EXISTS frames_scene ON frames (video, scene_id);
+CREATE INDEX IF NOT EXISTS frames_selected ON frames (selected_name);
+CREATE TABLE IF NOT EXISTS faces (
+    image TEXT NOT NULL,            -- frames.path 或 selected_name
+    face_idx INTEGER NOT NULL,
+    emb_row INTEGER,                -- 该阶段 EmbeddingMatrix 中的行号
+    quality REAL,
+    det_size INTEGER,
+    bbox TEXT,                      -- JSON [x1, y1, x2, y2]，未知时为 NULL
+    stage TEXT NOT NULL,
+    PRIMARY KEY (image, face_idx, stage)
+);
+CREATE TABLE IF NOT EXISTS roles (
+    image TEXT NOT NULL,
+    role TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    PRIMARY KEY (image, role, stage)
+);
+"""
+
+TABLE_COLUMNS = {
+    "scenes": ("video", "scene_id", "start_frame", "end_frame", "start_sec", "end_sec", "cut_path"),
+    "frames": ("path", "video", "scene_id", "frame_index", "timestamp", "selected_path", "selected_name",
+               "duplicate_of"),
+    "faces": ("image", "face_idx", "emb_row", "quality", "det_size", "bbox", "stage"),
+    "roles": ("image", "role", "stage"),
+}
+
+
+def list_images(folder, manifest=None):
+    """
+    folder 中的图片文件名：只 scandir 一次；有清单时清单登记的在前，
+    手动放入、未登记的图片（例如增量模式新加的帧）按文件名排在后面。
+    """
+    with os.scandir(folder) as it:
+        on_disk = {e.name for e in it if e.is_file() and e.name.lower().endswith(IMAGE_EXTS)}
+    registered = manifest.selected_files(folder, on_disk) if manifest else []
+    known = set(registered)
+    return registered + sorted(f for f in on_disk if f not in known)
+
+
+def find_manifest(path, levels=2):
+    """从 path 向上找项目的 manifest（例如 Step 2 的输入 output/frames/selected），找不到返回 None"""
+    path = os.path.abspath(path)
+    for _ in range(levels + 1):
+        if os.path.exists(os.path.join(path, MANIFEST_DB)):
+            return RunManifest(path)
+        path = os.path.dirname(path)
+    return None
+
+
+class RunManifest:
+    """
+    项目级运行清单（SQLite）：镜头、帧号与时间戳、人脸框、特征行号、质量分、角色分配。
+    读取接口都带 columns 参数，只取需要的列。
+    """
+
+    def __init__(self, project_dir):
+        os.makedirs(project_dir, exist_ok=True)
+        self.project_dir = project_dir
+        self.path = os.path.join(project_dir, MANIFEST_DB)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+
+    def _migrate(self):
+        """旧清单缺少的列补上（CREATE TABLE IF NOT EXISTS 不会改已有的表）"""
+        for table, columns in TABLE_COLUMNS.items():
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            if not existing:
+                continue
+            for c in columns:
+                if c not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {c}")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _write(self, sql, rows):
+        with self._lock, self.conn:
+            self.conn.executemany(sql, rows)
+
+    def _query(self, table, columns, where, order_by=()):
+        allowed = TABLE_COLUMNS[table]
+        for c in (*columns, *where, *order_by):
+            if c not in allowed:
+                raise ValueError(f"unknown column {table}.{c}")
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(f"{c} = ?" for c in where)
+        if order_by:
+            sql += " ORDER BY " + ", ".join(order_by)
+        return sql, tuple(where.values())
+
+    def _select(self, table, columns, where):
+        sql, args = self._query(table, columns, where)
+        with self._lock:
+            return self.conn.execute(sql, args).fetchall()
+
+    def iter_rows(self, table, columns, order_by=(), batch_size=1000, **where):
+        """按批产出查询结果，内存中最多一批（流式模式逐批读取长视频的镜头 / 帧）"""
+        sql, args = self._query(table, columns, where, order_by)
+        offset = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute(f"{sql} LIMIT ? OFFSET ?", (*args, batch_size, offset)).fetchall()
+            if not rows:
+                return
+            yield rows
+            offset += len(rows)
+
+    # ------------------ 写入 ------------------
+    def reset_video(self, video):
+        """重新抽帧前清掉该视频的镜头、帧及其人脸/角色记录"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM faces WHERE image IN (SELECT path FROM frames WHERE video = ?)", (video,)
+            )
+            self.conn.execute(
+                "DELETE FROM roles WHERE image IN (SELECT path FROM frames WHERE video = ?)", (video,)
+            )
+            self.conn.execute("DELETE FROM frames WHERE video = ?", (video,))
+            self.conn.execute("DELETE FROM scenes WHERE video = ?", (video,))
+
+    def add_scenes(self, video, scenes):
+        """scenes 为 scenedetect 的 [(start, end), ...]，镜头号从 1 开始"""
+        self.add_scene_rows(video, [
+            (i, int(s.get_frames()), int(e.get_frames()), s.get_seconds(), e.get_seconds())
+            for i, (s, e) in enumerate(scenes, 1)
+        ])
+
+    def add_scene_rows(self, video, rows):
+        """rows: [(scene_id, start_frame, end_frame, start_sec, end_sec), ...]"""
+        self._write(
+            "INSERT OR REPLACE INTO scenes (video, scene_id, start_frame, end_frame, start_sec, end_sec) "
+            "VALUES (?, ?, ?, ?, ?, ?)", [(video, *r) for r in rows]
+        )
+
+    def set_cut_paths(self, video, cut_paths):
+        """cut_paths: {镜头号: 切割出的视频}"""
+        self._write(
+            "UPDATE scenes SET cut_path = ? WHERE video = ? AND scene_id = ?",
+            [(p, video, i) for i, p in cut_paths.items()]
+        )
+
+    def add_frames(self, rows):
+        """rows: [(path, video, scene_id, frame_index, timestamp), ...]"""
+        self._write(
+            "INSERT OR REPLACE INTO frames (path, video, scene_id, frame_index, timestamp) "
+            "VALUES (?, ?, ?, ?, ?)", rows
+        )
+
+    def set_duplicates(self, duplicates):
+        """duplicates: {被合并帧: 代表帧}"""
+        self._write("UPDATE frames SET duplicate_of = ? WHERE path = ?", [(r, d) for d, r in duplicates.items()])
+
+    def set_selected(self, pairs):
+        """pairs: [(抽帧文件, 选中后的文件), ...]；同一文件名之前的选择会被覆盖"""
+        pairs = list(pairs)
+        self._write("UPDATE frames SET selected_path = NULL, selected_name = NULL WHERE selected_name = ?",
+                    [(os.path.basename(dst),) for _, dst in pairs])
+        self._write(
+            "UPDATE frames SET selected_path = ?, selected_name = ? WHERE path = ?",
+            [(dst, os.path.basename(dst), src) for src, dst in pairs]
+        )
+
+    def add_faces(self, embeddings, images, stage, qualities=None):
+        """
+        记录图片的人脸：特征行号、质量、检测尺寸、人脸框取自 EmbeddingMatrix（覆盖该阶段的旧记录），
+        qualities = {图片: extract_faces 返回的 dict 列表} 时人脸框以其中的为准。
+        """
+        qualities = qualities or {}
+        records = []
+        for image in images:
+            rows = embeddings.rows(image)
+            boxes = [q.get("bbox") if isinstance(q, dict) else None for q in qualities.get(image, [])]
+            if len(boxes) != len(rows):
+                boxes = [None if any(v != v for v in b) else [round(float(v), 1) for v in b]
+                         for b in embeddings.bboxes(image)]
+            for i, (r, q, d, b) in enumerate(
+                zip(rows, embeddings.qualities(image), embeddings.det_sizes(image), boxes)
+            ):
+                records.append((
+                    image, i, int(r), None if q != q else float(q), int(d), json.dumps(b) if b else None, stage
+                ))
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM faces WHERE image = ? AND stage = ?", [(image, stage) for image in images]
+            )
+            self.conn.executemany(
+                "INSERT INTO faces (image, face_idx, emb_row, quality, det_size, bbox, stage) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", records
+            )
+
+    def set_roles(self, groups, stage):
+        """groups: {角色: [图片, ...]}，覆盖该阶段之前的分配"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM roles WHERE stage = ?", (stage,))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO roles (image, role, stage) VALUES (?, ?, ?)",
+                [(img, str(role), stage) for role, images in groups.items() for img in images]
+            )
+
+    # ------------------ 读取 ------------------
+    def scenes(self, columns=("scene_id", "start_frame", "end_frame"), **where):
+        return self._select("scenes", columns, where)
+
+    def frames(self, columns=("path",), **where):
+        return self._select("frames", columns, where)
+
+    def faces(self, columns=("image", "emb_row"), **where):
+        return self._select("faces", columns, where)
+
+    def roles(self, columns=("image", "role"), **where):
+        return self._select("roles", columns, where)
+
+    def scene_count(self, video):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM scenes WHERE video = ?", (video,)).fetchone()[0]
+
+    def frames_in_scenes(self, video, first, last, columns=("scene_id", "path")):
+        """镜头号在 [first, last] 之间的帧，按镜头号、帧号排序（流式模式的分页图库）"""
+        sql, args = self._query("frames", columns, {"video": video})
+        sql += " AND scene_id BETWEEN ? AND ? ORDER BY scene_id, frame_index"
+        with self._lock:
+            return self.conn.execute(sql, (*args, first, last)).fetchall()
+
+    def selected_files(self, folder, present=None):
+        """
+        folder 中由本项目写入的选中帧文件名（按清单）；
+        present 为 folder 中已有的文件名集合时按它过滤，不再逐个 stat。
+        """
+        folder = os.path.abspath(folder)
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT selected_path FROM frames WHERE selected_path IS NOT NULL"
+            ).fetchall()
+        return [
+            os.path.basename(p) for (p,) in rows
+            if os.path.dirname(os.path.abspath(p)) == folder
+            and (os.path.basename(p) in present if present is not None else os.path.exists(p))
+        ]
+
+    def cut_videos(self, folder):
+        """folder 中由本项目切割出的视频（按清单），返回 [(镜头号, 路径), ...]"""
+        folder = os.path.abspath(folder)
+        rows = self.scenes(("scene_id", "cut_path"))
+        return sorted(
+            (sid, p) for sid, p in rows
+            if p and os.path.dirname(os.path.abspath(p)) == folder and os.path.exists(p)
+        )
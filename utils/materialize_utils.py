@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import shutil
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from .trace_utils import count, bind_tracer
+
+# copy: 普通复制；hardlink: 硬链接；reflink: 写时复制克隆（btrfs/xfs/APFS）
+# symlink: 符号链接；manifest: 不写文件，只在目标目录记录 manifest.json
+STRATEGIES = ("copy", "hardlink", "reflink", "symlink", "manifest")
+MANIFEST_FILE = "manifest.json"
+MATERIALIZE_WORKERS = 8
+
+FICLONE = 0x40049409  # Linux ioctl: 克隆整个文件
+
+_manifest_lock = threading.Lock()
+
+
+# ------------------ 单文件 ------------------
+def _reflink(src, dst):
+    """写时复制克隆，不支持时抛出 OSError"""
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            try:
+                fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+            except OSError:
+                fd.close()
+                os.remove(dst)
+                raise
+        shutil.copystat(src, dst)
+    elif sys.platform == "darwin":
+        if subprocess.run(["cp", "-c", "-p", src, dst], capture_output=True).returncode != 0:
+            raise OSError("reflink not supported")
+    else:
+        raise OSError("reflink not supported")
+
+
+def is_up_to_date(src, dst, strategy):
+    """目标已存在且与源一致时返回 True（用于跳过）"""
+    if not os.path.lexists(dst):
+        return False
+    try:
+        if strategy == "symlink":
+            return os.path.islink(dst) and os.path.realpath(dst) == os.path.realpath(src)
+        if os.path.islink(dst):
+            return False
+        if os.path.samefile(src, dst):
+            return True
+        # hardlink 跨设备时退回了复制，同样按大小 / mtime 判断
+        s, d = os.stat(src), os.stat(dst)
+        return s.st_size == d.st_size and int(s.st_mtime) == int(d.st_mtime)
+    except OSError:
+        return False
+
+
+def place_file(src, dst, strategy="copy"):
+    """
+    按策略放置一个文件，返回实际使用的策略（hardlink/reflink 失败时退回 copy），
+    已是最新时返回 "skipped"。
+    """
+    if is_up_to_date(src, dst, strategy):
+        return "skipped"
+    if os.path.lexists(dst):
+        os.remove(dst)
+
+    if strategy == "hardlink":
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass  # 跨设备等情况退回复制
+    elif strategy == "reflink":
+        try:
+            _reflink(src, dst)
+            return "reflink"
+        except OSError:
+            pass
+    elif strategy == "symlink":
+        os.symlink(os.path.abspath(src), dst)
+        return "symlink"
+
+    shutil.copy2(src, dst)  # 保留 mtime，下次可据此跳过
+    return "copy"
+
+
+# ------------------ manifest ------------------
+def _update_manifest(dir_path, added=None, removed=()):
+    """合并写入目录下的 manifest.json：{文件名: 源文件绝对路径}"""
+    path = os.path.join(dir_path, MANIFEST_FILE)
+    with _manifest_lock:
+        entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            except Exception as e:
+                print(f"读取 manifest 失败: {e}")
+        entries.update(added or {})
+        for name in removed:
+            entries.pop(name, None)
+        os.makedirs(dir_path, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False, indent=1)
+
+
+def read_manifest(dir_path):
+    """读取目录 manifest，不存在时返回空字典"""
+    path = os.path.join(dir_path, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ------------------ 批量 ------------------
+def materialize(pairs, strategy="copy", workers=MATERIALIZE_WORKERS):
+    """
+    批量放置 [(src, dst), ...]，并行执行并跳过未变化的文件。
+    返回各策略的计数，例如 {"hardlink": 120, "skipped": 30}。
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"unknown materialize strategy: {strategy}")
+    pairs = list(pairs)
+    stats = defaultdict(int)
+    if not pairs:
+        return dict(stats)
+
+    if strategy == "manifest":
+        by_dir = defaultdict(dict)
+        for src, dst in pairs:
+            by_dir[os.path.dirname(dst)][os.path.basename(dst)] = os.path.abspath(src)
+        for dir_path, entries in by_dir.items():
+            _update_manifest(dir_path, added=entries)
+        stats["manifest"] = len(pairs)
+        return dict(stats)
+
+    for dir_path in {os.path.dirname(dst) for _, dst in pairs}:
+        os.makedirs(dir_path, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for used in pool.map(lambda p: place_file(p[0], p[1], strategy), pairs):
+            stats[used] += 1
+    return dict(stats)
+
+
+def remove_materialized(dsts):
+    """删除已放置的文件（包括 manifest 中的记录）"""
+    by_dir = defaultdict(list)
+    for dst in dsts:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        by_dir[os.path.dirname(dst)].append(os.path.basename(dst))
+    for dir_path, names in by_dir.items():
+        if os.path.exists(os.path.join(dir_path, MANIFEST_FILE)):
+            _update_manifest(dir_path, removed=names)
+
+
+# ------------------ 内存帧落盘 ------------------
+FRAMES_INDEX = ".frames.json"
+
+
+def write_frames(items, out_dir, workers=MATERIALIZE_WORKERS):
+    """
+    并行编码保存内存中的帧 [(文件名, 来源标识, BGR 图像), ...]。
+    out_dir/.frames.json 记录每个文件的来源标识，标识未变且文件存在时跳过编码。
+    """
+    import cv2
+
+    index_path = os.path.join(out_dir, FRAMES_INDEX)
+    index = {}
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except Exception as e:
+            print(f"读取帧索引失败: {e}")
+
+    todo = [
+        (name, key, img) for name, key, img in items
+        if not (index.get(name) == key and os.path.exists(os.path.join(out_dir, name)))
+    ]
+
+    def _write(item):
+        name, key, img = item
+        path = os.path.join(out_dir, name)
+        cv2.imwrite(path, img)
+        count("bytes_written", os.path.getsize(path) if os.path.exists(path) else 0)
+        return name, key
+
+    os.makedirs(out_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, key in pool.map(bind_tracer(_write), todo):
+            index[name] = key
+
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    return {"written": len(todo), "skipped": len(items) - len(todo)}
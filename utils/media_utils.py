@@ -0,0 +1,184 @@
+import os
+import re
+import hashlib
+import secrets
+import threading
+import mimetypes
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import quote, unquote
+
+from .proxy_utils import PROXY_DIR
+
+VIDEO_EXTS = (".mp4", ".mov", ".avi", ".mkv", ".webm")   # 同名多个视频时按此顺序优先
+TEXT_EXTS = (".txt", ".srt")
+MEDIA_HOST_ENV = "MEDIA_PUBLIC_HOST"   # 远程浏览时填写浏览器可访问的主机名，默认 127.0.0.1
+MEDIA_BIND_ENV = "MEDIA_BIND_HOST"     # 默认只监听本机；远程浏览需显式设为 0.0.0.0 等
+MEDIA_BIND_DEFAULT = "127.0.0.1"
+MEDIA_PORT = 8600
+CHUNK = 1 << 20
+
+
+def natural_sort_key(s):
+    """Sort strings with numbers in a natural order."""
+    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
+
+
+# ------------------ 目录索引 ------------------
+# (目录, 目录 mtime) -> 扫描结果；文件增删会改变目录 mtime，内容修改不影响索引
+_scan_cache = {}
+
+
+def scan_dir(folder, exts):
+    """一次 scandir 返回 {去扩展名的文件名: 文件名}，同名时取 exts 中靠前的扩展名"""
+    if not folder or not os.path.isdir(folder):
+        return {}
+    key = (os.path.abspath(folder), exts, os.stat(folder).st_mtime_ns)
+    if key in _scan_cache:
+        return _scan_cache[key]
+
+    found = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            ext = ext.lower()
+            if ext not in exts or not entry.is_file():
+                continue
+            old = found.get(stem)
+            if old is None or exts.index(ext) < exts.index(os.path.splitext(old)[1].lower()):
+                found[stem] = entry.name
+
+    # 同一目录只保留最新一份
+    for k in [k for k in _scan_cache if k[:2] == key[:2]]:
+        del _scan_cache[k]
+    _scan_cache[key] = found
+    return found
+
+
+def shot_index(txt_folder, video_folder=None):
+    """
+    返回按自然顺序排列的 [{"name", "txt_path", "video_path", "proxy_path", "poster_path", "cues_path"}]，
+    文本与视频按文件名配对，代理 / 海报 / 字幕缩略图条取自视频目录下的 proxies/（没有时为 None）。
+    每个目录只 scandir 一次，目录未变化时直接用缓存。
+    """
+    texts = scan_dir(txt_folder, TEXT_EXTS)
+    videos = scan_dir(video_folder, VIDEO_EXTS)
+    proxy_dir = os.path.join(video_folder, PROXY_DIR) if video_folder else None
+    proxies = scan_dir(proxy_dir, (".mp4",))
+    posters = scan_dir(proxy_dir, (".jpg",))
+    index = []
+    for stem, name in texts.items():
+        video = videos.get(stem)
+        index.append({
+            "name": name,
+            "txt_path": os.path.join(txt_folder, name),
+            "video_path": os.path.join(video_folder, video) if video else None,
+            "proxy_path": os.path.join(proxy_dir, proxies[stem]) if video and stem in proxies else None,
+            "poster_path": os.path.join(proxy_dir, posters[stem]) if video and stem in posters else None,
+            # <名称>.cues.jpg 在扫描结果中的键为 "<名称>.cues"
+            "cues_path": os.path.join(proxy_dir, posters[stem + ".cues"])
+            if video and stem + ".cues" in posters else None,
+        })
+    index.sort(key=lambda e: natural_sort_key(e["name"]))
+    return index
+
+
+# ------------------ 本地媒体服务 ------------------
+# st.video(路径) 会把整个文件读进 Streamlit 的媒体缓存；这里改为提供支持 Range 的 URL，浏览器按需拉取
+_roots = {}           # 目录 id -> 目录绝对路径
+_root_salt = secrets.token_hex(16)   # 目录 id 加随机盐，不能由路径推算出来
+_server = None
+_server_lock = threading.Lock()
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _resolve(self):
+        parts = unquote(self.path.split("?", 1)[0]).lstrip("/").split("/", 1)
+        if len(parts) != 2 or parts[0] not in _roots:
+            return None
+        root = _roots[parts[0]]
+        path = os.path.realpath(os.path.join(root, parts[1]))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def do_HEAD(self):
+        self.do_GET(body=False)
+
+    def do_GET(self, body=True):
+        path = self._resolve()
+        if path is None:
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        m = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if m and (m.group(1) or m.group(2)):
+            if m.group(1):
+                start = int(m.group(1))
+                end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+            else:
+                start = max(0, size - int(m.group(2)))  # bytes=-N: 最后 N 字节
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if not body:
+            return
+
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            try:
+                while remaining > 0:
+                    data = f.read(min(CHUNK, remaining))
+                    if not data:
+                        break
+                    self.wfile.write(data)
+                    remaining -= len(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 浏览器拖动进度条时会中断旧请求
+
+
+def start_media_server(port=MEDIA_PORT, host=None):
+    """
+    在后台线程启动媒体服务（每个进程一次），端口被占用时改用随机端口。
+    服务没有鉴权，默认只监听 127.0.0.1；设置 MEDIA_BIND_HOST 才会监听其他网卡。
+    """
+    global _server
+    host = host or os.environ.get(MEDIA_BIND_ENV, MEDIA_BIND_DEFAULT)
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _RangeHandler)
+            except OSError:
+                _server = ThreadingHTTPServer((host, 0), _RangeHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
+
+
+def public_media_host():
+    """浏览器访问媒体服务用的主机名（MEDIA_PUBLIC_HOST），未设置时返回 None：此时只有本机浏览器能打开 media_url"""
+    return os.environ.get(MEDIA_HOST_ENV) or None
+
+
+def media_url(path):
+    """返回可在浏览器中流式播放该文件的 URL（按需启动媒体服务）"""
+    server = start_media_server()
+    root = os.path.realpath(os.path.dirname(path))
+    root_id = hashlib.sha1((_root_salt + root).encode("utf-8")).hexdigest()[:16]
+    _roots[root_id] = root
+    host = public_media_host() or "127.0.0.1"
+    return f"http://{host}:{server.server_address[1]}/{root_id}/{quote(os.path.basename(path))}"
@@ -0,0 +1,180 @@
+import warnings
+import subprocess
+import cv2
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scenedetect import FrameTimecode
+from scenedetect.detectors import ContentDetector
+
+from .trace_utils import span, count
+
+# 压缩域预筛：只读 ffprobe 的包信息（时间戳、大小、关键帧标记），不解码像素
+SIZE_WINDOW_SEC = 1.0    # 帧大小基线：前 1 秒非关键帧的中位数
+SIZE_Z = 3.0             # 非关键帧大小的稳健 z 值超过它视为候选
+DRAFT_Z = 6.0            # draft 模式直接当作切点的 z 值
+KEY_JUMP = 0.7           # 规则 GOP 的关键帧：与上一个关键帧的 log 大小差超过它视为候选
+PAD_FRAMES = 20          # 候选点前后各解码多少帧交给 ContentDetector（需 ≥ 其 min_scene_len）
+MIN_SCENE_FRAMES = 15    # 与 ContentDetector 默认 min_scene_len 一致
+DOWNSCALE_WIDTH = 256    # 与 VideoManager.set_downscale_factor() 的自动缩放目标一致
+
+
+def probe_packets(video_path):
+    """
+    ffprobe 读取视频流的包统计，返回 {"fps", "sizes", "keys"}（按显示顺序，下标即帧号）；
+    ffprobe 不可用或失败时返回 None。
+    """
+    base = ["ffprobe", "-v", "error", "-select_streams", "v:0"]
+    try:
+        with span("ffprobe_packets"):
+            stream = subprocess.run(
+                base + ["-show_entries", "stream=avg_frame_rate", "-of", "csv=p=0", video_path],
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+            packets = subprocess.run(
+                base + ["-show_entries", "packet=pts_time,size,flags", "-of", "csv=p=0", video_path],
+                capture_output=True, text=True, check=True
+            ).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"ffprobe 失败，跳过压缩域预筛: {e}")
+        return None
+
+    rows = []
+    for line in packets.splitlines():
+        parts = line.split(",")
+        if len(parts) < 3 or parts[0] in ("", "N/A"):
+            continue
+        rows.append((float(parts[0]), int(parts[1]), "K" in parts[2]))
+    if not rows:
+        return None
+    rows.sort()  # 解码顺序 -> 显示顺序（B 帧）
+    num, _, den = stream.partition("/")
+    fps = float(num) / float(den or 1) if num and float(den or 1) else 25.0
+    count("packets", len(rows))
+    return {
+        "fps": fps,
+        "sizes": np.array([r[1] for r in rows], dtype=np.float64),
+        "keys": np.array([r[2] for r in rows], dtype=bool),
+    }
+
+
+def candidate_cuts(stats, z=SIZE_Z):
+    """
+    返回 (候选帧号, 分数)，按帧号排序：
+    - 不在规则 GOP 节奏上的关键帧（编码器在场景切换处插入的 I 帧）分数为 inf
+    - 规则位置的关键帧与上一个关键帧大小差异很大时，分数按 log 大小差折算到 z 值尺度
+    - 非关键帧按前 1 秒非关键帧大小的中位数 / MAD 计算稳健 z 值
+    """
+    sizes, keys = stats["sizes"], stats["keys"]
+    log = np.log1p(sizes)
+    scores = np.zeros(len(sizes))
+
+    key_idx = np.flatnonzero(keys)
+    if len(key_idx) > 1:
+        gaps = np.diff(key_idx)
+        gop = np.bincount(gaps).argmax()
+        # 节奏从上一个规则关键帧算起：插入的 I 帧之后，原节奏上的下一个关键帧仍是规则的；
+        # 编码器在插入处重新计数时，距插入帧正好一个 GOP 的关键帧同样算规则
+        regular = np.zeros(len(gaps), dtype=bool)
+        anchor = key_idx[0]
+        for i, (k, gap) in enumerate(zip(key_idx[1:], gaps)):
+            if (k - anchor) % gop == 0 or gap == gop:
+                regular[i] = True
+                anchor = k
+        scores[key_idx[1:][~regular]] = np.inf
+        jumps = np.abs(np.diff(log[key_idx]))
+        jumped = regular & (jumps > KEY_JUMP)
+        scores[key_idx[1:][jumped]] = jumps[jumped] / KEY_JUMP * z
+
+    # 每帧与它之前 w 个非关键帧比较（关键帧置为 NaN，不参与基线）
+    w = max(3, int(round(stats["fps"] * SIZE_WINDOW_SEC)))
+    inter = np.where(keys, np.nan, log)
+    padded = np.concatenate([np.full(w, np.nan), inter])
+    windows = sliding_window_view(padded[:-1], w)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # 开头全是 NaN 的窗口
+        med = np.nanmedian(windows, axis=1)
+        mad = np.nanmedian(np.abs(windows - med[:, None]), axis=1)
+    zs = (log - med) / (1.4826 * mad + 1e-3)
+    zs = np.nan_to_num(zs, nan=0.0)
+    hit = ~keys & (zs > z)
+    scores[hit] = np.maximum(scores[hit], zs[hit])
+
+    scores[0] = 0
+    idx = np.flatnonzero(scores > 0)
+    return idx, scores[idx]
+
+
+def candidate_windows(candidates, total_frames, pad=PAD_FRAMES):
+    """候选帧前后各 pad 帧，重叠的合并，返回 [(起始帧, 结束帧), ...]（左闭右开）"""
+    windows = []
+    for c in candidates:
+        start, end = max(0, int(c) - pad), min(total_frames, int(c) + pad + 1)
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def _thin(cuts, min_len=MIN_SCENE_FRAMES):
+    """相邻切点距离小于 min_len 时只保留前一个"""
+    kept = []
+    for c in sorted(cuts):
+        if c > 0 and (not kept or c - kept[-1] >= min_len):
+            kept.append(c)
+    return kept
+
+
+def scenes_from_cuts(cuts, total_frames, fps):
+    """切点帧号 -> scenedetect 风格的 [(start, end), ...]；没有切点时与 get_scene_list 一样返回空列表"""
+    if not cuts:
+        return []
+    bounds = [0, *cuts, total_frames]
+    return [
+        (FrameTimecode(int(s), fps=fps), FrameTimecode(int(e), fps=fps))
+        for s, e in zip(bounds[:-1], bounds[1:]) if e > s
+    ]
+
+
+def draft_scenes(video_path, stats=None):
+    """只用包统计的粗分镜（不解码任何像素），失败时返回 None"""
+    stats = stats or probe_packets(video_path)
+    if stats is None:
+        return None
+    idx, scores = candidate_cuts(stats)
+    cuts = _thin(idx[scores >= DRAFT_Z].tolist())
+    return scenes_from_cuts(cuts, len(stats["sizes"]), stats["fps"])
+
+
+def detect_scenes_windowed(video_path, threshold=27.0, stats=None, pad=PAD_FRAMES):
+    """
+    先用包统计找候选切点，再只在候选附近的窗口内逐帧运行 ContentDetector。
+    ffprobe 不可用时返回 None（调用方退回全片检测）。
+    """
+    stats = stats or probe_packets(video_path)
+    if stats is None:
+        return None
+    total = len(stats["sizes"])
+    idx, _ = candidate_cuts(stats)
+    windows = candidate_windows(idx, total, pad)
+    count("candidate_windows", len(windows))
+
+    cap = cv2.VideoCapture(video_path)
+    width = cap.get(cv2.CAP_PROP_FRAME_WIDTH) or DOWNSCALE_WIDTH
+    scale = 1.0 / max(1, int(width // DOWNSCALE_WIDTH))
+    cuts = []
+    with span("windowed_detector"):
+        for start, end in windows:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            count("seeks")
+            detector = ContentDetector(threshold=threshold, min_scene_len=MIN_SCENE_FRAMES)
+            for f in range(start, end):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                count("frames_decoded")
+                if scale < 1.0:
+                    frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                cuts.extend(detector.process_frame(f, frame))
+    cap.release()
+    return scenes_from_cuts(_thin(int(c) for c in cuts), total, stats["fps"])
@@ -0,0 +1,161 @@
+import os
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+from .trace_utils import get_tracer
+
+EMB_DIM = 512  # buffalo_l / antelopev2 的 ArcFace 特征维度
+
+# 每个 worker 进程各自持有一份模型
+_worker_model = None
+_worker_thresholds = None
+_worker_shot_mode = False
+_worker_det_sizes = None
+
+
+# ------------------ worker 侧 ------------------
+def _init_worker(num_threads, norm_threshold, det_threshold, shot_mode=False, det_sizes=None,
+                 model=None, embed_socket=None):
+    """进程初始化：限制线程数后加载一次模型（连接嵌入服务时跳过）"""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(num_threads)
+    import cv2
+    cv2.setNumThreads(1)
+
+    from utils.face_utils import load_model, get_embedding_client, set_process_embedding_client, model_name
+    global _worker_model, _worker_thresholds, _worker_shot_mode, _worker_det_sizes
+    if embed_socket:
+        from utils.service_utils import EmbeddingClient
+        set_process_embedding_client(EmbeddingClient(embed_socket))
+    # 默认模型且有嵌入服务时不在 worker 中加载模型（镜头跟踪模式仍需本地模型）
+    model = model or model_name
+    if shot_mode or model != model_name or get_embedding_client() is None:
+        _worker_model = load_model(model, num_threads=num_threads)
+    _worker_thresholds = (norm_threshold, det_threshold)
+    _worker_shot_mode = shot_mode
+    _worker_det_sizes = det_sizes
+
+
+def _extract_chunk(chunk):
+    """
+    处理一批图片，特征写入共享内存。
+    返回 ([(文件下标, 人脸数, 人脸质量列表, 检测尺寸), ...], 共享内存名, 特征总数, 本批计数器)，只 pickle 元数据。
+    """
+    from utils.face_utils import analyze_faces
+    from utils.image_utils import iter_images
+    from utils.trace_utils import get_tracer
+    norm_threshold, det_threshold = _worker_thresholds
+
+    counts = []
+    embs = []
+    if _worker_shot_mode:
+        # chunk 为若干镜头，每个镜头内做检测 + 跟踪
+        from utils.track_utils import extract_shot_features
+        for shot in chunk:
+            index_of = {path: idx for idx, path in shot}
+            feature_cache, quality_cache, size_cache, _ = extract_shot_features(
+                list(index_of), "", norm_threshold, det_threshold, _worker_model, _worker_det_sizes
+            )
+            for path, idx in index_of.items():
+                feats = feature_cache.get(path, [])
+                counts.append((idx, len(feats), quality_cache.get(path, []), size_cache.get(path)))
+                embs.extend(feats)
+    else:
+        index_of = {path: idx for idx, path in chunk}
+        # 单线程推理，但读盘/解码提前一张进行
+        for path, img in iter_images(index_of, num_threads=1, max_ahead=2):
+            feats, qualities, det_size = analyze_faces(path, norm_threshold=norm_threshold,
+                                                       det_threshold=det_threshold, face_model=_worker_model,
+                                                       img=img, det_sizes=_worker_det_sizes)
+            counts.append((index_of[path], len(feats), qualities, det_size))
+            embs.extend(feats)
+
+    stats = get_tracer().pop_counters()
+    if not embs:
+        return counts, None, 0, stats
+
+    arr = np.asarray(embs, dtype=np.float32)
+    shm = shared_memory.SharedMemory(create=True, size=arr.nbytes)
+    np.ndarray(arr.shape, dtype=np.float32, buffer=shm.buf)[:] = arr
+    name = shm.name
+    shm.close()  # 由主进程负责 unlink
+    return counts, name, len(embs), stats
+
+
+# ------------------ 主进程侧 ------------------
+def _read_shared(name, n, counts, file_list, embeddings):
+    """把共享内存中的 (n, EMB_DIM) 特征按图片切片写入 embeddings 后释放，不做中间拷贝"""
+    shm = shared_memory.SharedMemory(name=name) if name else None
+    try:
+        embs = np.ndarray((n, EMB_DIM), dtype=np.float32, buffer=shm.buf) if shm else None
+        offset = 0
+        for idx, c, qualities, det_size in counts:
+            feats = embs[offset:offset + c] if c else []
+            embeddings.add_image(file_list[idx], feats, qualities, det_size)
+            offset += c
+        del embs
+    finally:
+        if shm:
+            shm.close()
+            shm.unlink()
+
+
+def default_workers():
+    """默认进程数：保留一个核给 Streamlit 主进程"""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def extract_features_parallel(file_list, input_dir, embeddings, workers=None, chunk_size=16,
+                              norm_threshold=0.5, det_threshold=0.75,
+                              progress_callback=None, shot_mode=False, det_sizes=None, model=None):
+    """
+    多进程提取人脸特征和人脸质量，按图片写入 embeddings（EmbeddingMatrix）并返回。
+    progress_callback(done, total, elapsed) 每完成一个 chunk 调用一次。
+    shot_mode=True 时按镜头分 chunk，镜头内只对锚帧做完整推理。
+    model 为模型包名（可带 "-int8" 后缀），None 为默认模型。
+    调用方处于 service_utils.embedding_server 上下文中时，worker 连接同一个嵌入服务。
+    """
+    total = len(file_list)
+    if total == 0:
+        return embeddings
+
+    workers = min(workers or default_workers(), total)
+    # 每个 worker 分到的线程数，避免 workers * ONNX 线程数 超过核数
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    indexed = [(i, os.path.join(input_dir, name)) for i, name in enumerate(file_list)]
+    if shot_mode:
+        from utils.track_utils import group_by_shot
+        index_of = {name: i for i, name in enumerate(file_list)}
+        chunks, current, size = [], [], 0
+        for shot in group_by_shot(file_list):
+            current.append([indexed[index_of[name]] for name in shot])
+            size += len(shot)
+            if size >= chunk_size:
+                chunks.append(current)
+                current, size = [], 0
+        if current:
+            chunks.append(current)
+    else:
+        chunks = [indexed[i:i + chunk_size] for i in range(0, total, chunk_size)]
+
+    # 嵌入服务只通过 initargs 交给本次的 worker，不写环境变量
+    from utils.face_utils import get_embedding_client
+    embed_socket = getattr(get_embedding_client(), "socket_path", None)
+
+    done = 0
+    start = time.time()
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(workers, initializer=_init_worker,
+                  initargs=(num_threads, norm_threshold, det_threshold, shot_mode, det_sizes, model,
+                            embed_socket)) as pool:
+        for counts, shm_name, n, stats in pool.imap_unordered(_extract_chunk, chunks):
+            get_tracer().merge(stats)
+            _read_shared(shm_name, n, counts, file_list, embeddings)
+            done += len(counts)
+            if progress_callback:
+                progress_callback(done, total, time.time() - start)
+
+    return embeddings
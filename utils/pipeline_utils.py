@@ -0,0 +1,63 @@
+import queue
+import threading
+import contextvars
+
+from .face_utils import analyze_faces, get_model, model_name, DET_THRESHOLD
+from .embedding_utils import EmbeddingMatrix
+from .trace_utils import span, count
+
+PIPELINE_QUEUE = 8   # 队列上限：人脸分析跟不上时让抽帧等待，内存中最多缓存这么多帧
+
+
+class FacePipeline:
+    """
+    Step 0 抽帧与人脸分析之间的生产者/消费者交接：
+    抽帧线程每解码一帧就 submit(名称, BGR 图像)，后台线程从有界队列取出做检测 + 提特征，
+    结果写入 embeddings（EmbeddingMatrix）。抽帧结束时调用 close() 等待队列清空。
+    manifest 不为空时每帧的人脸框、特征行号、质量同时记入运行清单（stage="step0"）。
+    """
+
+    def __init__(self, det_threshold=DET_THRESHOLD, rec_model=model_name, det_sizes=None,
+                 maxsize=PIPELINE_QUEUE, manifest=None):
+        self.det_threshold = det_threshold
+        self.det_sizes = det_sizes
+        self.manifest = manifest
+        # 默认模型时传 None，以便走嵌入服务
+        self.face_model = get_model(rec_model) if rec_model != model_name else None
+        self.embeddings = EmbeddingMatrix()
+        self.errors = {}
+        self._queue = queue.Queue(maxsize)
+        # 新线程不继承 ContextVar：在调用方上下文的副本中运行，tracer 和嵌入服务客户端都沿用调用方的
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), daemon=True)
+        self._thread.start()
+
+    def submit(self, name, img):
+        """队列满时阻塞（背压），保证内存有界"""
+        count("pipeline_frames")
+        self._queue.put((name, img))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            name, img = item
+            try:
+                with span("pipeline_faces"):
+                    features, qualities, det_size = analyze_faces(
+                        name, det_threshold=self.det_threshold, face_model=self.face_model,
+                        img=img, det_sizes=self.det_sizes
+                    )
+                self.embeddings.add_image(name, features, qualities, det_size)
+                if self.manifest is not None:
+                    self.manifest.add_faces(self.embeddings, [name], "step0", {name: qualities})
+            except Exception as e:
+                print(f"人脸分析失败 {name}: {e}")
+                self.errors[name] = str(e)
+
+    def close(self):
+        """等待已提交的帧全部处理完，返回 embeddings"""
+        self._queue.put(None)
+        with span("pipeline_drain"):
+            self._thread.join()
+        return self.embeddings
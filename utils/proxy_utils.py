@@ -0,0 +1,95 @@
+import os
+import time
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 预览代理放在视频目录下的 proxies/ 子目录：cut(N).mp4 + cut(N).jpg 海报
+PROXY_DIR = "proxies"
+PROXY_HEIGHT = 360
+PROXY_CRF = 30
+PROXY_MAXRATE = "600k"      # 限制峰值码率，远程播放不卡顿
+POSTER_HEIGHT = 240
+PROXY_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+FFMPEG_THREADS = 2          # 每个 ffmpeg 进程的线程数，多个代理并行时不互相抢核
+
+
+def proxy_paths(video_path):
+    """返回 (代理视频路径, 海报路径)"""
+    folder, name = os.path.split(video_path)
+    stem = os.path.splitext(name)[0]
+    proxy_dir = os.path.join(folder, PROXY_DIR)
+    return os.path.join(proxy_dir, stem + ".mp4"), os.path.join(proxy_dir, stem + ".jpg")
+
+
+def _fresh(path, src):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(src)
+
+
+def _run_ffmpeg(args, out_path):
+    """写到临时文件后替换，失败时不留下半截文件"""
+    if shutil.which("ffmpeg") is None:
+        print(f"未找到 ffmpeg，跳过生成: {out_path}")
+        return False
+    tmp = out_path + ".part" + os.path.splitext(out_path)[1]
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", *args, tmp]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 or not os.path.exists(tmp):
+        print(f"生成代理失败: {out_path}\n{result.stderr.strip()}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    os.replace(tmp, out_path)
+    return True
+
+
+def make_proxy(video_path, force=False):
+    """
+    生成低码率预览视频（moov 前置，边下边播）和海报图，已是最新时跳过。
+    返回 (代理路径或 None, 海报路径或 None)。
+    """
+    proxy, poster = proxy_paths(video_path)
+    os.makedirs(os.path.dirname(proxy), exist_ok=True)
+
+    if force or not _fresh(proxy, video_path):
+        ok = _run_ffmpeg([
+            "-i", video_path,
+            "-vf", f"scale=-2:{PROXY_HEIGHT}",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(PROXY_CRF),
+            "-maxrate", PROXY_MAXRATE, "-bufsize", "1200k", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", "64k", "-ac", "1",
+            "-movflags", "+faststart", "-threads", str(FFMPEG_THREADS),
+        ], proxy)
+        if not ok:
+            proxy = None
+
+    if force or not _fresh(poster, video_path):
+        # thumbnail 滤镜在开头一批帧中挑最有代表性的一帧，避免取到黑场
+        ok = _run_ffmpeg([
+            "-i", video_path, "-vf", f"thumbnail,scale=-2:{POSTER_HEIGHT}", "-frames:v", "1", "-q:v", "4",
+        ], poster)
+        if not ok:
+            poster = None
+    return proxy, poster
+
+
+def missing_proxies(video_paths):
+    """返回代理或海报缺失 / 过期的视频"""
+    return [p for p in video_paths if not all(_fresh(x, p) for x in proxy_paths(p))]
+
+
+def generate_proxies(video_paths, workers=PROXY_WORKERS, progress_callback=None, force=False):
+    """
+    并行生成代理，返回 {视频路径: (代理, 海报)}。
+    progress_callback(done, total, elapsed) 每完成一个视频调用一次。
+    """
+    video_paths = list(video_paths)
+    results = {}
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(make_proxy, p, force): p for p in video_paths}
+        for i, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress_callback:
+                progress_callback(i, len(video_paths), time.time() - start)
+    return results
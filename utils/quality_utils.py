@@ -0,0 +1,93 @@
+import numpy as np
+from insightface.utils import face_align
+
+CROP_SIZE = 112        # ArcFace 对齐尺寸
+QUALITY_SIZE = 56      # 质量评估时的降采样尺寸
+SHARPNESS_NORM = 400.0 # 降采样后拉普拉斯方差的归一化系数
+MIN_FACE_SIZE = 112.0  # 短边达到该像素数时 size 得分为 1
+
+
+# ------------------ 对齐裁剪 ------------------
+def align_crops(img, faces):
+    """按 5 点关键点把检测到的人脸对齐成 (N, 112, 112, 3) uint8"""
+    if not faces:
+        return np.zeros((0, CROP_SIZE, CROP_SIZE, 3), dtype=np.uint8)
+    return np.stack([
+        face_align.norm_crop(img, landmark=f.kps, image_size=CROP_SIZE) for f in faces
+    ])
+
+
+# ------------------ 批量质量评估 ------------------
+def _batch_sharpness(crops):
+    """(N, H, W, 3) -> (N,) 拉普拉斯方差，降采样 float32 上一次性计算"""
+    gray = crops.astype(np.float32) @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+    n, h, w = gray.shape
+    f = h // QUALITY_SIZE
+    if f > 1:
+        # 块平均降采样，等价于 INTER_AREA
+        gray = gray[:, :QUALITY_SIZE * f, :QUALITY_SIZE * f]
+        gray = gray.reshape(n, QUALITY_SIZE, f, QUALITY_SIZE, f).mean(axis=(2, 4))
+
+    lap = (gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] +
+           gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:] -
+           4.0 * gray[:, 1:-1, 1:-1])
+    return lap.reshape(n, -1).var(axis=1)
+
+
+def _batch_pose(kps):
+    """
+    (N, 5, 2) 关键点 -> (N,) 姿态得分，越接近正脸越高。
+    关键点顺序：左眼、右眼、鼻尖、左嘴角、右嘴角。
+    """
+    left_eye, right_eye, nose = kps[:, 0], kps[:, 1], kps[:, 2]
+    mouth = (kps[:, 3] + kps[:, 4]) / 2
+    eye_mid = (left_eye + right_eye) / 2
+    eye_vec = right_eye - left_eye
+    eye_dist = np.linalg.norm(eye_vec, axis=1) + 1e-6
+
+    # roll：双眼连线倾角
+    roll = np.abs(np.arctan2(eye_vec[:, 1], eye_vec[:, 0]))
+    # yaw：鼻尖相对双眼中点的水平偏移
+    yaw = np.abs(nose[:, 0] - eye_mid[:, 0]) / eye_dist
+    # pitch：鼻尖在眼-嘴之间的相对位置，正脸约 0.5
+    face_h = mouth[:, 1] - eye_mid[:, 1]
+    pitch = np.abs((nose[:, 1] - eye_mid[:, 1]) / (face_h + 1e-6) - 0.5)
+
+    score = 1.0 - 0.5 * np.clip(roll / (np.pi / 4), 0, 1) \
+                - 1.0 * np.clip(yaw / 0.5, 0, 1) \
+                - 0.5 * np.clip(pitch / 0.5, 0, 1)
+    return np.clip(score, 0.0, 1.0)
+
+
+def batch_face_quality(crops, bboxes, kpss):
+    """
+    对一批对齐人脸计算质量，返回每张脸一个 dict：
+    sharpness / size / pose 均在 0~1，score 为综合得分（用于自适应阈值与 centroid 加权），
+    bbox 为原图中的人脸框 [x1, y1, x2, y2]（写入运行清单）。
+    """
+    if len(crops) == 0:
+        return []
+
+    bboxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+    kpss = np.asarray(kpss, dtype=np.float32).reshape(-1, 5, 2)
+
+    sharpness = np.clip(_batch_sharpness(crops) / SHARPNESS_NORM, 0.0, 1.0)
+    short_side = np.minimum(bboxes[:, 2] - bboxes[:, 0], bboxes[:, 3] - bboxes[:, 1])
+    size = np.clip(short_side / MIN_FACE_SIZE, 0.0, 1.0)
+    pose = _batch_pose(kpss)
+
+    # 几何平均：任意一项很差都会拉低综合得分
+    score = np.cbrt(sharpness * size * pose)
+    score = np.maximum(score, 0.05)
+
+    return [
+        {"sharpness": float(s), "size": float(z), "pose": float(p), "score": float(q),
+         "bbox": [round(float(v), 1) for v in b]}
+        for s, z, p, q, b in zip(sharpness, size, pose, score, bboxes)
+    ]
+
+
+def face_quality(img, faces):
+    """对一张图中保留下来的人脸做对齐并批量评估质量"""
+    crops = align_crops(img, faces)
+    return batch_face_quality(crops, [f.bbox for f in faces], [f.kps for f in faces])
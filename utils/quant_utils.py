@@ -0,0 +1,168 @@
+import os
+import sys
+import glob
+import time
+import numpy as np
+
+INT8_SUFFIX = "-int8"   # 模型名后缀，例如 "buffalo_l-int8" 表示该模型包的 INT8 识别模型
+# 量化模型不能放在 ~/.insightface/models/<name> 下，否则 FaceAnalysis 扫描目录时会误加载
+QUANT_ROOT = os.path.expanduser("~/.insightface/quantized")
+BENCH_BATCH = 32
+
+
+def split_model_name(name):
+    """'buffalo_l-int8' -> ('buffalo_l', True)，'buffalo_l' -> ('buffalo_l', False)"""
+    if name.endswith(INT8_SUFFIX):
+        return name[:-len(INT8_SUFFIX)], True
+    return name, False
+
+
+def quantize_recognition_model(fp32_path, force=False):
+    """
+    对识别模型做动态 INT8 量化（权重离线量化，激活在推理时量化，无需校准集），
+    结果缓存在 QUANT_ROOT/<模型包>/ 下，返回 INT8 模型路径。
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    pack = os.path.basename(os.path.dirname(fp32_path))
+    out_dir = os.path.join(QUANT_ROOT, pack)
+    out_path = os.path.join(out_dir, os.path.basename(fp32_path)[:-5] + ".int8.onnx")
+    if not force and os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(fp32_path):
+        return out_path
+
+    os.makedirs(out_dir, exist_ok=True)
+    # CPU 上 ConvInteger 只实现了 uint8 权重，这里用 QUInt8
+    quantize_dynamic(fp32_path, out_path + ".tmp", weight_type=QuantType.QUInt8)
+    os.replace(out_path + ".tmp", out_path)
+    return out_path
+
+
+# ------------------ 精度 / 速度对比 ------------------
+def load_labeled_images(root):
+    """root 下每个子目录为一个身份（例如 Step 2 整理后的 role_* 目录），返回 [(路径, 标签)]"""
+    items = []
+    for label in sorted(os.listdir(root)):
+        sub = os.path.join(root, label)
+        if not os.path.isdir(sub) or label in ("role_other", "other"):
+            continue
+        for path in sorted(glob.glob(os.path.join(sub, "*"))):
+            if path.lower().endswith((".jpg", ".jpeg", ".png")):
+                items.append((path, label))
+    return items
+
+
+def collect_crops(items, det_threshold=None):
+    """检测一次，返回所有可信人脸的对齐裁剪和对应标签（两个模型在相同输入上比较）"""
+    import cv2
+    from insightface.utils import face_align
+    from .face_utils import detect_boxes, DET_THRESHOLD
+
+    det_threshold = DET_THRESHOLD if det_threshold is None else det_threshold
+    crops, labels = [], []
+    for path, label in items:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        _, kpss, scores, _ = detect_boxes(img)
+        for k, s in zip(kpss, scores):
+            if s >= det_threshold:
+                crops.append(face_align.norm_crop(img, landmark=k))
+                labels.append(label)
+    return crops, np.array(labels)
+
+
+def embed_timed(rec, crops, batch=BENCH_BATCH):
+    """返回 (L2 归一化特征, 每秒处理的人脸数)"""
+    rec.get_feat(crops[:1])  # 预热
+    start = time.time()
+    embs = [np.asarray(rec.get_feat(crops[i:i + batch]), dtype=np.float32) for i in range(0, len(crops), batch)]
+    elapsed = time.time() - start
+    embs = np.concatenate(embs).reshape(len(crops), -1)
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True) + 1e-6
+    return embs, len(crops) / max(elapsed, 1e-6)
+
+
+def leader_clusters(embs, sim_threshold):
+    """与 Step 2 第一阶段相同的顺序在线聚类（不含质量加权），返回每张脸的簇号"""
+    sums = np.zeros((0, embs.shape[1]), np.float32)
+    centroids = np.zeros((0, embs.shape[1]), np.float32)
+    assign = np.zeros(len(embs), np.int64)
+    for i, f in enumerate(embs):
+        sims = centroids @ f
+        if len(sims) and sims.max() >= sim_threshold:
+            c = int(np.argmax(sims))
+            sums[c] += f
+            centroids[c] = sums[c] / (np.linalg.norm(sums[c]) + 1e-6)
+        else:
+            c = len(centroids)
+            sums = np.vstack([sums, f[None]])
+            centroids = np.vstack([centroids, f[None]])
+        assign[i] = c
+    return assign
+
+
+def adjusted_rand_index(a, b):
+    """两组划分的调整兰德指数，1 表示完全一致"""
+    _, a = np.unique(a, return_inverse=True)
+    _, b = np.unique(b, return_inverse=True)
+    table = np.zeros((a.max() + 1, b.max() + 1), np.int64)
+    np.add.at(table, (a, b), 1)
+
+    def comb2(x):
+        return (x * (x - 1) // 2).sum()
+
+    total = comb2(np.array([len(a)]))
+    index = comb2(table)
+    expected = comb2(table.sum(1)) * comb2(table.sum(0)) / max(total, 1)
+    max_index = (comb2(table.sum(1)) + comb2(table.sum(0))) / 2
+    if max_index == expected:
+        return 1.0
+    return float((index - expected) / (max_index - expected))
+
+
+def nn_accuracy(embs, labels):
+    """留一最近邻的身份准确率"""
+    sims = embs @ embs.T
+    np.fill_diagonal(sims, -np.inf)
+    return float((labels[np.argmax(sims, axis=1)] == labels).mean())
+
+
+def compare_models(image_root, name="buffalo_l", sim_threshold=0.55):
+    """
+    在带标签的本地图片集上对比 FP32 与 INT8 识别模型，返回报告 dict：
+    吞吐量、FP32/INT8 特征的余弦漂移、最近邻准确率、聚类与标签/彼此之间的一致度（ARI）。
+    """
+    from .face_utils import load_recognition_model
+
+    crops, labels = collect_crops(load_labeled_images(image_root))
+    if not crops:
+        raise ValueError(f"no faces found under {image_root}")
+
+    fp32, fp32_speed = embed_timed(load_recognition_model(name), crops)
+    int8, int8_speed = embed_timed(load_recognition_model(name + INT8_SUFFIX), crops)
+    drift = 1.0 - np.sum(fp32 * int8, axis=1)
+
+    fp32_clusters = leader_clusters(fp32, sim_threshold)
+    int8_clusters = leader_clusters(int8, sim_threshold)
+    return {
+        "faces": len(crops),
+        "identities": int(len(np.unique(labels))),
+        "fp32_faces_per_sec": fp32_speed,
+        "int8_faces_per_sec": int8_speed,
+        "speedup": int8_speed / fp32_speed,
+        "drift_mean": float(drift.mean()),
+        "drift_p95": float(np.percentile(drift, 95)),
+        "drift_max": float(drift.max()),
+        "fp32_nn_accuracy": nn_accuracy(fp32, labels),
+        "int8_nn_accuracy": nn_accuracy(int8, labels),
+        "fp32_ari": adjusted_rand_index(labels, fp32_clusters),
+        "int8_ari": adjusted_rand_index(labels, int8_clusters),
+        "fp32_int8_ari": adjusted_rand_index(fp32_clusters, int8_clusters),
+    }
+
+
+if __name__ == "__main__":
+    # python -m utils.quant_utils <带标签图片目录> [模型包名]
+    report = compare_models(sys.argv[1], *(sys.argv[2:3] or []))
+    for k, v in report.items():
+        print(f"{k:>20}: {v:.4f}" if isinstance(v, float) else f"{k:>20}: {v}")
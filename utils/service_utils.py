@@ -0,0 +1,331 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+from .face_utils import detect_boxes, get_model, NORM_THRESHOLD, DET_THRESHOLD
+from .quality_utils import batch_face_quality
+
+SOCKET_ENV = "FACE_EMBED_SOCKET"   # 进程启动时设置则该进程默认走服务端（见 face_utils.get_embedding_client）
+DEFAULT_SOCKET = "/tmp/rolegrouping_embed.sock"
+BATCH_WINDOW = 0.01     # 第一条请求到达后再等多久凑批（秒）
+MAX_BATCH = 16          # 每批最多几张图
+
+_HEADER = struct.Struct("!II")   # JSON 头长度, 二进制负载长度
+
+
+# ------------------ 传输协议 ------------------
+# 每条消息 = 8 字节长度 + JSON 头 + 原始 numpy 字节；不使用 pickle，服务端不执行客户端数据
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if k == 0:
+            raise ConnectionError("socket closed")
+        got += k
+    return bytes(buf)
+
+
+def _send_msg(sock, header, payload=b""):
+    head = json.dumps(header).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(head), len(payload)) + head + payload)
+
+
+def _recv_msg(sock):
+    head_len, payload_len = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    header = json.loads(_recv_exact(sock, head_len).decode("utf-8"))
+    return header, _recv_exact(sock, payload_len)
+
+
+# ------------------ 推理后端 ------------------
+class ModelBackend:
+    """
+    加载一次 FaceAnalysis，逐图检测后把整批图片的人脸裁剪一起送入识别模型。
+    与 FaceAnalysis.get 的 ArcFace 分支等价（同样按 kps 做 norm_crop），只是跳过了性别年龄等无关模型。
+    """
+
+    def __init__(self, face_model=None):
+        self.model = face_model or get_model()
+        self.rec = self.model.models["recognition"]
+
+    def process(self, requests):
+        """requests: [(img, params)]，返回 [(features (k, D), qualities, 检测尺寸), ...]"""
+        from insightface.utils import face_align
+
+        crops, bboxes, kpss, owners, sizes = [], [], [], [], {}
+        for i, (img, params) in enumerate(requests):
+            boxes, kps, scores, sizes[i] = detect_boxes(
+                img, self.model, params.get("det_sizes"), params["det_threshold"]
+            )
+            for b, k, s in zip(boxes, kps, scores):
+                if s < params["det_threshold"]:
+                    continue
+                crops.append(face_align.norm_crop(img, landmark=k, image_size=self.rec.input_size[0]))
+                bboxes.append(b)
+                kpss.append(k)
+                owners.append(i)
+
+        results = [(np.zeros((0, self.rec.output_shape[1]), np.float32), [], int(sizes[i]))
+                   for i in range(len(requests))]
+        if not crops:
+            return results
+
+        embs = np.asarray(self.rec.get_feat(crops), dtype=np.float32).reshape(len(crops), -1)
+        # ArcFace 输入即 112 对齐裁剪，与 quality_utils 的 CROP_SIZE 一致，可直接复用
+        quals = batch_face_quality(np.stack(crops), bboxes, kpss)
+        owners = np.asarray(owners)
+        norms = np.linalg.norm(embs, axis=1)
+        for i, (_, params) in enumerate(requests):
+            rows = np.flatnonzero((owners == i) & (norms >= params["norm_threshold"]))
+            qualities = [dict(quals[r], det_size=int(sizes[i])) for r in rows]
+            results[i] = (embs[rows], qualities, int(sizes[i]))
+        return results
+
+
+class StubBackend:
+    """
+    不加载模型的替身后端（测试 / 调试用）：整张图视为一张脸，
+    特征由缩小后的灰度图确定性生成，同一张图总是得到同一个特征。
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.calls = []   # 每次 process 的批大小，便于检查凑批效果
+
+    def process(self, requests):
+        import cv2
+
+        self.calls.append(len(requests))
+        results = []
+        for img, _ in requests:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+            small = cv2.resize(gray, (32, 16), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+            feat = np.resize(small - small.mean(), self.dim)
+            feat /= np.linalg.norm(feat) + 1e-6
+            results.append((feat[None].astype(np.float32), [{"score": 1.0, "det_size": 0}], 0))
+        return results
+
+
+# ------------------ 服务端 ------------------
+class EmbeddingServer:
+    """
+    Unix socket 上的检测 + 特征服务：模型只加载一次，所有客户端共享。
+    每个连接一个读线程，请求进入同一个队列，由推理线程在 batch_window 内凑批后统一处理。
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, backend=None,
+                 batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.socket_path = socket_path
+        self.backend = backend
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0}
+        self._sock = None
+        self._conns = set()
+        self._stop = threading.Event()
+
+    def start(self):
+        """后台线程启动服务，立即返回"""
+        if self.backend is None:
+            self.backend = ModelBackend()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # socket 文件只允许当前用户连接（默认放在共享的 /tmp 下）
+        old_umask = os.umask(0o177)
+        try:
+            self._sock.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.socket_path, 0o600)
+        self._sock.listen(64)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self.start()
+        print(f"embedding server listening on {self.socket_path}")
+        try:
+            while not self._stop.is_set():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        self.stop()
+
+    def stop(self):
+        self._stop.set()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        for conn in list(self._conns):   # 客户端收到断开后会在下次调用时重连
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_conn, args=(conn,), daemon=True).start()
+
+    def _serve_conn(self, conn):
+        self._conns.add(conn)
+        try:
+            with conn:
+                self._serve_requests(conn)
+        except OSError:
+            pass   # 客户端中途断开
+        finally:
+            self._conns.discard(conn)
+
+    def _serve_requests(self, conn):
+        while not self._stop.is_set():
+            try:
+                header, payload = _recv_msg(conn)
+            except (ConnectionError, OSError):
+                return
+            img = np.frombuffer(payload, dtype=np.uint8).reshape(header["shape"])
+            slot = {"done": threading.Event()}
+            self.requests.put((img, header, slot))
+            slot["done"].wait()
+
+            if "error" in slot:
+                _send_msg(conn, {"error": slot["error"]})
+                continue
+            feats, qualities, det_size = slot["result"]
+            feats = np.ascontiguousarray(feats, dtype=np.float32)
+            _send_msg(conn, {"shape": list(feats.shape), "qualities": qualities, "det_size": det_size},
+                      feats.tobytes())
+
+    def _batch_loop(self):
+        while not self._stop.is_set():
+            try:
+                batch = [self.requests.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            deadline = time.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                results = self.backend.process([(img, params) for img, params, _ in batch])
+            except Exception as e:
+                print(f"embedding server error: {e}")
+                results = None
+            for i, (_, _, slot) in enumerate(batch):
+                if results is None:
+                    slot["error"] = "inference failed"
+                else:
+                    slot["result"] = results[i]
+                slot["done"].set()
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+
+
+# ------------------ 客户端 ------------------
+class EmbeddingClient:
+    """
+    服务端的客户端，analyze_faces 与 face_utils.analyze_faces 返回格式一致。
+    每个线程一条长连接，断开后下次调用自动重连。
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=60):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def analyze_faces(self, img, norm_threshold=NORM_THRESHOLD, det_threshold=DET_THRESHOLD,
+                      det_sizes=None):
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        header = {
+            "shape": list(img.shape),
+            "norm_threshold": norm_threshold,
+            "det_threshold": det_threshold,
+            "det_sizes": list(det_sizes) if det_sizes else None,
+        }
+        try:
+            sock = self._conn()
+            _send_msg(sock, header, img.tobytes())
+            reply, payload = _recv_msg(sock)
+        except (ConnectionError, OSError):
+            self.close()
+            raise
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        feats = np.frombuffer(payload, dtype=np.float32).reshape(reply["shape"])
+        return list(feats), reply["qualities"], reply.get("det_size")
+
+
+class InProcessClient:
+    """与 EmbeddingClient 接口相同，但直接在本进程调用后端（默认 StubBackend），不经过 socket"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or StubBackend()
+
+    def analyze_faces(self, img, norm_threshold=NORM_THRESHOLD, det_threshold=DET_THRESHOLD,
+                      det_sizes=None):
+        params = {"norm_threshold": norm_threshold, "det_threshold": det_threshold, "det_sizes": det_sizes}
+        feats, qualities, det_size = self.backend.process([(img, params)])[0]
+        return list(feats), qualities, det_size
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def embedding_server(socket_path=DEFAULT_SOCKET):
+    """
+    with embedding_server(path): ...  期间当前上下文的 extract_faces / extract_feature 走服务端，
+    并行提取时 worker 进程也连接同一服务端而不再各自加载模型；不修改环境变量，不影响其他会话。
+    socket_path 为空时使用本地模型。
+    """
+    from .face_utils import use_embedding_client
+    client = EmbeddingClient(socket_path) if socket_path else None
+    try:
+        with use_embedding_client(client):
+            yield client
+    finally:
+        if client is not None:
+            client.close()
+
+
+if __name__ == "__main__":
+    # python -m utils.service_utils [socket 路径] [模型包名，可带 -int8 后缀]
+    backend = ModelBackend(get_model(sys.argv[2])) if len(sys.argv) > 2 else None
+    EmbeddingServer(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOCKET, backend).serve_forever()
@@ -0,0 +1,141 @@
+import os
+import json
+import base64
+import html
+import cv2
+import numpy as np
+
+# 雪碧图：多张缩略图拼成一张 JPEG + 一份坐标表（同名 .json），页面只传一张图，
+# 用 CSS background-position 显示其中的某一格
+TILE_HEIGHT = 90
+SPRITE_COLUMNS = 10
+SPRITE_QUALITY = 80
+EMPTY_TILE = 40          # 读取失败的格子填充的灰度值
+
+
+def map_path(sprite_path):
+    return os.path.splitext(sprite_path)[0] + ".json"
+
+
+def pack_sprite(images, tile_height=TILE_HEIGHT, columns=SPRITE_COLUMNS):
+    """
+    images 为 BGR 图像列表（None 表示缺失），按第一张有效图的宽高比缩放到统一格子大小，
+    每行 columns 格。返回 (雪碧图, [(x, y, w, h), ...])。
+    """
+    first = next((img for img in images if img is not None), None)
+    if first is None:
+        return None, []
+    tile_w = max(1, round(first.shape[1] * tile_height / first.shape[0]))
+    columns = max(1, min(columns, len(images)))
+    rows = (len(images) + columns - 1) // columns
+    sprite = np.full((rows * tile_height, columns * tile_w, 3), EMPTY_TILE, dtype=np.uint8)
+
+    tiles = []
+    for i, img in enumerate(images):
+        x, y = (i % columns) * tile_w, (i // columns) * tile_height
+        if img is not None:
+            sprite[y:y + tile_height, x:x + tile_w] = cv2.resize(
+                img, (tile_w, tile_height), interpolation=cv2.INTER_AREA
+            )
+        tiles.append((x, y, tile_w, tile_height))
+    return sprite, tiles
+
+
+def write_sprite(path, sprite, tiles, **meta):
+    """写雪碧图和坐标表（先写临时文件再替换），meta 一并存入坐标表"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".part.jpg"
+    cv2.imwrite(tmp, sprite, [cv2.IMWRITE_JPEG_QUALITY, SPRITE_QUALITY])
+    os.replace(tmp, path)
+    sprite_map = {"size": [int(sprite.shape[1]), int(sprite.shape[0])], "tiles": [list(t) for t in tiles], **meta}
+    write_sprite_map(path, sprite_map)
+    return sprite_map
+
+
+def write_sprite_map(path, sprite_map):
+    with open(map_path(path) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(sprite_map, f, ensure_ascii=False)
+    os.replace(map_path(path) + ".tmp", map_path(path))
+
+
+def read_sprite_map(path):
+    """读取坐标表，雪碧图或坐标表不存在 / 损坏时返回 None"""
+    if not os.path.exists(path) or not os.path.exists(map_path(path)):
+        return None
+    try:
+        with open(map_path(path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"读取雪碧图坐标失败 {path}: {e}")
+        return None
+
+
+def _read_thumb(path):
+    """以 1/2 分辨率解码 JPEG（libjpeg 直接在 DCT 阶段缩小，比全尺寸解码再缩放快）"""
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_2)
+    return img if img is not None else cv2.imread(path)
+
+
+def contact_sheet(rows, path, tile_height=TILE_HEIGHT, force=False):
+    """
+    联系表：rows = [[图片路径, ...], ...]，每行一组（例如一个镜头），缩小后拼成一张雪碧图。
+    返回坐标表 {"size", "tiles", "rows": 与 rows 对齐的 [[x, y, w, h], ...], "paths": rows}；
+    路径列表相同且源图都不比联系表新时直接读缓存。
+    """
+    rows = [list(r) for r in rows]
+    old = None if force else read_sprite_map(path)
+    if old and old.get("paths") == rows:
+        built = os.path.getmtime(path)
+        if all(not os.path.exists(p) or os.path.getmtime(p) <= built for r in rows for p in r):
+            return old
+
+    columns = max((len(r) for r in rows), default=0)
+    if not columns:
+        return None
+    images = []
+    for r in rows:
+        images += [_read_thumb(p) for p in r] + [None] * (columns - len(r))
+    sprite, tiles = pack_sprite(images, tile_height, columns)
+    if sprite is None:
+        return None
+    grid = [tiles[i * columns:i * columns + len(r)] for i, r in enumerate(rows)]
+    return write_sprite(path, sprite, tiles, rows=[[list(t) for t in g] for g in grid], paths=rows)
+
+
+def image_data_uri(path):
+    """不经媒体服务时把雪碧图内联到页面（每张雪碧图只内联一次）"""
+    with open(path, "rb") as f:
+        return "data:image/jpeg;base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+def sprite_css(css_class, src, sprite_map, scale=1.0):
+    """定义一个引用雪碧图的 CSS 类，页面中所有格子共用这一张图"""
+    w, h = sprite_map["size"]
+    return (
+        f".{css_class}{{background-image:url('{src}');background-repeat:no-repeat;"
+        f"background-size:{w * scale:.0f}px {h * scale:.0f}px;display:inline-block;flex:none}}"
+    )
+
+
+def sprite_tile_fluid(css_class, tile, size, title=""):
+    """宽度随容器伸缩的格子：background-size / position 用百分比表示"""
+    x, y, w, h = tile
+    sprite_w, sprite_h = size
+    pos_x = x / (sprite_w - w) * 100 if sprite_w > w else 0
+    pos_y = y / (sprite_h - h) * 100 if sprite_h > h else 0
+    title = f' title="{html.escape(title)}"' if title else ""
+    return (
+        f'<div class="{css_class}"{title} style="display:block;width:100%;aspect-ratio:{w}/{h};'
+        f'background-size:{sprite_w / w * 100:.4f}% {sprite_h / h * 100:.4f}%;'
+        f'background-position:{pos_x:.4f}% {pos_y:.4f}%"></div>'
+    )
+
+
+def sprite_tile(css_class, tile, scale=1.0, title=""):
+    """雪碧图中的一格（div + background-position）"""
+    x, y, w, h = tile
+    title = f' title="{html.escape(title)}"' if title else ""
+    return (
+        f'<div class="{css_class}"{title} style="width:{w * scale:.0f}px;height:{h * scale:.0f}px;'
+        f'background-position:-{x * scale:.0f}px -{y * scale:.0f}px"></div>'
+    )
@@ -0,0 +1,159 @@
+import os
+import random
+import cv2
+from scenedetect.detectors import ContentDetector
+
+from .trace_utils import span, count
+from .packet_utils import (
+    probe_packets, candidate_cuts, candidate_windows, MIN_SCENE_FRAMES, DOWNSCALE_WIDTH
+)
+
+# 流式模式：检测、抽帧、切割都是按时间轴窗口推进的生成器，
+# 每个窗口的结果写入运行清单后即丢弃，内存不随视频长度增长
+STREAM_WINDOW_SEC = 300
+
+
+def sample_frame_ids(start_frame, end_frame):
+    """一个镜头抽取的帧号：首帧、尾帧前 2 帧，以及中间随机 2 帧"""
+    if end_frame <= start_frame:
+        return []
+    safe_end_frame = max(start_frame, end_frame - 2)
+    middle_frames = []
+    if safe_end_frame - start_frame > 2:
+        middle_frames = random.sample(
+            range(start_frame + 1, safe_end_frame - 1),
+            k=min(2, safe_end_frame - start_frame - 1)
+        )
+    return sorted(set([start_frame, safe_end_frame] + middle_frames))
+
+
+def _downscale(cap):
+    width = cap.get(cv2.CAP_PROP_FRAME_WIDTH) or DOWNSCALE_WIDTH
+    return 1.0 / max(1, int(width // DOWNSCALE_WIDTH))
+
+
+def iter_cuts(video_path, threshold=27.0, prefilter=False):
+    """
+    顺序解码并逐帧运行 ContentDetector，一边检测一边产出切点帧号，内存中只有当前帧。
+    prefilter=True 且 ffprobe 可用时只解码压缩域候选点附近的窗口。
+    生成器的返回值（StopIteration.value）为总帧数。
+    """
+    stats = probe_packets(video_path) if prefilter else None
+    cap = cv2.VideoCapture(video_path)
+    scale = _downscale(cap)
+    if stats is not None:
+        total = len(stats["sizes"])
+        windows = candidate_windows(candidate_cuts(stats)[0], total)
+    else:
+        total = None
+        windows = [(0, None)]
+
+    last = None
+    for start, end in windows:
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            count("seeks")
+        detector = ContentDetector(threshold=threshold, min_scene_len=MIN_SCENE_FRAMES)
+        f = start
+        while end is None or f < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            count("frames_decoded")
+            if scale < 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            for c in detector.process_frame(f, frame):
+                c = int(c)
+                if c > 0 and (last is None or c - last >= MIN_SCENE_FRAMES):
+                    last = c
+                    yield c
+            f += 1
+        if total is None:
+            total = f
+    cap.release()
+    return total
+
+
+def iter_scene_batches(video_path, threshold=27.0, prefilter=False, window_sec=STREAM_WINDOW_SEC):
+    """
+    按时间轴窗口产出已闭合的镜头：[(scene_id, start_frame, end_frame, start_sec, end_sec), ...]。
+    每跨过一个窗口边界交出一批，最后一批包含到视频结尾的镜头。没有切点时整段视频为一个镜头。
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    window = max(1, int(fps * window_sec))
+
+    gen = iter_cuts(video_path, threshold, prefilter)
+    batch, scene_id, start, boundary = [], 0, 0, window
+    while True:
+        try:
+            cut = next(gen)
+        except StopIteration as stop:
+            total = stop.value
+            break
+        scene_id += 1
+        batch.append((scene_id, start, cut, start / fps, cut / fps))
+        start = cut
+        if cut >= boundary:
+            yield batch
+            batch = []
+            boundary = (cut // window + 1) * window
+    if total > start:
+        scene_id += 1
+        batch.append((scene_id, start, total, start / fps, total / fps))
+    if batch:
+        yield batch
+
+
+def iter_extract(video_path, scene_batches, out_dir, on_frame=None):
+    """
+    对每批镜头抽帧写盘，产出 (镜头批, 帧记录 [(path, scene_id, frame_index, timestamp), ...])。
+    镜头按时间顺序到达，整个过程只打开一次视频。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    for batch in scene_batches:
+        rows = []
+        for scene_id, start_frame, end_frame, _, _ in batch:
+            for f in sample_frame_ids(start_frame, end_frame):
+                with span("seek_decode"):
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, f)
+                    ret, frame = cap.read()
+                count("seeks")
+                count("frames_decoded")
+                if not ret:
+                    continue
+                img_path = os.path.join(out_dir, f"scene_{scene_id}_frame_{f}.jpg")
+                with span("jpeg_write"):
+                    cv2.imwrite(img_path, frame)
+                count("bytes_written", os.path.getsize(img_path))
+                rows.append((img_path, scene_id, f, f / fps))
+                if on_frame:
+                    on_frame(img_path, frame)
+        yield batch, rows
+    cap.release()
+
+
+def iter_cut_videos(video_path, scene_rows, cuts_dir):
+    """
+    逐个镜头用 ffmpeg 切割，产出 (scene_id, 输出路径或 None)。
+    scene_rows: [(scene_id, start_sec, end_sec), ...]，可以是逐批读出的生成器。
+    """
+    os.makedirs(cuts_dir, exist_ok=True)
+    for scene_id, start_time, end_time in scene_rows:
+        output_path = os.path.join(cuts_dir, f"cut({scene_id}).mp4")
+        cmd = (
+            f'ffmpeg -y -i "{video_path}" '
+            f'-ss {start_time:.3f} -to {end_time:.3f} '
+            f'-c:v libx264 -crf 23 -preset veryfast -c:a copy "{output_path}"'
+        )
+        with span("ffmpeg_cut", scene=scene_id):
+            os.system(cmd)
+        count("ffmpeg_runs")
+        if os.path.exists(output_path):
+            count("bytes_written", os.path.getsize(output_path))
+            yield scene_id, output_path
+        else:
+            yield scene_id, None
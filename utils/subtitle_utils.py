@@ -0,0 +1,124 @@
+import os
+import re
+import time
+import cv2
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .proxy_utils import PROXY_DIR, PROXY_WORKERS
+from .sprite_utils import pack_sprite, write_sprite, write_sprite_map, read_sprite_map
+from .trace_utils import span, count, bind_tracer
+
+CUES_SUFFIX = ".cues.jpg"     # 字幕对齐缩略图条：<视频目录>/proxies/<名称>.cues.jpg + .cues.json
+CUE_TILE_HEIGHT = 90
+
+_TIME = r"(\d+):(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+_CUE_RE = re.compile(_TIME + r"\s*-->\s*" + _TIME)
+
+
+def _seconds(h, m, s, ms):
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms.ljust(3, "0")) / 1000
+
+
+def parse_srt(text):
+    """解析 SRT 文本，返回 [{"index", "start", "end", "text"}]（秒）；没有时间轴时返回空列表"""
+    cues = []
+    blocks = re.split(r"\n\s*\n", text.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n"))
+    for block in blocks:
+        lines = block.strip().split("\n")
+        for i, line in enumerate(lines):
+            m = _CUE_RE.search(line)
+            if m:
+                cues.append({
+                    "index": len(cues) + 1,
+                    "start": _seconds(*m.groups()[:4]),
+                    "end": _seconds(*m.groups()[4:]),
+                    "text": "\n".join(lines[i + 1:]).strip(),
+                })
+                break
+    return cues
+
+
+def cue_times(cues):
+    """每条字幕取显示时间段的中点作为缩略图时间"""
+    return [round((c["start"] + max(c["end"], c["start"])) / 2, 3) for c in cues]
+
+
+def grab_frames(video_path, times):
+    """
+    一次顺序解码取出多个时间点的帧（按时间排序后只 grab 不需要的帧），
+    返回与 times 对齐的 BGR 图像列表，超出视频长度的为 None。
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    targets = sorted({int(round(t * fps)) for t in times})
+    frames = {}
+    pos = 0
+    for target in targets:
+        while pos < target and cap.grab():
+            pos += 1
+        if pos < target:
+            break   # 视频提前结束
+        ret, frame = cap.read()
+        pos += 1
+        count("frames_decoded")
+        if not ret:
+            break
+        frames[target] = frame
+    cap.release()
+    return [frames.get(int(round(t * fps))) for t in times]
+
+
+def cues_path(video_path):
+    folder, name = os.path.split(video_path)
+    return os.path.join(folder, PROXY_DIR, os.path.splitext(name)[0] + CUES_SUFFIX)
+
+
+def build_cue_strip(video_path, srt_path, source_path=None, force=False):
+    """
+    为一个视频生成字幕对齐缩略图条，返回坐标表（含每条字幕的时间和文本），没有字幕时返回 None。
+    source_path 为实际解码的视频（例如低分辨率代理，时间轴与原视频一致）。
+    只有字幕文本改动、时间轴没变时不重新解码，只更新坐标表中的文本。
+    """
+    with open(srt_path, "r", encoding="utf-8") as f:
+        cues = parse_srt(f.read())
+    if not cues:
+        return None
+    out = cues_path(video_path)
+    times = cue_times(cues)
+    labels = [{"start": c["start"], "end": c["end"], "text": c["text"]} for c in cues]
+
+    old = None if force else read_sprite_map(out)
+    if old and old.get("times") == times and os.path.getmtime(out) >= os.path.getmtime(video_path):
+        if old.get("cues") != labels:
+            old["cues"] = labels
+            write_sprite_map(out, old)
+        return old
+
+    with span("cue_strip"):
+        frames = grab_frames(source_path or video_path, times)
+        sprite, tiles = pack_sprite(frames, CUE_TILE_HEIGHT)
+    if sprite is None:
+        return None
+    return write_sprite(out, sprite, tiles, times=times, cues=labels)
+
+
+def generate_cue_strips(pairs, workers=PROXY_WORKERS, progress_callback=None, force=False):
+    """
+    pairs: [(视频, 字幕, 解码用的视频或 None), ...]，并行生成，返回 {视频: 坐标表或 None}。
+    progress_callback(done, total, elapsed) 每完成一个视频调用一次。
+    """
+    pairs = list(pairs)
+    results = {}
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        build = bind_tracer(build_cue_strip)
+        futures = {pool.submit(build, v, s, src, force): v for v, s, src in pairs}
+        for i, future in enumerate(as_completed(futures), 1):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                print(f"生成字幕缩略图失败 {futures[future]}: {e}")
+                results[futures[future]] = None
+            if progress_callback:
+                progress_callback(i, len(pairs), time.time() - start)
+    return results
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+
+RUN_LOG_FILE = "run_log.jsonl"
+MEMORY_INTERVAL = 0.05   # 峰值内存采样间隔（秒）
+
+
+def rss_bytes():
+    """当前进程 RSS（字节）；非 Linux 退回进程生命周期峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024   # macOS 单位为字节，Linux 为 KB
+
+
+class Tracer:
+    """
+    轻量追踪：计时 span + 计数器 + 峰值内存采样。
+    span 按名称汇总次数与总耗时，同时逐条写入 JSONL 运行日志（log_path 不为空时）。
+    没有活动 run 时 span / count 只做累加，开销可以忽略。
+    """
+
+    def __init__(self, name="run", log_path=None, sample_memory=True):
+        self.name = name
+        self.run_id = uuid.uuid4().hex[:8]
+        self.log_path = log_path
+        self.started = time.time()
+        self.counters = defaultdict(float)
+        self.span_totals = defaultdict(lambda: [0, 0.0])   # 名称 -> [次数, 总毫秒]
+        self.peak_rss = rss_bytes()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._log = open(log_path, "a", encoding="utf-8") if log_path else None
+        self._stop = threading.Event()
+        self._sampler = None
+        if sample_memory:
+            self._sampler = threading.Thread(target=self._sample_memory, daemon=True)
+            self._sampler.start()
+
+    def _sample_memory(self):
+        while not self._stop.wait(MEMORY_INTERVAL):
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def _write(self, record):
+        if self._log is None:
+            return
+        with self._lock:
+            self._log.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    # ------------------ 记录 ------------------
+    @contextmanager
+    def span(self, name, **attrs):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        start = time.perf_counter()
+        wall = time.time()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            stack.pop()
+            with self._lock:
+                total = self.span_totals[name]
+                total[0] += 1
+                total[1] += ms
+            self._write({
+                "run": self.run_id, "type": "span", "name": name, "parent": parent,
+                "start": round(wall - self.started, 4), "ms": round(ms, 3), **attrs,
+            })
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def merge(self, counters):
+        """合并其他进程（worker）上报的计数器"""
+        with self._lock:
+            for k, v in counters.items():
+                self.counters[k] += v
+
+    def pop_counters(self):
+        """取出并清空计数器（worker 每处理完一批上报一次）"""
+        with self._lock:
+            counters = dict(self.counters)
+            self.counters.clear()
+        return counters
+
+    # ------------------ 汇总 ------------------
+    def summary(self):
+        self.peak_rss = max(self.peak_rss, rss_bytes())
+        with self._lock:
+            return {
+                "run": self.run_id,
+                "name": self.name,
+                "seconds": round(time.time() - self.started, 3),
+                "peak_rss_mb": round(self.peak_rss / 2 ** 20, 1),
+                "counters": {k: round(v, 3) for k, v in self.counters.items()},
+                "spans": {k: {"count": c, "ms": round(ms, 1)} for k, (c, ms) in self.span_totals.items()},
+            }
+
+    def close(self):
+        self._stop.set()
+        summary = self.summary()
+        self._write({"type": "summary", **summary})
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        return summary
+
+
+# ------------------ 当前 tracer ------------------
+# Streamlit 每个会话在自己的线程里运行，当前 tracer 放在 ContextVar 中，并发的 run 互不干扰。
+# 默认是一个不写日志、不采样内存的 tracer，模块代码可以无条件调用 span / count
+_idle = Tracer("idle", sample_memory=False)
+_current = contextvars.ContextVar("tracer", default=_idle)
+
+
+def get_tracer():
+    return _current.get()
+
+
+def span(name, **attrs):
+    return _current.get().span(name, **attrs)
+
+
+def count(name, n=1):
+    _current.get().count(name, n)
+
+
+def bind_tracer(fn):
+    """
+    新线程不继承 ContextVar：交给后台线程 / 线程池的函数用它包一层，
+    其中的 span / count 仍记到调用方当前的 tracer。
+    """
+    tracer = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(tracer)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+@contextmanager
+def trace_run(name, log_dir=None):
+    """
+    with trace_run("step2", output_dir) as tracer: ...
+    期间的 span / count 记到新的 tracer，日志追加到 log_dir/run_log.jsonl；结束后 tracer.result 为汇总。
+    """
+    log_path = None
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        log_path = os.path.join(log_dir, RUN_LOG_FILE)
+    tracer = Tracer(name, log_path)
+    token = _current.set(tracer)
+    try:
+        with tracer.span(name):
+            yield tracer
+    finally:
+        _current.reset(token)
+        tracer.result = tracer.close()
+
+
+# ------------------ Streamlit 侧边栏 ------------------
+def show_trace_panel(summary):
+    """在侧边栏显示一次运行的汇总（耗时最多的 span 在前）"""
+    import streamlit as st
+
+    if not summary:
+        return
+    with st.sidebar.expander(f"⏱ Performance - {summary['name']}", expanded=False):
+        st.caption(f"run {summary['run']} · {summary['seconds']} s · peak RSS {summary['peak_rss_mb']} MB")
+        spans = sorted(summary["spans"].items(), key=lambda kv: -kv[1]["ms"])
+        st.table([{"span": k, "count": v["count"], "total ms": v["ms"]} for k, v in spans])
+        if summary["counters"]:
+            st.table([{"counter": k, "value": v} for k, v in sorted(summary["counters"].items())])
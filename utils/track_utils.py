@@ -0,0 +1,172 @@
+import os
+import re
+from collections import defaultdict
+import numpy as np
+
+from .face_utils import detect_faces, detect_boxes, get_model, NORM_THRESHOLD, DET_THRESHOLD
+from .quality_utils import face_quality
+from .image_utils import iter_images
+from .trace_utils import count
+
+IOU_THRESHOLD = 0.3      # 与已有轨迹关联的最低 IoU
+LANDMARK_THRESHOLD = 0.35  # 5 点关键点平均位移 / 人脸框边长，超过则不视为同一张脸
+TRACK_EMBED_FRAMES = 3   # 每条轨迹最多在这么多帧（镜头内均匀间隔）上做识别，特征取平均
+
+_CUT_RE = re.compile(r"cut\((\d+)(?:\.(\d+))?\)")
+_SCENE_RE = re.compile(r"scene_(\d+)_frame_(\d+)")
+
+
+# ------------------ 按镜头分组 ------------------
+def shot_key(name):
+    """
+    从文件名解析 (镜头号, 镜头内序号)：
+    cut(3).jpg -> (3, 1)，cut(3.2).jpg -> (3, 2)，scene_4_frame_812.jpg -> (4, 812)。
+    无法解析时返回 None。
+    """
+    m = _CUT_RE.search(name)
+    if m:
+        return int(m.group(1)), int(m.group(2) or 1)
+    m = _SCENE_RE.search(name)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    return None
+
+
+def group_by_shot(file_list):
+    """返回 [[同一镜头的文件名, ...], ...]，无法解析镜头号的文件单独成组"""
+    shots = defaultdict(list)
+    singles = []
+    for name in file_list:
+        key = shot_key(name)
+        if key is None:
+            singles.append([name])
+        else:
+            shots[key[0]].append((key[1], name))
+    groups = [[name for _, name in sorted(frames)] for _, frames in sorted(shots.items())]
+    return groups + singles
+
+
+# ------------------ IoU / 关键点跟踪 ------------------
+def _iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _landmark_shift(kps, track):
+    """关键点平均位移，按轨迹人脸框的长边归一化"""
+    x1, y1, x2, y2 = track["bbox"]
+    side = max(x2 - x1, y2 - y1, 1.0)
+    return float(np.linalg.norm(np.asarray(kps) - track["kps"], axis=1).mean() / side)
+
+
+def associate(boxes, kpss, tracks):
+    """
+    把本帧检测框贪心关联到已有轨迹：IoU 从高到低，每条轨迹最多一个框，
+    关键点位移过大的（例如两人交错）不关联。返回 {框下标: 轨迹号}。
+    """
+    pairs = []
+    for i, (box, kps) in enumerate(zip(boxes, kpss)):
+        for tid, t in enumerate(tracks):
+            iou = _iou(box, t["bbox"])
+            if iou >= IOU_THRESHOLD and _landmark_shift(kps, t) <= LANDMARK_THRESHOLD:
+                pairs.append((iou, i, tid))
+    matched, used = {}, set()
+    for _, i, tid in sorted(pairs, reverse=True):
+        if i not in matched and tid not in used:
+            matched[i] = tid
+            used.add(tid)
+    return matched
+
+
+def _new_track(face, frame):
+    return {
+        "bbox": np.asarray(face.bbox, dtype=np.float32),
+        "kps": np.asarray(face.kps, dtype=np.float32),
+        "embs": [face.embedding],
+        "embedded_at": frame,   # 最近一次识别的帧序号
+    }
+
+
+def _frame_qualities(img, faces, det_size):
+    qualities = face_quality(img, faces)
+    for q in qualities:
+        q["det_size"] = int(det_size)
+    return qualities
+
+
+def extract_shot_features(names, input_dir,
+                          norm_threshold=NORM_THRESHOLD,
+                          det_threshold=DET_THRESHOLD,
+                          face_model=None,
+                          det_sizes=None):
+    """
+    对同一镜头的多帧做检测 + 跟踪，返回 (feature_cache, quality_cache, 各帧检测尺寸, 识别推理的人脸数)。
+    锚帧（第一张能解码的帧）完整检测并提特征，建立轨迹；
+    其余帧只跑检测模型，检测框按 IoU + 关键点位移关联到已有轨迹，没关联上的提特征并新建轨迹；
+    关联上的人脸只在距上次识别足够远的帧上再做识别，每条轨迹最多 TRACK_EMBED_FRAMES 次。
+    每条轨迹的特征取其所有识别结果的平均，镜头内各帧共享；质量（含 bbox、det_size）按各帧自己的人脸计算。
+    """
+    from insightface.app.common import Face
+
+    m = face_model or get_model()
+    tracks = []
+    frame_faces = {}   # 帧 -> [(轨迹号, 质量 dict), ...]
+    size_cache = {}    # 帧 -> 检测尺寸（没有人脸的帧也记录）
+    embedded = 0
+    spacing = max(1, len(names) // TRACK_EMBED_FRAMES)   # 同一轨迹两次识别之间至少间隔的帧数
+
+    paths = {os.path.join(input_dir, name): name for name in names}
+    for frame, (path, img) in enumerate(iter_images(paths, num_threads=2, max_ahead=len(paths))):
+        name = paths[path]
+        if img is None:
+            frame_faces[name] = []
+            continue
+
+        # 1) 锚帧：完整检测 + 识别
+        if not tracks:
+            faces, det_size = detect_faces(img, path, norm_threshold, det_threshold, m, det_sizes, return_size=True)
+            embedded += len(faces)
+            size_cache[name] = det_size
+            tracks.extend(_new_track(f, frame) for f in faces)
+            frame_faces[name] = list(zip(range(len(faces)), _frame_qualities(img, faces, det_size)))
+            continue
+
+        # 2) 其余帧：只检测，按 IoU / 关键点关联
+        boxes, kpss, scores, det_size = detect_boxes(img, m, det_sizes, det_threshold)
+        size_cache[name] = int(det_size)
+        keep = scores >= det_threshold
+        faces = [Face(bbox=b, kps=k, det_score=d) for b, k, d in zip(boxes[keep], kpss[keep], scores[keep])]
+        matched = associate([f.bbox for f in faces], [f.kps for f in faces], tracks)
+        kept = []
+        for i, face in enumerate(faces):
+            tid = matched.get(i)
+            if tid is None:
+                m.models["recognition"].get(img, face)
+                embedded += 1
+                if np.linalg.norm(face.embedding) < norm_threshold:
+                    continue
+                tracks.append(_new_track(face, frame))
+                tid = len(tracks) - 1
+            else:
+                track = tracks[tid]
+                track["bbox"] = np.asarray(face.bbox, dtype=np.float32)
+                track["kps"] = np.asarray(face.kps, dtype=np.float32)
+                if len(track["embs"]) < TRACK_EMBED_FRAMES and frame - track["embedded_at"] >= spacing:
+                    m.models["recognition"].get(img, face)
+                    embedded += 1
+                    track["embedded_at"] = frame
+                    if np.linalg.norm(face.embedding) >= norm_threshold:
+                        track["embs"].append(face.embedding)
+            kept.append((tid, face))
+        qualities = _frame_qualities(img, [f for _, f in kept], det_size)
+        frame_faces[name] = [(tid, q) for (tid, _), q in zip(kept, qualities)]
+        count("faces_linked", len(matched))
+
+    count("faces_embedded", embedded)
+    track_embs = [np.mean(t["embs"], axis=0).astype(np.float32) for t in tracks]
+    feature_cache = {name: [track_embs[tid] for tid, _ in faces] for name, faces in frame_faces.items()}
+    quality_cache = {name: [q for _, q in faces] for name, faces in frame_faces.items()}
+    return feature_cache, quality_cache, size_cache, embedded
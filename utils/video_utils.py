@@ -12,13 +12,6 @@ def file_md5(path):
     with open(path, "rb") as f:
         return hashlib.md5(f.read()).hexdigest()
 
-def get_video_cache_dir(video_path, base_dir="output/frames"):
-    video_hash = file_md5(video_path)
-    folder_name = f"{os.path.basename(video_path)}_{video_hash}"
-    cache_dir = os.path.join(base_dir, "temp_frames", folder_name)
-    os.makedirs(cache_dir, exist_ok=True)
-    return cache_dir
-
 def cache_video_frames(video_path, cache_dir):
     if any(os.scandir(cache_dir)):
         return